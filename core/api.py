@@ -0,0 +1,190 @@
+"""Building blocks shared by the apps' REST APIs."""
+
+import typing as _t
+import base64
+import binascii
+import json
+from datetime import date
+from django.db.models import F, Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UserScopedMixin:
+    """Limits a viewset to the objects belonging to the requesting user,
+    as `PermModelAdmin` does for the admin. Superusers see everything.
+    """
+
+    # The field which holds the user.
+    user_id_field: str = "user_id"
+
+    def get_queryset(self) -> QuerySet:
+        """Get the queryset for the viewset.
+
+        :return: The queryset.
+        :rtype: QuerySet
+        """
+        qs = super().get_queryset()
+        if self.request.user.is_superuser:
+            return qs
+        return qs.filter(**{self.user_id_field: self.request.user.id})
+
+
+class SparseFieldsMixin:
+    """Lets the fields of a serializer be narrowed with a `fields`
+    argument.
+    """
+
+    def __init__(self, *args, fields: _t.Iterable[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """Renders a JSON array a chunk of objects at a time, for use with a
+    `StreamingHttpResponse`, so that no more than a chunk is ever held in
+    memory however large the response.
+    """
+
+    def render_chunks(
+        self,
+        chunks: _t.Iterable[_t.List[_t.Any]],
+    ) -> _t.Iterator[bytes]:
+        """Yields the JSON array of the objects in every chunk.
+
+        :param chunks: The chunks of serialized objects.
+        :type chunks: Iterable[List[Any]]
+        :return: An iterator over the rendered JSON.
+        :rtype: Iterator[bytes]
+        """
+        yield b"["
+        separator = b""
+        for chunk in chunks:
+            if not chunk:
+                continue
+            # Strips the brackets of the chunk's own array.
+            yield separator + self.render(chunk)[1:-1]
+            separator = b","
+        yield b"]"
+
+
+class KeysetPagination(BasePagination):
+    """Paginates by the values of the last object on the page rather than
+    by an offset, so that every page costs the same however deep it is and
+    objects added between requests are neither skipped nor repeated.
+
+    The view sets `ordering` to the fields to page by, descending. The last
+    field must be unique, e.g: `("date_ordered", "id")`. Nulls sort first,
+    as they do in a descending Postgres index. Only a link to the next page
+    is given.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 100
+    max_page_size = 500
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(
+        self,
+        queryset: QuerySet,
+        request: Request,
+        view: _t.Any = None,
+    ) -> _t.List[_t.Any]:
+        self.request = request
+        self.ordering = tuple(view.ordering)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(
+            *(F(field).desc(nulls_first=True) for field in self.ordering)
+        )
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+
+        page = list(queryset[: page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data: _t.Any) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request: Request) -> int:
+        """Returns the page size requested, capped at `max_page_size`."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self) -> _t.Optional[str]:
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = [self._get_value(last, field) for field in self.ordering]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(cursor),
+        )
+
+    @staticmethod
+    def _get_value(obj: _t.Any, field: str) -> _t.Any:
+        value = obj[field] if isinstance(obj, dict) else getattr(obj, field)
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def encode_cursor(cursor: _t.List[_t.Any]) -> str:
+        """Encodes the values of the last object on a page."""
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def decode_cursor(self, request: Request) -> _t.Optional[_t.List]:
+        """Decodes the cursor of a request, if any.
+
+        :raises NotFound: Where the cursor is invalid.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, list) or len(cursor) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def after(self, cursor: _t.List[_t.Any]) -> Q:
+        """Returns a filter for the objects after the cursor, i.e: those
+        where, for some field, every field before it is equal to the cursor
+        and the field itself sorts after the cursor.
+        """
+        after = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, cursor):
+            if value is None:
+                # Nulls sort before every value.
+                after |= equal & Q(**{f"{field}__isnull": False})
+                equal &= Q(**{f"{field}__isnull": True})
+            else:
+                after |= equal & Q(**{f"{field}__lt": value})
+                equal &= Q(**{field: value})
+        return after
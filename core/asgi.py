@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from core.streaming import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings.production")
 
-application = get_asgi_application()
+# As `get_asgi_application`, with a handler which serves the streaming
+# responses of async views, e.g: the parse progress of invoices, without
+# blocking the event loop.
+django.setup(set_prefix=False)
+application = ASGIHandler()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -150,3 +151,89 @@ else:
     MEDIA_URL = "/media/"
 
 DATE_FMT = "%d/%m/%Y"
+
+# Cache for text extracted from invoices. Set `PARSER_CACHE_DIR` to `None`,
+# or to "none" or an empty value in the environment, to disable the cache.
+# `PARSER_CACHE_ALIAS` optionally names a cache in `CACHES` to share
+# extractions between nodes.
+# The defaults match `parser.cache.DEFAULT_DIRECTORY` and `DEFAULT_MAX_SIZE`,
+# which are not imported so that loading the settings does not load the
+# parsers.
+PARSER_CACHE_DIR = os.getenv(
+    "PARSER_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "invoice_api_parser_cache"),
+)
+if PARSER_CACHE_DIR.strip().lower() in ("", "none"):
+    PARSER_CACHE_DIR = None
+PARSER_CACHE_MAX_SIZE = int(
+    os.getenv("PARSER_CACHE_MAX_SIZE", 64 * 1024 * 1024)
+)
+PARSER_CACHE_ALIAS = os.getenv("PARSER_CACHE_ALIAS")
+
+# Background parsing of uploaded invoices, see `manage.py parse_worker`.
+# Failed jobs are retried after `PARSE_JOB_RETRY_DELAY` seconds, doubling
+# with each attempt. A running job is reclaimed by another worker once it has
+# been running for `PARSE_JOB_LEASE` seconds.
+PARSE_JOB_MAX_ATTEMPTS = int(os.getenv("PARSE_JOB_MAX_ATTEMPTS", 3))
+PARSE_JOB_RETRY_DELAY = int(os.getenv("PARSE_JOB_RETRY_DELAY", 30))
+PARSE_JOB_LEASE = int(os.getenv("PARSE_JOB_LEASE", 600))
+
+# The number of products cached in each process to resolve the products named
+# on invoices, 0 disables the cache. Processes using the cache listen on the
+# `PRODUCT_CACHE_CHANNEL` Postgres channel to learn of changes made elsewhere.
+PRODUCT_CACHE_MAX_SIZE = int(os.getenv("PRODUCT_CACHE_MAX_SIZE", 10000))
+PRODUCT_CACHE_CHANNEL = "product_cache"
+
+# Uploading many invoices at once, see `invoices.bulk`. Files are parsed by
+# `BULK_UPLOAD_WORKERS` processes, defaulting to one per processor.
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 500))
+BULK_UPLOAD_MAX_FILE_SIZE = int(
+    os.getenv("BULK_UPLOAD_MAX_FILE_SIZE", 20 * 1024 * 1024)
+)
+BULK_UPLOAD_WORKERS = (
+    int(os.environ["BULK_UPLOAD_WORKERS"])
+    if os.getenv("BULK_UPLOAD_WORKERS")
+    else None
+)
+
+# The largest invoice which may be uploaded, and the largest file, e.g: a ZIP
+# archive, which may be uploaded to the bulk upload view.
+INVOICE_UPLOAD_MAX_SIZE = int(
+    os.getenv("INVOICE_UPLOAD_MAX_SIZE", 20 * 1024 * 1024)
+)
+BULK_UPLOAD_MAX_SIZE = int(
+    os.getenv("BULK_UPLOAD_MAX_SIZE", 500 * 1024 * 1024)
+)
+
+# Attachments read from storage which is not on the local disk, e.g: S3, are
+# held in memory up to this many bytes and spill over to a temporary file
+# beyond it.
+ATTACHMENT_SPOOL_MAX_MEMORY = int(
+    os.getenv("ATTACHMENT_SPOOL_MAX_MEMORY", 5 * 1024 * 1024)
+)
+
+# How long a client has to upload an invoice directly to object storage once
+# it has been handed a presigned POST, in seconds.
+DIRECT_UPLOAD_EXPIRY = int(os.getenv("DIRECT_UPLOAD_EXPIRY", 15 * 60))
+
+# Spend reports, see `invoices.reports`. Reports are cached in the
+# `REPORT_CACHE_ALIAS` cache until the user's invoices change, or for at most
+# `REPORT_CACHE_TIMEOUT` seconds.
+REPORT_CACHE_ALIAS = os.getenv("REPORT_CACHE_ALIAS", "default")
+REPORT_CACHE_TIMEOUT = int(os.getenv("REPORT_CACHE_TIMEOUT", 24 * 60 * 60))
+
+# Parsing uploads within the web process, from the async upload view. Up to
+# `ASYNC_PARSE_WORKERS` uploads are parsed at once in each process, in a pool
+# of as many processes, 0 leaves every upload to the `parse_worker` command.
+# An upload waits up to `ASYNC_PARSE_WAIT` seconds for its turn, after which
+# it is left to the `parse_worker` command too.
+ASYNC_PARSE_WORKERS = int(os.getenv("ASYNC_PARSE_WORKERS", 0))
+ASYNC_PARSE_WAIT = float(os.getenv("ASYNC_PARSE_WAIT", 5))
+
+# Streams of the progress of parsing invoices, see `invoices.progress`.
+# Processes learn of progress made elsewhere on the `PARSE_PROGRESS_CHANNEL`
+# Postgres channel. A stream is closed after `PARSE_PROGRESS_TIMEOUT` seconds
+# and sends a comment every `PARSE_PROGRESS_KEEPALIVE` seconds while idle.
+PARSE_PROGRESS_CHANNEL = "parse_progress"
+PARSE_PROGRESS_TIMEOUT = int(os.getenv("PARSE_PROGRESS_TIMEOUT", 5 * 60))
+PARSE_PROGRESS_KEEPALIVE = int(os.getenv("PARSE_PROGRESS_KEEPALIVE", 15))
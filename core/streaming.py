@@ -0,0 +1,96 @@
+"""Streaming responses whose content is produced asynchronously.
+
+Django 4.0 iterates a `StreamingHttpResponse` synchronously, on the event
+loop when served over ASGI, so a response which waits between chunks, e.g:
+a stream of server-sent events, would block every other request of the
+process. `AsyncStreamingHttpResponse` carries an async iterator instead,
+which `ASGIHandler` awaits. Served over WSGI, or by the test client, the
+iterator is driven by an event loop of the response's own in the serving
+thread.
+"""
+
+import typing as _t
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+from django.http import StreamingHttpResponse
+
+
+def _iterate(content: _t.AsyncIterator[_t.Any]) -> _t.Iterator[_t.Any]:
+    """Iterates an async iterator from synchronous code."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(content.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        if hasattr(content, "aclose"):
+            loop.run_until_complete(content.aclose())
+        loop.close()
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """A streaming response whose content is an async iterator."""
+
+    is_async = True
+
+    def __init__(self, content: _t.AsyncIterator[_t.Any], *args, **kwargs):
+        """Initialises a new instance of the AsyncStreamingHttpResponse
+        class.
+
+        :param content: An async iterator over the chunks of the response.
+        :type content: AsyncIterator[Any]
+        """
+        self.async_content = content
+        super().__init__(_iterate(content), *args, **kwargs)
+
+    async def __aiter__(self) -> _t.AsyncIterator[bytes]:
+        try:
+            async for part in self.async_content:
+                yield self.make_bytes(part)
+        finally:
+            if hasattr(self.async_content, "aclose"):
+                await self.async_content.aclose()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """Serves `AsyncStreamingHttpResponse` without blocking the event
+    loop.
+    """
+
+    async def send_response(self, response, send):
+        if not getattr(response, "is_async", False):
+            return await super().send_response(response, send)
+
+        headers = [
+            (header.encode("ascii"), value.encode("latin1"))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b"Set-Cookie", c.output(header="").encode("ascii").strip())
+            for c in response.cookies.values()
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        content = response.__aiter__()
+        try:
+            async for part in content:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": part,
+                        "more_body": True,
+                    }
+                )
+            await send({"type": "http.response.body"})
+        finally:
+            # Stops the content where the client has gone away.
+            await content.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,58 @@
+"""Unittests for the `streaming` module."""
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+from core import streaming
+
+
+async def chunks():
+    """Yields a couple of chunks."""
+    yield "a"
+    yield b"b"
+
+
+class TestAsyncStreamingHttpResponse(SimpleTestCase):
+    """Unittests for the `AsyncStreamingHttpResponse` class."""
+
+    def test_sync_iteration(self):
+        """Test that the content may be iterated synchronously."""
+        response = streaming.AsyncStreamingHttpResponse(chunks())
+        self.assertEqual(b"".join(response), b"ab")
+
+    def test_async_iteration(self):
+        """Test that the content may be iterated asynchronously."""
+
+        async def read():
+            response = streaming.AsyncStreamingHttpResponse(chunks())
+            return [part async for part in response]
+
+        self.assertEqual(async_to_sync(read)(), [b"a", b"b"])
+
+
+class TestASGIHandler(SimpleTestCase):
+    """Unittests for the `ASGIHandler` class."""
+
+    def test_send_response(self):
+        """Test that an async streaming response is sent a chunk at a time,
+        then closed.
+        """
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        response = streaming.AsyncStreamingHttpResponse(
+            chunks(),
+            content_type="text/event-stream",
+        )
+        async_to_sync(streaming.ASGIHandler().send_response)(response, send)
+        self.assertEqual(messages[0]["type"], "http.response.start")
+        self.assertIn(
+            (b"Content-Type", b"text/event-stream"),
+            messages[0]["headers"],
+        )
+        self.assertEqual(
+            [message.get("body") for message in messages[1:]],
+            [b"a", b"b", None],
+        )
+        self.assertTrue(response.closed)
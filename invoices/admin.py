@@ -23,6 +23,7 @@ class InvoiceAdmin(PermModelAdmin):
         "total",
         "attachment",
         "completed",
+        "parse_status",
     ]
     search_fields = [
         "id",
@@ -33,7 +34,26 @@ class InvoiceAdmin(PermModelAdmin):
         "date_ordered",
         "date_added",
         "supplier",
+        "parse_status",
     ]
     ordering = ["-date_ordered"]
     date_hierarchy = "date_ordered"
     inlines = [InvoiceItemInline]
+
+
+@admin.register(invoice_models.ParseJob)
+class ParseJobAdmin(PermModelAdmin):
+    user_id_field = "invoice__user_id"
+    list_display = [
+        "id",
+        "invoice",
+        "status",
+        "attempts",
+        "max_attempts",
+        "run_after",
+        "locked_by",
+        "locked_at",
+    ]
+    list_filter = ["status"]
+    search_fields = ["id", "invoice__id", "locked_by"]
+    readonly_fields = ["date_added", "date_updated"]
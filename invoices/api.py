@@ -0,0 +1,166 @@
+"""Read-only REST API for a user's invoices and their items."""
+
+import typing as _t
+from datetime import date
+from itertools import islice
+from django.db.models import F, QuerySet, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.api import KeysetPagination, StreamingJSONRenderer, UserScopedMixin
+from . import models as invoice_models, reports, serializers
+
+# The number of invoices read from the database and rendered at a time by
+# the export.
+EXPORT_CHUNK_SIZE = 2000
+
+
+class InvoiceViewSet(UserScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """Lists the user's invoices, most recently ordered first.
+
+    The fields returned may be narrowed with `?fields=id,total,...`, which
+    narrows the columns selected too. Items are only included with
+    `?include=items`.
+    """
+
+    queryset = invoice_models.Invoice.objects.all()
+    serializer_class = serializers.InvoiceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ("date_ordered", "id")
+    # The relations used to serialize each field, where it is not a column
+    # of the invoice.
+    field_relations = {
+        "supplier_name": ["supplier", "supplier__name"],
+        "items": [],
+    }
+    items_prefetch = ("items__product", "items__category")
+
+    def requested_fields(self) -> _t.List[str]:
+        """Returns the fields requested with `?fields=`, defaulting to every
+        field, along with the items where requested with `?include=items`.
+
+        :raises ValidationError: Where an unknown field is requested.
+        :return: The names of the fields.
+        :rtype: List[str]
+        """
+        available = [
+            field
+            for field in self.serializer_class.Meta.fields
+            if field != "items"
+        ]
+        requested = self.request.query_params.get("fields")
+        if requested:
+            fields = [f.strip() for f in requested.split(",") if f.strip()]
+            unknown = ", ".join(sorted(set(fields) - set(available)))
+            if unknown:
+                raise ValidationError(
+                    {"fields": f"Unknown fields: {unknown}."}
+                )
+        else:
+            fields = available
+
+        if "items" in self.request.query_params.get("include", "").split(","):
+            fields.append("items")
+        return fields
+
+    def get_queryset(self) -> QuerySet:
+        fields = self.requested_fields()
+        columns = {"id", *self.ordering}
+        for field in fields:
+            columns.update(self.field_relations.get(field, [field]))
+
+        qs = super().get_queryset().only(*columns)
+        if "supplier_name" in fields:
+            qs = qs.select_related("supplier")
+        if "items" in fields:
+            qs = qs.prefetch_related(*self.items_prefetch)
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=False)
+    def export(self, request: Request) -> StreamingHttpResponse:
+        """Streams every invoice as a single JSON array, in the same order
+        and with the same fields as the list. Invoices are read with a
+        server-side cursor where the database supports one, and their items
+        are fetched a chunk at a time, so memory use does not grow with the
+        number of invoices.
+        """
+        fields = self.requested_fields()
+        queryset = (
+            self.get_queryset()
+            .prefetch_related(None)
+            .order_by(
+                *(F(field).desc(nulls_first=True) for field in self.ordering)
+            )
+        )
+        invoices = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+        def chunks() -> _t.Iterator[_t.List[dict]]:
+            while True:
+                chunk = list(islice(invoices, EXPORT_CHUNK_SIZE))
+                if not chunk:
+                    return
+                if "items" in fields:
+                    prefetch_related_objects(chunk, *self.items_prefetch)
+                yield self.get_serializer(chunk, many=True).data
+
+        return StreamingHttpResponse(
+            StreamingJSONRenderer().render_chunks(chunks()),
+            content_type="application/json",
+        )
+
+
+class InvoiceItemViewSet(UserScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """Lists the items on the user's invoices, optionally filtered to a
+    single invoice with `?invoice=<id>`.
+    """
+
+    queryset = invoice_models.InvoiceItem.objects.select_related(
+        "product", "category"
+    )
+    serializer_class = serializers.InvoiceItemSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ("id",)
+    user_id_field = "invoice__user_id"
+
+    def get_queryset(self) -> QuerySet:
+        qs = super().get_queryset()
+        invoice_id = self.request.query_params.get("invoice")
+        if invoice_id is not None and invoice_id.isdigit():
+            qs = qs.filter(invoice_id=invoice_id)
+        return qs
+
+
+class SpendReportView(APIView):
+    """Reports the user's spend by supplier, category and month, optionally
+    limited to the invoices ordered between `?from=` and `?to=`. Reports
+    are cached until the user's invoices change.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request: Request) -> Response:
+        dates = {}
+        for name, param in (("date_from", "from"), ("date_to", "to")):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                dates[name] = date.fromisoformat(value)
+            except ValueError:
+                raise ValidationError(
+                    {param: "Dates must be in the form YYYY-MM-DD."}
+                )
+        report = reports.cached_spend(request.user, **dates)
+        return Response(
+            {"results": serializers.SpendSerializer(report, many=True).data}
+        )
@@ -0,0 +1,173 @@
+"""Parses uploaded invoices within the web process, from async views.
+
+An async view can hold many uploads in flight at once, but parsing is bound
+by the CPU, so it is carried out in a pool of processes and no more than
+`ASYNC_PARSE_WORKERS` invoices are parsed at once in each web process,
+however many event loops it runs, e.g: one per request under WSGI. The rest
+wait for their turn without holding a thread, and those which wait for
+longer than `ASYNC_PARSE_WAIT` seconds are left queued for the `parse_worker`
+command.
+
+The upload's `ParseJob` is claimed before it is parsed, as `parse_worker`
+would claim it, so an invoice is never parsed twice and a job left behind by
+a web process which dies is picked up by `parse_worker` once its lease
+expires. Where a process of the pool dies, the pool is replaced and the job
+is put back in the queue.
+"""
+
+import typing as _t
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from parser import parse_for_supplier
+from parser.parse_for_supplier import ParseResult
+from . import attachments, jobs, progress
+from .models import Invoice, ParseJob
+
+# How often an upload waiting for its turn checks for a free one, in
+# seconds.
+TURN_POLL_INTERVAL = 0.05
+
+_executor: _t.Optional[futures.Executor] = None
+_turns: _t.Optional[threading.BoundedSemaphore] = None
+_turns_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    """Whether uploads are parsed within the web process."""
+    return settings.ASYNC_PARSE_WORKERS > 0
+
+
+def executor() -> futures.Executor:
+    """Returns the pool of processes invoices are parsed in, starting it the
+    first time it is needed. The processes are spawned rather than forked,
+    as forking copies the locks and connections of the web process' threads,
+    and set up Django so that the parsers read the same settings.
+    """
+    global _executor
+    if _executor is None:
+        _executor = futures.ProcessPoolExecutor(
+            max_workers=settings.ASYNC_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def _discard_executor(pool: futures.Executor):
+    """Discards a broken pool of processes, so that the next parse starts
+    another, unless it has already been replaced.
+    """
+    global _executor
+    if _executor is pool:
+        _executor = None
+    pool.shutdown(wait=False)
+
+
+def _semaphore() -> threading.BoundedSemaphore:
+    """Returns the semaphore limiting the parses of this process, which is
+    shared by every thread and event loop.
+    """
+    global _turns
+    with _turns_lock:
+        if _turns is None:
+            _turns = threading.BoundedSemaphore(settings.ASYNC_PARSE_WORKERS)
+        return _turns
+
+
+async def _acquire(semaphore: threading.BoundedSemaphore) -> bool:
+    """Waits up to `ASYNC_PARSE_WAIT` seconds for a turn, returning whether
+    one was taken. The semaphore is polled rather than waited on in a
+    thread, so a waiting upload holds no thread and a cancelled wait never
+    takes a turn.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.ASYNC_PARSE_WAIT
+    while not semaphore.acquire(blocking=False):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(remaining, TURN_POLL_INTERVAL))
+    return True
+
+
+def _worker() -> str:
+    """Identifies this process as the worker which claims jobs."""
+    return f"web-{os.uname().nodename}-{os.getpid()}"
+
+
+def _claim(job: ParseJob) -> _t.Optional[ParseJob]:
+    """Claims and starts a job, returning the claimed job, or `None` where
+    it has already been claimed.
+    """
+    claimed = ParseJob.claim(_worker(), job_ids=[job.pk])
+    if not claimed:
+        return None
+    jobs.start_job(claimed[0])
+    return claimed[0]
+
+
+async def _parse(invoice: Invoice, pool: futures.Executor) -> ParseResult:
+    """Parses an invoice's attachment in the pool of processes."""
+    with tempfile.TemporaryDirectory(prefix="parse_") as directory:
+        path = await sync_to_async(attachments.local_path)(
+            invoice.attachment,
+            directory,
+        )
+        result = await asyncio.get_running_loop().run_in_executor(
+            pool,
+            parse_for_supplier.parse_to_result,
+            path,
+            invoice.supplier.name,
+        )
+    if result.ok:
+        # The parser's own progress is not reported from the pool.
+        await sync_to_async(progress.publish)(invoice.pk, progress.PARSED)
+    return result
+
+
+async def parse(job: ParseJob) -> _t.Optional[ParseJob]:
+    """Parses the invoice of a queued job, once there is a free turn, and
+    saves the result.
+
+    :param job: The job.
+    :type job: ParseJob
+    :return: The job once carried out, with its invoice, or `None` where it
+        was left queued because parsing within the web process is disabled,
+        no turn became free in time, it had already been claimed or the
+        pool of processes broke.
+    :rtype: Optional[ParseJob]
+    """
+    if not enabled():
+        return None
+    semaphore = _semaphore()
+    if not await _acquire(semaphore):
+        return None
+
+    try:
+        claimed = await sync_to_async(_claim)(job)
+        if claimed is None:
+            return None
+        invoice = claimed.invoice
+        pool = executor()
+        try:
+            result = await _parse(invoice, pool)
+        except BrokenProcessPool:
+            # A process died, which says nothing of the invoice.
+            _discard_executor(pool)
+            await sync_to_async(jobs.release_job)(claimed)
+            return None
+        except Exception as e:
+            # The attachment could not be read or the process died.
+            result = ParseResult(None, invoice.supplier.name, error=e)
+        await sync_to_async(jobs.finish_job)(claimed, result)
+        return claimed
+    finally:
+        semaphore.release()
@@ -0,0 +1,122 @@
+"""Reads the attachments of invoices from whichever storage is configured.
+
+Where the storage keeps files on the local disk, the parser reads the file
+where it is. Otherwise, e.g: with `USE_S3`, the attachment is streamed from
+storage into memory, spilling over to a temporary file only once it is larger
+than `ATTACHMENT_SPOOL_MAX_MEMORY` bytes, so that no more than that is ever
+held in memory and the file is only downloaded once.
+"""
+
+import typing as _t
+import contextlib
+import io
+import os
+import tempfile
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from parser.pdf import Source
+
+CHUNK_SIZE = 64 * 1024
+
+
+def spool(
+    chunks: _t.Iterable[bytes],
+    max_memory: int,
+) -> _t.BinaryIO:
+    """Writes chunks to a file object, held in memory unless there are more
+    than `max_memory` bytes, in which case they are written to a temporary
+    file instead. Unlike `tempfile.SpooledTemporaryFile`, the file object is
+    always a standard buffered binary file which PDF libraries accept.
+
+    :param chunks: The contents of the file.
+    :type chunks: Iterable[bytes]
+    :param max_memory: The most bytes to hold in memory.
+    :type max_memory: int
+    :return: The file object, rewound to the start.
+    :rtype: BinaryIO
+    """
+    f = io.BytesIO()
+    for chunk in chunks:
+        if isinstance(f, io.BytesIO) and f.tell() + len(chunk) > max_memory:
+            buffer = f
+            f = tempfile.TemporaryFile()
+            f.write(buffer.getbuffer())
+            buffer.close()
+        f.write(chunk)
+    f.seek(0)
+    return f
+
+
+def iter_chunks(attachment: FieldFile) -> _t.Iterator[bytes]:
+    """Yields the contents of an attachment a chunk at a time.
+
+    :param attachment: The attachment.
+    :type attachment: FieldFile
+    :return: An iterator over the chunks.
+    :rtype: Iterator[bytes]
+    """
+    storage = attachment.storage
+    if getattr(storage, "bucket", None) is not None:
+        # django-storages' S3 files download the whole object before the
+        # first read, so the object's body is streamed instead.
+        body = storage.bucket.Object(
+            storage._normalize_name(attachment.name)
+        ).get()["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+        return
+
+    with storage.open(attachment.name, "rb") as f:
+        yield from f.chunks(CHUNK_SIZE)
+
+
+@contextlib.contextmanager
+def open_attachment(attachment: FieldFile) -> _t.Iterator[Source]:
+    """Opens an attachment to be parsed.
+
+    :param attachment: The attachment.
+    :type attachment: FieldFile
+    :return: A context manager yielding either the path to the attachment or
+        a file object of it, either of which `parse_for_supplier.parse`
+        accepts.
+    :rtype: Iterator[Source]
+    """
+    try:
+        path = attachment.storage.path(attachment.name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    with spool(
+        iter_chunks(attachment),
+        settings.ATTACHMENT_SPOOL_MAX_MEMORY,
+    ) as f:
+        yield f
+
+
+def local_path(attachment: FieldFile, directory: str) -> str:
+    """Returns a path to an attachment on the local disk, e.g: for parsing
+    in another process. Where the storage is not local, the attachment is
+    copied to a new file in `directory`.
+
+    :param attachment: The attachment.
+    :type attachment: FieldFile
+    :param directory: The directory to copy the attachment to.
+    :type directory: str
+    :return: The path.
+    :rtype: str
+    """
+    try:
+        return attachment.storage.path(attachment.name)
+    except NotImplementedError:
+        pass
+
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for chunk in iter_chunks(attachment):
+            f.write(chunk)
+    return path
@@ -0,0 +1,272 @@
+"""Uploads many invoices at once, from ZIP archives or several PDFs.
+
+Each file is written to a temporary directory, the files are parsed in
+parallel by `parse_for_supplier.parse_many` and each is then saved through
+`ingest.ingest`. Files which the user has already uploaded, or which are
+copies of another file in the same upload, are not parsed again. The outcome
+for every file is reported in a manifest.
+"""
+
+import typing as _t
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import zipfile
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from parser import parse_for_supplier
+from suppliers.models import Supplier, UserSupplier
+from . import ingest, uploadhandlers
+from .models import Invoice
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class BulkUploadError(Exception):
+    """Raised where a file in a bulk upload cannot be accepted."""
+
+
+class ExtractedFile(_t.NamedTuple):
+    """A file from a bulk upload."""
+
+    # The name of the file, prefixed with the name of its archive.
+    name: str
+    # Where the file was written to, unless it was rejected.
+    path: _t.Optional[str] = None
+    # The SHA-256 hex digest of the file's contents.
+    content_hash: _t.Optional[str] = None
+    # Why the file was rejected.
+    error: _t.Optional[str] = None
+
+
+def _copy(source: _t.BinaryIO, destination: str, max_size: int) -> str:
+    """Copies a file object to a path in chunks, returning the SHA-256 hex
+    digest of its contents. Raises `BulkUploadError` where it is larger than
+    `max_size` bytes.
+    """
+    size = 0
+    digest = hashlib.sha256()
+    with open(destination, "wb") as f:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > max_size:
+                raise BulkUploadError(
+                    f"The file is larger than {max_size} bytes."
+                )
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def extract_uploads(
+    files: _t.Iterable[UploadedFile],
+    directory: str,
+) -> _t.Iterator[ExtractedFile]:
+    """Writes each PDF uploaded, including those within ZIP archives, to a
+    directory. Archives are read member by member from the uploaded file,
+    so they are never held in memory. PDFs uploaded through
+    `InvoiceUploadHandler` are already on disk, so are used where they are.
+
+    :param files: The uploaded files.
+    :type files: Iterable[UploadedFile]
+    :param directory: The directory to write the files to.
+    :type directory: str
+    :raises BulkUploadError: Where more than `BULK_UPLOAD_MAX_FILES` files
+        are uploaded.
+    :return: An iterator over the files.
+    :rtype: Iterator[ExtractedFile]
+    """
+    max_files = settings.BULK_UPLOAD_MAX_FILES
+    max_size = settings.BULK_UPLOAD_MAX_FILE_SIZE
+    count = 0
+
+    def count_file():
+        nonlocal count
+        count += 1
+        if count > max_files:
+            raise BulkUploadError(
+                f"No more than {max_files} files may be uploaded at once."
+            )
+
+    def write(name: str, source: _t.BinaryIO):
+        count_file()
+        # The name is only used for reporting, never as part of the path.
+        path = os.path.join(directory, f"{count}.pdf")
+        try:
+            digest = _copy(source, path, max_size)
+        except BulkUploadError as e:
+            return ExtractedFile(name, error=str(e))
+        return ExtractedFile(name, path, digest)
+
+    for uploaded_file in files:
+        upload_error = getattr(uploaded_file, "upload_error", None)
+        sniffed_type = getattr(uploaded_file, "sniffed_type", None)
+        if upload_error:
+            yield ExtractedFile(uploaded_file.name, error=upload_error)
+            continue
+        if sniffed_type == uploadhandlers.PDF:
+            # Already written to disk and hashed by the upload handler.
+            count_file()
+            if uploaded_file.size > max_size:
+                yield ExtractedFile(
+                    uploaded_file.name,
+                    error=f"The file is larger than {max_size} bytes.",
+                )
+            else:
+                yield ExtractedFile(
+                    uploaded_file.name,
+                    uploaded_file.temporary_file_path(),
+                    uploaded_file.content_hash,
+                )
+            continue
+
+        if sniffed_type != uploadhandlers.ZIP and not zipfile.is_zipfile(
+            uploaded_file
+        ):
+            uploaded_file.seek(0)
+            if uploaded_file.name.lower().endswith(".pdf"):
+                yield write(uploaded_file.name, uploaded_file)
+            else:
+                yield ExtractedFile(
+                    uploaded_file.name,
+                    error="Not a PDF or ZIP archive.",
+                )
+            continue
+
+        uploaded_file.seek(0)
+        with zipfile.ZipFile(uploaded_file) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or os.path.basename(
+                    member.filename
+                ).startswith("."):
+                    continue
+                name = f"{uploaded_file.name}/{member.filename}"
+                if not member.filename.lower().endswith(".pdf"):
+                    yield ExtractedFile(name, error="Not a PDF.")
+                elif member.file_size > max_size:
+                    yield ExtractedFile(
+                        name,
+                        error=f"The file is larger than {max_size} bytes.",
+                    )
+                else:
+                    with archive.open(member) as source:
+                        yield write(name, source)
+
+
+def bulk_upload(
+    user: User,
+    files: _t.Iterable[UploadedFile],
+    supplier: _t.Optional[Supplier] = None,
+    max_workers: _t.Optional[int] = None,
+) -> _t.List[_t.Dict[str, _t.Any]]:
+    """Parses and saves many invoices at once.
+
+    :param user: The user uploading the invoices.
+    :type user: User
+    :param files: The uploaded PDFs and ZIP archives of PDFs.
+    :type files: Iterable[UploadedFile]
+    :param supplier: The supplier of every invoice. Where not given, the
+        supplier of each invoice is detected.
+    :type supplier: Supplier, optional
+    :param max_workers: The number of processes to parse the invoices with,
+        defaults to `BULK_UPLOAD_WORKERS`.
+    :type max_workers: int, optional
+    :raises BulkUploadError: Where more than `BULK_UPLOAD_MAX_FILES` files
+        are uploaded.
+    :return: A manifest of the outcome for each file, in upload order.
+    :rtype: List[Dict[str, Any]]
+    """
+    suppliers = {s.name: s for s in UserSupplier.choices(user)}
+    supplier_name = supplier.name if supplier else None
+
+    with tempfile.TemporaryDirectory(prefix="bulk_upload_") as directory:
+        extracted = list(extract_uploads(files, directory))
+        # Maps the hash of each file the user has already uploaded to the
+        # invoice it was uploaded as.
+        uploaded = dict(
+            Invoice.objects.filter(
+                user=user,
+                content_hash__in={
+                    file.content_hash for file in extracted if file.path
+                },
+            ).values_list("content_hash", "id")
+        )
+
+        manifest = []
+        # Maps the path of each file to parse to its entry in the manifest.
+        entries = {}
+        # Maps the path of each file to parse to its hash.
+        hashes = {}
+        # Maps the hash of each file to parse to the entries of any copies.
+        copies = {}
+        for file in extracted:
+            entry = {
+                "filename": file.name,
+                "status": "rejected",
+                "invoice_id": None,
+                "error": file.error,
+            }
+            manifest.append(entry)
+            if file.path is None:
+                continue
+            if file.content_hash in uploaded:
+                entry.update(
+                    status="duplicate",
+                    invoice_id=uploaded[file.content_hash],
+                )
+            elif file.content_hash in copies:
+                copies[file.content_hash].append(entry)
+            else:
+                entries[file.path] = entry
+                hashes[file.path] = file.content_hash
+                copies[file.content_hash] = []
+
+        results = parse_for_supplier.parse_many(
+            [(path, supplier_name) for path in entries],
+            max_workers=max_workers or settings.BULK_UPLOAD_WORKERS,
+            # The web process runs threads, which should not be forked, so
+            # the processes are spawned and set up Django as `async_parse`'s.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        )
+        for result in results:
+            entry = entries[result.filepath]
+            if result.supplier is None:
+                entry["error"] = str(result.error)
+                continue
+            if result.supplier not in suppliers:
+                entry["error"] = f"{result.supplier} is not your supplier."
+                continue
+            with open(result.filepath, "rb") as f:
+                invoice = Invoice(
+                    user=user,
+                    supplier=suppliers[result.supplier],
+                    attachment=File(f, os.path.basename(entry["filename"])),
+                    content_hash=hashes[result.filepath],
+                )
+                try:
+                    ingest.ingest(invoice, result)
+                except ingest.DuplicateInvoice as e:
+                    invoice = e.invoice
+                    entry["status"] = "duplicate"
+                else:
+                    entry["status"] = invoice.parse_status
+            entry.update(
+                invoice_id=invoice.id,
+                error=None if result.ok else str(result.error),
+            )
+
+        # Copies of a file within the upload share its outcome.
+        for path, entry in entries.items():
+            for copy in copies[hashes[path]]:
+                if entry["invoice_id"] is None:
+                    copy["error"] = entry["error"]
+                else:
+                    copy.update(
+                        status="duplicate", invoice_id=entry["invoice_id"]
+                    )
+    return manifest
@@ -0,0 +1,164 @@
+"""Lets clients upload invoices directly to object storage.
+
+Rather than proxying every byte through a web worker, the client asks for a
+presigned POST, uploads the attachment straight to the bucket and then
+confirms the upload, at which point the invoice is created and queued to be
+parsed by the `parse_worker` command. Only available where the configured
+storage is S3, or compatible with it.
+
+Attachments uploaded directly have no `content_hash` as they are never read
+by the web worker, so they are not checked for duplicates.
+"""
+
+import typing as _t
+import posixpath
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from suppliers.models import Supplier
+from . import ingest, uploadhandlers
+from .models import DirectUpload, Invoice, ParseJob, invoice_upload_path
+
+CONTENT_TYPE = "application/pdf"
+
+
+class DirectUploadError(Exception):
+    """Raised where a direct upload cannot be accepted."""
+
+
+def storage():
+    """Returns the storage attachments are saved to."""
+    return Invoice._meta.get_field("attachment").storage
+
+
+def available() -> bool:
+    """Whether the storage supports direct uploads."""
+    return getattr(storage(), "bucket", None) is not None
+
+
+def upload_name(supplier: Supplier, filename: str) -> str:
+    """Returns a name to upload an attachment under, in the same form as
+    `invoice_upload_path` but made unique as it cannot be changed once the
+    client has uploaded to it.
+
+    :param supplier: The supplier of the invoice.
+    :type supplier: Supplier
+    :param filename: The name of the file being uploaded.
+    :type filename: str
+    :return: The name.
+    :rtype: str
+    """
+    path = invoice_upload_path(
+        Invoice(supplier=supplier, date_added=timezone.now()),
+        filename,
+    )
+    directory, name = posixpath.split(path)
+    return posixpath.join(directory, f"{uuid.uuid4().hex}-{name}")
+
+
+def create(
+    user: User,
+    supplier: Supplier,
+    filename: str,
+) -> _t.Tuple[DirectUpload, _t.Dict[str, _t.Any]]:
+    """Permits a user to upload an attachment directly to storage.
+
+    :param user: The user uploading the invoice.
+    :type user: User
+    :param supplier: The supplier of the invoice.
+    :type supplier: Supplier
+    :param filename: The name of the file being uploaded.
+    :type filename: str
+    :raises DirectUploadError: Where the storage does not support direct
+        uploads.
+    :return: The upload and the presigned POST, a mapping of the `url` to
+        post to and the form `fields` to post along with the file.
+    :rtype: Tuple[DirectUpload, Dict[str, Any]]
+    """
+    if not available():
+        raise DirectUploadError("Direct uploads are not available.")
+
+    expiry = settings.DIRECT_UPLOAD_EXPIRY
+    upload = DirectUpload.objects.create(
+        user=user,
+        supplier=supplier,
+        name=upload_name(supplier, filename),
+        expires_at=timezone.now() + timedelta(seconds=expiry),
+    )
+
+    s3_storage = storage()
+    fields = {"Content-Type": CONTENT_TYPE}
+    conditions = [
+        {"Content-Type": CONTENT_TYPE},
+        ["content-length-range", 1, settings.INVOICE_UPLOAD_MAX_SIZE],
+    ]
+    if s3_storage.default_acl:
+        fields["acl"] = s3_storage.default_acl
+        conditions.append({"acl": s3_storage.default_acl})
+    presigned_post = s3_storage.bucket.meta.client.generate_presigned_post(
+        s3_storage.bucket.name,
+        s3_storage._normalize_name(upload.name),
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=expiry,
+    )
+    return upload, presigned_post
+
+
+def _read_head(name: str) -> bytes:
+    """Returns the leading bytes of a file in storage, used to sniff its
+    type, without downloading the rest of it.
+    """
+    s3_storage = storage()
+    body = s3_storage.bucket.Object(s3_storage._normalize_name(name)).get(
+        Range=f"bytes=0-{uploadhandlers.SNIFF_SIZE - 1}"
+    )["Body"]
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+def confirm(
+    upload: DirectUpload,
+) -> _t.Tuple[Invoice, _t.Optional[ParseJob]]:
+    """Creates an invoice from an attachment the client has uploaded and
+    queues it to be parsed. Confirming an upload more than once returns the
+    same invoice.
+
+    :param upload: The upload.
+    :type upload: DirectUpload
+    :raises DirectUploadError: Where the attachment has not been uploaded,
+        or is not a PDF, in which case it is deleted.
+    :return: The invoice and the job to parse it, or no job where the upload
+        had already been confirmed.
+    :rtype: Tuple[Invoice, Optional[ParseJob]]
+    """
+    s3_storage = storage()
+    with transaction.atomic():
+        upload = DirectUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.invoice_id is not None:
+            return upload.invoice, None
+
+        if not s3_storage.exists(upload.name):
+            if upload.expired:
+                raise DirectUploadError("The upload has expired.")
+            raise DirectUploadError("The file has not been uploaded.")
+        if uploadhandlers.sniff(_read_head(upload.name)) != (
+            uploadhandlers.PDF
+        ):
+            s3_storage.delete(upload.name)
+            raise DirectUploadError("The file is not a PDF.")
+
+        invoice = Invoice(
+            user=upload.user,
+            supplier=upload.supplier,
+            attachment=upload.name,
+        )
+        job = ingest.ingest(invoice)
+        upload.invoice = invoice
+        upload.save(update_fields=["invoice"])
+    return invoice, job
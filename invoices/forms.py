@@ -2,9 +2,7 @@ from django import forms
 from django.db.models import QuerySet
 from django.contrib.auth.models import User
 from suppliers import models as supplier_models
-from parser import parse_for_supplier
-from parser.parse_for_supplier import BaseSupplierParser
-from . import models as invoice_models
+from . import ingest, models as invoice_models
 
 
 class InvoiceUploadForm(forms.ModelForm):
@@ -28,45 +26,85 @@ class InvoiceUploadForm(forms.ModelForm):
             "supplier"
         ].queryset = supplier_models.UserSupplier.choices(self.user)
 
+    def clean_attachment(self):
+        """Rejects attachments which the upload handler rejected."""
+        attachment = self.cleaned_data.get("attachment")
+        error = getattr(attachment, "upload_error", None)
+        if error:
+            raise forms.ValidationError(error)
+        return attachment
+
     def clean_user(self) -> User:
         """Overrides the default `clean_user` method to return the user
         associated with the form.
         """
         return self.user
 
-    def save(self, *args, **kwargs):
-        """Save the invoice and attempt to parse it."""
+    def save(self, commit: bool = True) -> invoice_models.Invoice:
+        """Save the invoice and queue it to be parsed by the `parse_worker`
+        command. The job is available as `parse_job` afterwards.
+
+        Where the user has already uploaded the same file, the existing
+        invoice is returned instead, `duplicate` is set and there is no job.
+        """
         # Need to attach user to the invoice before saving.
-        invoice = super().save(*args, **kwargs)
-        parsed_data = self.parse_data(invoice)
-        if parsed_data is None:
-            return invoice
+        invoice = super().save(commit=False)
+        attachment = self.cleaned_data.get("attachment")
+        if attachment:
+            invoice.content_hash = ingest.content_hash(attachment)
+        self.parse_job = None
+        self.duplicate = False
+        if commit:
+            try:
+                self.parse_job = ingest.ingest(invoice)
+            except ingest.DuplicateInvoice as e:
+                self.duplicate = True
+                return e.invoice
+        return invoice
 
-        invoice.save()
-        invoice.update_parsed_data(parsed_data)
-        invoice.add_from_items_breakdown(parsed_data.items_breakdown)
 
-        return invoice
+class InvoiceBulkUploadForm(forms.Form):
+    """Form captures many invoices at once, as PDFs or ZIP archives of PDFs."""
 
-    @staticmethod
-    def parse_data(invoice: invoice_models.Invoice) -> BaseSupplierParser:
-        """Parse the invoice data and return the processed object.
+    supplier = forms.ModelChoiceField(
+        supplier_models.Supplier.objects.none(),
+        required=False,
+        help_text="Leave blank to detect the supplier of each invoice.",
+    )
+    files = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={"multiple": True}),
+        help_text="PDFs or ZIP archives of PDFs.",
+    )
 
-        :param invoice: The invoice to parse
-        :type invoice: invoice_models.Invoice
-        :return: A supplier parser object
-        :rtype: BaseSupplierParser
-        """
-        try:
-            parsed_data = parse_for_supplier.parse(
-                invoice.attachment.file.name,
-                invoice.supplier.name,
-            )
-            parsed_data.process_invoice()
-            return parsed_data
-        except Exception as e:
-            print("\033[91mErrors:\n" + str(e) + "\033[0m")
-            return None
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user")
+        super().__init__(*args, **kwargs)
+        self.fields[
+            "supplier"
+        ].queryset = supplier_models.UserSupplier.choices(self.user)
+
+
+class DirectUploadForm(forms.Form):
+    """Form captures an invoice which is to be uploaded directly to object
+    storage.
+    """
+
+    supplier = forms.ModelChoiceField(supplier_models.Supplier.objects.none())
+    filename = forms.CharField(max_length=128)
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user")
+        super().__init__(*args, **kwargs)
+        self.fields[
+            "supplier"
+        ].queryset = supplier_models.UserSupplier.choices(self.user)
+
+    def clean_filename(self) -> str:
+        """Only PDFs may be uploaded."""
+        filename = self.cleaned_data["filename"]
+        if not filename.lower().endswith(".pdf"):
+            raise forms.ValidationError("The file must be a PDF.")
+        return filename
 
 
 class InvoiceForm(forms.ModelForm):
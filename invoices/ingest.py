@@ -0,0 +1,160 @@
+"""Writes invoices and the data parsed from their attachments.
+
+Every path which saves a new invoice or the result of parsing one goes
+through here, so that each is written in a single transaction using a fixed
+number of queries however many items the invoice has.
+"""
+
+import typing as _t
+import hashlib
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from parser.parse_for_supplier import ParseResult
+from . import progress
+from .models import Invoice, ParseJob, ParseStatus
+
+# The fields of an invoice set from a `ParseResult`.
+PARSED_FIELDS = (
+    "date_ordered",
+    "order_number",
+    "subtotal",
+    "vat",
+    "delivery",
+    "promotion",
+    "total",
+    "parser_version",
+)
+
+
+class DuplicateInvoice(Exception):
+    """Raised where the user has already uploaded the attachment of an
+    invoice being ingested.
+    """
+
+    def __init__(self, invoice: Invoice):
+        """Initialises a new instance of the DuplicateInvoice class.
+
+        :param invoice: The invoice already uploaded.
+        :type invoice: Invoice
+        """
+        super().__init__(f"The file has already been uploaded as {invoice}.")
+        self.invoice = invoice
+
+
+def content_hash(file: File) -> str:
+    """Returns the SHA-256 hex digest of a file, read a chunk at a time.
+    Files uploaded through `InvoiceUploadHandler` were hashed as they were
+    uploaded, so are not read again.
+
+    :param file: The file, e.g: an uploaded file.
+    :type file: File
+    :return: The hex digest of the file's contents.
+    :rtype: str
+    """
+    if getattr(file, "content_hash", None):
+        return file.content_hash
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def set_parsed_fields(invoice: Invoice, result: ParseResult):
+    """Sets the fields of an invoice from a parse result without saving it.
+
+    :param invoice: The invoice.
+    :type invoice: Invoice
+    :param result: The result of parsing the invoice's attachment.
+    :type result: ParseResult
+    """
+    invoice.parser_version = result.parser_version
+    if not result.ok:
+        invoice.parse_status = ParseStatus.FAILED
+        return
+    invoice.date_ordered = result.order_date
+    invoice.order_number = result.order_number
+    invoice.subtotal = result.subtotal or 0
+    invoice.vat = result.vat or 0
+    invoice.delivery = result.delivery or 0
+    invoice.promotion = result.promotion or 0
+    invoice.total = result.total or 0
+    invoice.parse_status = ParseStatus.PARSED
+
+
+def ingest(
+    invoice: Invoice,
+    result: _t.Optional[ParseResult] = None,
+) -> _t.Optional[ParseJob]:
+    """Saves a new invoice. Where the attachment has already been parsed, the
+    invoice is saved with the parsed data and its items. Otherwise, it is
+    queued to be parsed by the `parse_worker` command.
+
+    Where the invoice has a `content_hash` and the user already has an
+    invoice with the same hash, nothing is saved, not even the attachment.
+
+    :param invoice: The unsaved invoice, with its user, supplier and
+        attachment set.
+    :type invoice: Invoice
+    :param result: The result of parsing the attachment, defaults to None.
+    :type result: ParseResult, optional
+    :raises DuplicateInvoice: Where the user has already uploaded the
+        attachment.
+    :return: The job to parse the invoice, if it was queued.
+    :rtype: Optional[ParseJob]
+    """
+    duplicate = Invoice.find_duplicate(invoice.user_id, invoice.content_hash)
+    if duplicate is not None:
+        raise DuplicateInvoice(duplicate)
+
+    if result is None:
+        invoice.parse_status = ParseStatus.QUEUED
+    else:
+        set_parsed_fields(invoice, result)
+
+    try:
+        with transaction.atomic():
+            # The attachment is stored under a path which uses the parsed
+            # order date and number, so they must be set before the first
+            # save.
+            invoice.save()
+            if result is None:
+                job = ParseJob.objects.create(invoice=invoice)
+                progress.publish(invoice.pk, progress.STORED)
+                return job
+            if result.ok and result.items_breakdown:
+                invoice.add_from_items_breakdown(result.items_breakdown)
+    except IntegrityError:
+        # The same file may have been uploaded at the same time.
+        duplicate = Invoice.find_duplicate(
+            invoice.user_id,
+            invoice.content_hash,
+        )
+        if duplicate is None:
+            raise
+        if invoice.attachment:
+            invoice.attachment.delete(save=False)
+        raise DuplicateInvoice(duplicate)
+    return None
+
+
+def save_parse_result(invoice: Invoice, result: ParseResult):
+    """Updates an existing invoice with the result of parsing its attachment
+    and adds its items. Either everything is saved or nothing is.
+
+    :param invoice: The invoice.
+    :type invoice: Invoice
+    :param result: The result of parsing the invoice's attachment.
+    :type result: ParseResult
+    """
+    set_parsed_fields(invoice, result)
+    with transaction.atomic():
+        invoice.save(
+            update_fields=[*PARSED_FIELDS, "parse_status", "date_modified"]
+        )
+        if result.ok and result.items_breakdown:
+            invoice.add_from_items_breakdown(result.items_breakdown)
+        progress.publish(
+            invoice.pk,
+            progress.ITEMS_SAVED if result.ok else progress.FAILED,
+        )
@@ -0,0 +1,200 @@
+"""Parses uploaded invoices in the background.
+
+Uploading an invoice queues a `ParseJob` which is carried out by the
+`parse_worker` management command, keeping the slow work of reading the PDF
+out of the request. Any number of workers may run at once.
+"""
+
+import typing as _t
+import logging
+import traceback
+from django.db import transaction
+from parser import parse_for_supplier
+from parser.parse_for_supplier import BaseSupplierParser, ParseResult
+from . import attachments, ingest, progress
+from .models import Invoice, JobStatus, ParseJob, ParseStatus
+
+logger = logging.getLogger(__name__)
+
+
+def parse_invoice(invoice: Invoice) -> BaseSupplierParser:
+    """Parses an invoice's attachment and returns the processed parser. The
+    attachment is read from whichever storage is configured.
+
+    :param invoice: The invoice to parse.
+    :type invoice: Invoice
+    :return: A supplier parser object.
+    :rtype: BaseSupplierParser
+    """
+    with attachments.open_attachment(invoice.attachment) as attachment:
+        parsed_data = parse_for_supplier.parse(
+            attachment,
+            invoice.supplier.name,
+            on_progress=progress.reporter(invoice.pk),
+        )
+        parsed_data.process_invoice()
+    return parsed_data
+
+
+def start_job(job: ParseJob) -> Invoice:
+    """Marks the invoice of a claimed job as being parsed.
+
+    :param job: The job, as returned by `ParseJob.claim`.
+    :type job: ParseJob
+    :return: The invoice, with its supplier.
+    :rtype: Invoice
+    """
+    invoice = job.invoice
+    # Loads the supplier now, as it is needed to parse the invoice and may
+    # not be loaded lazily from async code.
+    invoice.supplier
+    invoice.parse_status = ParseStatus.PARSING
+    invoice.save(update_fields=["parse_status"])
+    progress.publish(invoice.pk, progress.PARSING)
+    return invoice
+
+
+def _holds_lease(job: ParseJob) -> bool:
+    """Locks a started job's row until the end of the transaction and
+    returns whether its worker still holds the lease on it. A job whose
+    lease expired may have been claimed again by another worker, which
+    alone may then save its result.
+
+    :param job: The job, as returned by `ParseJob.claim`.
+    :type job: ParseJob
+    :return: Whether the job is still running for its worker.
+    :rtype: bool
+    """
+    return (
+        ParseJob.objects.select_for_update()
+        .filter(
+            pk=job.pk,
+            status=JobStatus.RUNNING,
+            locked_by=job.locked_by,
+            attempts=job.attempts,
+        )
+        .first()
+        is not None
+    )
+
+
+def fail_job(job: ParseJob, error: str) -> bool:
+    """Marks a started job as having failed, to be retried later or, once
+    it has run out of attempts, as dead. Nothing is saved where the worker
+    no longer holds the job's lease.
+
+    :param job: The job.
+    :type job: ParseJob
+    :param error: A description of the error.
+    :type error: str
+    :return: False, as the invoice was not parsed.
+    :rtype: bool
+    """
+    with transaction.atomic():
+        if not _holds_lease(job):
+            logger.warning(
+                "Lost the lease on the job of invoice %s.", job.invoice_id
+            )
+            return False
+        job.fail(error)
+        if job.status == JobStatus.QUEUED:
+            invoice = job.invoice
+            invoice.parse_status = ParseStatus.QUEUED
+            invoice.save(update_fields=["parse_status"])
+        progress.publish(
+            job.invoice_id,
+            progress.FAILED,
+            retrying=job.status == JobStatus.QUEUED,
+        )
+    return False
+
+
+def release_job(job: ParseJob) -> bool:
+    """Puts a started job back in the queue, without counting the attempt,
+    for another worker to carry out. Nothing is saved where the worker no
+    longer holds the job's lease.
+
+    :param job: The job.
+    :type job: ParseJob
+    :return: False, as the invoice was not parsed.
+    :rtype: bool
+    """
+    with transaction.atomic():
+        if not _holds_lease(job):
+            return False
+        job.release()
+        invoice = job.invoice
+        invoice.parse_status = ParseStatus.QUEUED
+        invoice.save(update_fields=["parse_status"])
+        progress.publish(job.invoice_id, progress.STORED)
+    return False
+
+
+def finish_job(job: ParseJob, result: ParseResult) -> bool:
+    """Saves the result of parsing the invoice of a started job and marks
+    the job as having succeeded, together. A result carrying an error fails
+    the job, as an exception raised while parsing would. The result is
+    discarded where the worker no longer holds the job's lease, as another
+    worker is parsing the invoice again.
+
+    :param job: The job.
+    :type job: ParseJob
+    :param result: The result of parsing the invoice's attachment.
+    :type result: ParseResult
+    :return: Whether the invoice was parsed.
+    :rtype: bool
+    """
+    if result.error is not None:
+        logger.error(
+            "Failed to parse invoice %s: %r", job.invoice_id, result.error
+        )
+        return fail_job(job, repr(result.error))
+    try:
+        with transaction.atomic():
+            if not _holds_lease(job):
+                logger.warning(
+                    "Lost the lease on the job of invoice %s, discarding "
+                    "its result.",
+                    job.invoice_id,
+                )
+                return False
+            ingest.save_parse_result(job.invoice, result)
+            job.succeed()
+    except Exception:
+        logger.exception("Failed to save invoice %s.", job.invoice_id)
+        return fail_job(job, traceback.format_exc())
+    return True
+
+
+def run_job(job: ParseJob) -> bool:
+    """Carries out a claimed job. Where parsing fails, the job is retried
+    later or, once it has run out of attempts, marked as dead.
+
+    :param job: The job, as returned by `ParseJob.claim`.
+    :type job: ParseJob
+    :return: Whether the invoice was parsed.
+    :rtype: bool
+    """
+    invoice = start_job(job)
+    try:
+        result = parse_invoice(invoice).result()
+    except Exception:
+        logger.exception("Failed to parse invoice %s.", invoice.pk)
+        return fail_job(job, traceback.format_exc())
+    return finish_job(job, result)
+
+
+def run_pending(worker: str, limit: int = 1) -> _t.List[ParseJob]:
+    """Claims and carries out up to `limit` jobs.
+
+    :param worker: An identifier for the worker.
+    :type worker: str
+    :param limit: The maximum number of jobs to run, defaults to 1.
+    :type limit: int, optional
+    :return: The jobs which were run.
+    :rtype: List[ParseJob]
+    """
+    jobs = ParseJob.claim(worker, limit)
+    for job in jobs:
+        run_job(job)
+    return jobs
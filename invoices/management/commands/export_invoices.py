@@ -0,0 +1,56 @@
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from ... import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports invoices and their items as CSV, one row per item. Rows are "
+        "streamed from the database, so exports of any size may be run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help=(
+                "Only export the invoices this user, by username, has access "
+                "to. Defaults to every invoice."
+            ),
+        )
+        parser.add_argument(
+            "--from",
+            type=date.fromisoformat,
+            dest="date_from",
+            help="Only export invoices ordered on or after this date.",
+        )
+        parser.add_argument(
+            "--to",
+            type=date.fromisoformat,
+            dest="date_to",
+            help="Only export invoices ordered on or before this date.",
+        )
+        parser.add_argument(
+            "--output",
+            help="The file to write the CSV to. Defaults to stdout.",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['user']!r}.")
+
+        chunks = export.iter_csv(
+            user,
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
@@ -0,0 +1,52 @@
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from ... import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Parses uploaded invoices in the background. Several workers may be "
+        "run at once, on any number of machines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="The number of jobs to claim at a time.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="The number of seconds to wait when there are no jobs.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no jobs left to run.",
+        )
+        parser.add_argument(
+            "--worker-id",
+            default=f"{socket.gethostname()}:{os.getpid()}",
+            help="Identifies the worker on the jobs it claims.",
+        )
+
+    def handle(self, *args, **options):
+        worker = options["worker_id"]
+        self.stdout.write(f"Worker {worker} started.")
+        while True:
+            ran = jobs.run_pending(worker, options["batch_size"])
+            for job in ran:
+                self.stdout.write(
+                    f"Job {job.pk} for invoice {job.invoice_id}: "
+                    f"{job.status} (attempt {job.attempts})"
+                )
+            if ran:
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from ... import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates the spend rollups from the invoice items, a batch of "
+        "users at a time. With --check, only reports the rollups which "
+        "differ from the items."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=rollups.DEFAULT_BATCH_SIZE,
+            help="The number of users to recalculate at a time.",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Report the rollups which differ from the items rather than "
+                "rebuilding them. Fails where any do."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self.check_rollups(options["batch_size"])
+            return
+
+        def on_batch(users, written):
+            self.stdout.write(f"Rebuilt {written} rollups for {users} users.")
+
+        users, written = rollups.rebuild(
+            batch_size=options["batch_size"],
+            on_batch=on_batch,
+        )
+        self.stdout.write(
+            f"Done. Rebuilt {written} rollups for {users} users."
+        )
+
+    def check_rollups(self, batch_size: int):
+        mismatches = 0
+        for mismatch in rollups.check(batch_size=batch_size):
+            mismatches += 1
+            self.stdout.write(
+                f"User {mismatch.user_id}, supplier {mismatch.supplier_id}, "
+                f"category {mismatch.category_id}, month {mismatch.month}: "
+                f"expected {mismatch.expected}, found {mismatch.actual}."
+            )
+        if mismatches:
+            raise CommandError(
+                f"{mismatches} rollups differ from the items, run "
+                "`rebuild_rollups` to recalculate them."
+            )
+        self.stdout.write("The rollups match the items.")
@@ -0,0 +1,73 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from ... import reparse
+
+
+class Command(BaseCommand):
+    help = (
+        "Reparses the invoices which were parsed by an older version of "
+        "their supplier's parser. Progress is checkpointed after each batch, "
+        "so an interrupted run resumes where it left off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--supplier",
+            action="append",
+            dest="suppliers",
+            help="Only reparse this supplier's invoices. May be repeated.",
+        )
+        parser.add_argument(
+            "--from",
+            type=date.fromisoformat,
+            dest="date_from",
+            help="Only reparse invoices ordered on or after this date.",
+        )
+        parser.add_argument(
+            "--to",
+            type=date.fromisoformat,
+            dest="date_to",
+            help="Only reparse invoices ordered on or before this date.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=reparse.DEFAULT_BATCH_SIZE,
+            help="The number of invoices to parse and save at a time.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="The number of processes to parse with.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=reparse.DEFAULT_CHECKPOINT,
+            help="The name of the checkpoint to resume from.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Discard the checkpoint and start from the first invoice.",
+        )
+
+    def handle(self, *args, **options):
+        def on_batch(progress):
+            self.stdout.write(
+                f"Reparsed {progress.reparsed}, failed {progress.failed}, "
+                f"up to invoice {progress.last_invoice_id}."
+            )
+
+        progress = reparse.reparse(
+            checkpoint=options["checkpoint"],
+            suppliers=options["suppliers"],
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+            batch_size=options["batch_size"],
+            max_workers=options["workers"],
+            restart=options["restart"],
+            on_batch=on_batch,
+        )
+        self.stdout.write(
+            f"Done. Reparsed {progress.reparsed}, failed {progress.failed}."
+        )
@@ -0,0 +1,50 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import invoices.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_alter_invoiceitem_price_ex_vat_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='parse_status',
+            field=models.CharField(blank=True, choices=[('queued', 'Queued'), ('parsing', 'Parsing'), ('parsed', 'Parsed'), ('failed', 'Failed')], max_length=16, null=True),
+        ),
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='invoices.invoice'),
+        ),
+        migrations.CreateModel(
+            name='ParseJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('dead', 'Dead')], default='queued', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=invoices.models.default_max_attempts)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=128, null=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parse_jobs', to='invoices.invoice')),
+            ],
+            options={
+                'db_table': 'parse_job',
+                'ordering': ['run_after', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='parsejob',
+            index=models.Index(fields=['status', 'run_after'], name='parse_job_status_d9829b_idx'),
+        ),
+    ]
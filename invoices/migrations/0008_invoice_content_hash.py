@@ -0,0 +1,22 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_parse_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash__isnull', False)), fields=('user', 'content_hash'), name='invoice_user_content_hash'),
+        ),
+    ]
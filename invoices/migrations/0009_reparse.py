@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_invoice_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReparseCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_invoice_id', models.PositiveBigIntegerField(default=0)),
+                ('reparsed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'reparse_checkpoint',
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='parser_version',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0010_direct_upload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-date_ordered', '-id'], name='invoice_user_date_ordered'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0011_invoice_user_date_ordered'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
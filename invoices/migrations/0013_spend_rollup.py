@@ -0,0 +1,40 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_alter_product_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('suppliers', '0002_usersupplier'),
+        ('invoices', '0012_invoice_date_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(blank=True, null=True)),
+                ('total_ex_vat', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('vat', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.productcategory')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='suppliers.supplier')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'spend_rollup',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='spendrollup',
+            index=models.Index(fields=['user', 'month'], name='spend_rollup_user_month'),
+        ),
+    ]
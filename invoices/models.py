@@ -1,9 +1,14 @@
 import typing as _t
 import os
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from django.utils.text import slugify
 from core import number_utils
 from suppliers.models import Supplier
+from products.cache import ProductRef, get_product_cache, normalise
 from products.models import Product, ProductCategory
 from parser.parse_for_supplier import BaseSupplierParser
 
@@ -33,12 +38,24 @@ def invoice_upload_path(instance: "Invoice", filename: str) -> str:
     return upload_path
 
 
+class ParseStatus(models.TextChoices):
+    """The state of the parsing of an invoice's attachment."""
+
+    QUEUED = "queued", "Queued"
+    PARSING = "parsing", "Parsing"
+    PARSED = "parsed", "Parsed"
+    FAILED = "failed", "Failed"
+
+
 class Invoice(models.Model):
     """Represents an invoice item. Contains details on an invoice."""
 
     user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
     date_ordered = models.DateField(blank=True, null=True)
     date_added = models.DateTimeField(auto_now_add=True)
+    # When the invoice or its items last changed. Used to key the cached
+    # reports of the invoice's user, see `invoices.reports`.
+    date_modified = models.DateTimeField(auto_now=True)
     order_number = models.CharField(
         max_length=32,
         blank=True,
@@ -82,14 +99,82 @@ class Invoice(models.Model):
         null=True,
     )
     completed = models.BooleanField(default=False)
+    parse_status = models.CharField(
+        max_length=16,
+        choices=ParseStatus.choices,
+        blank=True,
+        null=True,
+    )
+    # The SHA-256 of the attachment when it was uploaded. Used to spot a
+    # user uploading the same file twice.
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    # The version of the supplier's parser which last parsed the attachment.
+    # Invoices parsed by an older version are reparsed by the
+    # `reparse_invoices` command.
+    parser_version = models.CharField(
+        max_length=32,
+        blank=True,
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         db_table = "invoice"
         ordering = ["-date_ordered"]
+        constraints = [
+            # Also serves as the index used to look up duplicates.
+            models.UniqueConstraint(
+                fields=["user", "content_hash"],
+                condition=Q(content_hash__isnull=False),
+                name="invoice_user_content_hash",
+            )
+        ]
+        indexes = [
+            # Used to page through a user's invoices by `KeysetPagination`.
+            models.Index(
+                fields=["user", "-date_ordered", "-id"],
+                name="invoice_user_date_ordered",
+            )
+        ]
 
     def __str__(self):
         return f"{self.supplier.name} - {self.date_ordered}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembers the values loaded, so that the rollups the invoice was in
+        # are known without another query when it is changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @classmethod
+    def find_duplicate(
+        cls,
+        user_id: int,
+        content_hash: _t.Optional[str],
+    ) -> _t.Optional["Invoice"]:
+        """Returns the user's invoice whose attachment has the given hash.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        :param content_hash: The SHA-256 hex digest of the attachment.
+        :type content_hash: str, optional
+        :return: The invoice, if there is one.
+        :rtype: Optional[Invoice]
+        """
+        if not content_hash:
+            return None
+        return cls.objects.filter(
+            user_id=user_id,
+            content_hash=content_hash,
+        ).first()
+
     def clean(self):
         """Ensure that the promotion value is negative."""
         if (self.promotion or 0) > 0:
@@ -112,12 +197,24 @@ class Invoice(models.Model):
 
         self.save()
 
-    def add_from_items_breakdown(self, items_breakdown: dict):
+    def add_from_items_breakdown(
+        self,
+        items_breakdown: dict,
+        bulk: bool = True,
+    ) -> _t.List["InvoiceItem"]:
         """Adds invoice items from a dictionary of items.
 
         :param items_breakdown: The dictionary of items to add to the invoice.
         :type items_breakdown: dict
+        :param bulk: Whether to add every item in a fixed number of queries
+            rather than adding each item with `add_item`, defaults to True.
+        :type bulk: bool, optional
+        :return: The invoice items that were added.
+        :rtype: List[InvoiceItem]
         """
+        if bulk:
+            return self._bulk_add_from_items_breakdown(items_breakdown)
+
         invoice_items = []
         for product_name, product_details in items_breakdown.items():
             invoice_items.append(
@@ -129,6 +226,98 @@ class Invoice(models.Model):
             )
         return invoice_items
 
+    def _bulk_add_from_items_breakdown(
+        self,
+        items_breakdown: dict,
+    ) -> _t.List["InvoiceItem"]:
+        """Adds invoice items from a dictionary of items using a fixed number
+        of queries, however many items there are.
+
+        :param items_breakdown: The dictionary of items to add to the invoice.
+        :type items_breakdown: dict
+        :return: The invoice items that were added.
+        :rtype: List[InvoiceItem]
+        """
+        if not items_breakdown:
+            return []
+
+        with transaction.atomic():
+            products = self._products_for_names(list(items_breakdown))
+            return InvoiceItem.objects.bulk_create(
+                [
+                    InvoiceItem(
+                        invoice=self,
+                        product_id=products[product_name].id,
+                        quantity=product_details.get("quantity"),
+                        price_ex_vat=product_details.get("price_ex_vat"),
+                        category_id=products[product_name].default_category_id,
+                    )
+                    for product_name, product_details in (
+                        items_breakdown.items()
+                    )
+                ]
+            )
+
+    def _products_for_names(
+        self,
+        product_names: _t.List[str],
+    ) -> _t.Dict[str, ProductRef]:
+        """Returns the supplier's product for each name, creating any which
+        do not exist.
+
+        Products are resolved through `products.cache.get_product_cache`,
+        matching on the slug of the name, as no two of a supplier's products
+        may share a slug.
+
+        :param product_names: The names of the products.
+        :type product_names: List[str]
+        :return: A mapping of each name to its product.
+        :rtype: Dict[str, ProductRef]
+        """
+        products = get_product_cache().get_many(
+            self.supplier_id, product_names
+        )
+
+        missing = {
+            normalise(name): Product(
+                name=name,
+                slug=normalise(name),
+                supplier_id=self.supplier_id,
+            )
+            for name in product_names
+            if name not in products
+        }
+        if missing:
+            # Another invoice for the supplier may be adding the same
+            # products at the same time, in which case their rows are used.
+            Product.objects.bulk_create(
+                missing.values(),
+                ignore_conflicts=True,
+            )
+            created = list(
+                Product.objects.filter(
+                    slug__in=missing,
+                    supplier_id=self.supplier_id,
+                )
+            )
+            # `bulk_create` does not send signals, so the new products are
+            # added to the cache here, once they are sure to exist.
+            transaction.on_commit(
+                lambda: get_product_cache().add(self.supplier_id, created)
+            )
+            by_slug = {
+                product.slug: ProductRef(
+                    product.id,
+                    product.default_category_id,
+                )
+                for product in created
+            }
+            for name in product_names:
+                if name not in products:
+                    products[name] = by_slug[normalise(name)]
+
+        return products
+
     def add_item(
         self,
         quantity: int,
@@ -168,7 +357,6 @@ class Invoice(models.Model):
             price_ex_vat=price,
             category=product.default_category,
         )
-        invoice_item.save()
         return invoice_item
 
 
@@ -199,3 +387,250 @@ class InvoiceItem(models.Model):
     def unit_price(self) -> float:
         """Returns the unit price of the invoice item."""
         return number_utils.float_to_dp(self.price_ex_vat / self.quantity)
+
+
+def default_max_attempts() -> int:
+    """Returns the number of times a job is attempted by default."""
+    return settings.PARSE_JOB_MAX_ATTEMPTS
+
+
+class JobStatus(models.TextChoices):
+    """The state of a `ParseJob`."""
+
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    SUCCEEDED = "succeeded", "Succeeded"
+    # The job has failed too many times and will not be retried.
+    DEAD = "dead", "Dead"
+
+
+class ParseJob(models.Model):
+    """A request to parse an invoice's attachment, carried out by the
+    `parse_worker` command.
+    """
+
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name="parse_jobs",
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=JobStatus.choices,
+        default=JobStatus.QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        default=default_max_attempts,
+    )
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=128, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "parse_job"
+        ordering = ["run_after", "id"]
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.invoice_id} - {self.status}"
+
+    @classmethod
+    def enqueue(cls, invoice: Invoice) -> "ParseJob":
+        """Queues an invoice to be parsed.
+
+        :param invoice: The invoice to parse.
+        :type invoice: Invoice
+        :return: The job.
+        :rtype: ParseJob
+        """
+        invoice.parse_status = ParseStatus.QUEUED
+        invoice.save(update_fields=["parse_status"])
+        return cls.objects.create(invoice=invoice)
+
+    @classmethod
+    def claim(
+        cls,
+        worker: str,
+        limit: int = 1,
+        job_ids: _t.Optional[_t.Iterable[int]] = None,
+    ) -> _t.List["ParseJob"]:
+        """Claims jobs that are ready to run for a worker. Rows locked by
+        another worker's claim are skipped rather than waited on, so any
+        number of workers may claim jobs concurrently. Running jobs whose
+        lease has expired, e.g: because their worker died, are claimed again
+        unless that was their last attempt, in which case they are dead.
+
+        :param worker: An identifier for the worker.
+        :type worker: str
+        :param limit: The maximum number of jobs to claim, defaults to 1.
+        :type limit: int, optional
+        :param job_ids: Only claim the jobs with these ids.
+        :type job_ids: Iterable[int], optional
+        :return: The jobs claimed.
+        :rtype: List[ParseJob]
+        """
+        now = timezone.now()
+        lease_expired = now - timedelta(seconds=settings.PARSE_JOB_LEASE)
+        expired = Q(status=JobStatus.RUNNING, locked_at__lt=lease_expired)
+        exhausted = Q(attempts__gte=F("max_attempts"))
+        qs = cls.objects.select_for_update(skip_locked=True)
+        if job_ids is not None:
+            qs = qs.filter(pk__in=job_ids)
+        with transaction.atomic():
+            for job in qs.filter(expired & exhausted):
+                job.fail("The lease expired on the last attempt.")
+            jobs = list(
+                qs.filter(
+                    Q(status=JobStatus.QUEUED, run_after__lte=now)
+                    | (expired & ~exhausted)
+                )[:limit]
+            )
+            for job in jobs:
+                job.status = JobStatus.RUNNING
+                job.locked_by = worker
+                job.locked_at = now
+                job.attempts += 1
+            cls.objects.bulk_update(
+                jobs,
+                ["status", "locked_by", "locked_at", "attempts"],
+            )
+        return jobs
+
+    def succeed(self):
+        """Marks the job as having succeeded."""
+        self.status = JobStatus.SUCCEEDED
+        self.last_error = None
+        self.save()
+
+    def release(self):
+        """Puts a claimed job back in the queue, without counting the
+        attempt, where its worker could not carry it out.
+        """
+        self.status = JobStatus.QUEUED
+        self.locked_by = None
+        self.locked_at = None
+        self.attempts -= 1
+        self.save()
+
+    def fail(self, error: str):
+        """Marks the job as having failed. The job is retried after a delay
+        which doubles with each attempt, until it has been attempted
+        `max_attempts` times, after which it is dead.
+
+        :param error: A description of the error.
+        :type error: str
+        """
+        self.last_error = error
+        self.locked_by = None
+        self.locked_at = None
+        if self.attempts >= self.max_attempts:
+            self.status = JobStatus.DEAD
+            self.invoice.parse_status = ParseStatus.FAILED
+            self.invoice.save(update_fields=["parse_status"])
+        else:
+            self.status = JobStatus.QUEUED
+            delay = settings.PARSE_JOB_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.run_after = timezone.now() + timedelta(seconds=delay)
+        self.save()
+
+
+class ReparseCheckpoint(models.Model):
+    """The progress of a run of the `reparse_invoices` command. Invoices are
+    reparsed in order of id, so the run can be resumed after the last
+    invoice it reached once interrupted.
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    last_invoice_id = models.PositiveBigIntegerField(default=0)
+    reparsed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "reparse_checkpoint"
+
+    def __str__(self):
+        return f"{self.name} - {self.last_invoice_id}"
+
+
+class DirectUpload(models.Model):
+    """An attachment which a user has been permitted to upload directly to
+    object storage. Once the user confirms the upload, it is attached to a
+    new invoice.
+    """
+
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
+    # The name of the attachment in storage.
+    name = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    invoice = models.OneToOneField(
+        Invoice,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="direct_upload",
+    )
+    date_added = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "direct_upload"
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def expired(self) -> bool:
+        """Whether the permission to upload has expired."""
+        return timezone.now() >= self.expires_at
+
+
+class SpendRollup(models.Model):
+    """The spend on a user's items from a supplier in a category in a month,
+    kept up to date by `invoices.rollups` so that reports read a row per
+    month rather than every item.
+    """
+
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
+    category = models.ForeignKey(
+        ProductCategory,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    # The first day of the month the invoices were ordered in, or null for
+    # invoices without an order date.
+    month = models.DateField(blank=True, null=True)
+    total_ex_vat = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        blank=True,
+        null=True,
+    )
+    vat = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        blank=True,
+        null=True,
+    )
+    item_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(blank=True, null=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "spend_rollup"
+        indexes = [
+            models.Index(
+                fields=["user", "month"],
+                name="spend_rollup_user_month",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.supplier_id} - {self.month}"
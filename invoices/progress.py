@@ -0,0 +1,372 @@
+"""Reports the progress of parsing invoices as it happens, so that clients
+can wait on a stream of server-sent events rather than polling.
+
+Progress is published as events, each with the `invoice_id` and the
+`stage` reached:
+
+- `stored`: the invoice was saved and queued to be parsed.
+- `parsing`: a worker started parsing the invoice.
+- `extracting`: a page of the attachment was extracted, with the `page` and
+  the number of `pages`, where known. Only reported where the attachment is
+  parsed by `parse_worker`, as other parsers run in a pool of processes.
+- `parsed`: the attachment was parsed.
+- `items_saved`: the parsed data and items were saved, the last stage.
+- `failed`: parsing failed and, unless `retrying`, will not be retried.
+
+On Postgres, events are sent on the `PARSE_PROGRESS_CHANNEL` `LISTEN/NOTIFY`
+channel, as `products.cache` does, so that subscribers in every process
+receive the events published by any other, e.g: by `parse_worker`.
+Elsewhere, only subscribers in the publishing process receive them. Events
+published in a transaction are delivered once it commits.
+"""
+
+import typing as _t
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import deque
+from functools import partial
+from django.conf import settings
+from django.db import connection, transaction
+from parser.parse_for_supplier import EXTRACTING, PARSED, ProgressCallback
+from .models import ParseStatus
+
+logger = logging.getLogger(__name__)
+
+STORED = "stored"
+PARSING = "parsing"
+ITEMS_SAVED = "items_saved"
+FAILED = "failed"
+# Every stage, in the order they are reached. `EXTRACTING` and `PARSED` are
+# reported by the parsers.
+STAGES = (STORED, PARSING, EXTRACTING, PARSED, ITEMS_SAVED, FAILED)
+
+DEFAULT_CHANNEL = "parse_progress"
+# The most invoices a single stream may follow.
+MAX_INVOICES = 100
+# How long the listener waits for a notification before checking that it
+# should still be running, and how long it waits before reconnecting after
+# losing its connection.
+LISTEN_TIMEOUT = 5
+RECONNECT_DELAY = 5
+# How long clients wait before reconnecting to a stream which was closed.
+RETRY_MS = 3000
+
+
+def is_final(event: _t.Dict[str, _t.Any]) -> bool:
+    """Whether an event is the last of its invoice's parse.
+
+    :param event: The event.
+    :type event: Dict[str, Any]
+    :return: Whether no further progress will be made.
+    :rtype: bool
+    """
+    return event["stage"] == ITEMS_SAVED or (
+        event["stage"] == FAILED and not event.get("retrying")
+    )
+
+
+class Subscription:
+    """Receives the events of some invoices, from any thread, to be awaited
+    on an event loop.
+    """
+
+    def __init__(self, invoice_ids: _t.Iterable[int]):
+        """Initialises a new instance of the Subscription class.
+
+        :param invoice_ids: The ids of the invoices.
+        :type invoice_ids: Iterable[int]
+        """
+        self.invoice_ids = frozenset(invoice_ids)
+        # Set where events may have been missed, in which case the
+        # subscriber should subscribe again.
+        self.ended = False
+        self._events: _t.Deque[_t.Dict[str, _t.Any]] = deque()
+        self._lock = threading.Lock()
+        self._loop: _t.Optional[asyncio.AbstractEventLoop] = None
+        self._waiter: _t.Optional[asyncio.Event] = None
+
+    def put(self, event: _t.Optional[_t.Dict[str, _t.Any]]):
+        """Hands the subscriber an event, or ends the subscription where the
+        event is `None`.
+
+        :param event: The event.
+        :type event: Dict[str, Any], optional
+        """
+        with self._lock:
+            if event is None:
+                self.ended = True
+            else:
+                self._events.append(event)
+            loop, waiter = self._loop, self._waiter
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                # The loop has been closed.
+                pass
+
+    async def get(
+        self,
+        timeout: _t.Optional[float] = None,
+    ) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Waits for the next event.
+
+        :param timeout: How long to wait in seconds, defaults to forever.
+        :type timeout: float, optional
+        :return: The event, or `None` where there was none in time or the
+            subscription has ended.
+        :rtype: Dict[str, Any], optional
+        """
+        with self._lock:
+            if self._waiter is None:
+                self._loop = asyncio.get_running_loop()
+                self._waiter = asyncio.Event()
+            self._waiter.clear()
+            if self._events:
+                return self._events.popleft()
+            if self.ended:
+                return None
+        try:
+            await asyncio.wait_for(self._waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        with self._lock:
+            return self._events.popleft() if self._events else None
+
+
+_subscriptions: _t.Set[Subscription] = set()
+_subscriptions_lock = threading.Lock()
+
+
+def subscribe(invoice_ids: _t.Iterable[int]) -> Subscription:
+    """Subscribes to the events of some invoices in this process.
+
+    :param invoice_ids: The ids of the invoices.
+    :type invoice_ids: Iterable[int]
+    :return: The subscription, which must be passed to `unsubscribe` once
+        done with.
+    :rtype: Subscription
+    """
+    ensure_listening()
+    subscription = Subscription(invoice_ids)
+    with _subscriptions_lock:
+        _subscriptions.add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription: Subscription):
+    """Stops a subscription receiving events.
+
+    :param subscription: The subscription.
+    :type subscription: Subscription
+    """
+    with _subscriptions_lock:
+        _subscriptions.discard(subscription)
+
+
+def deliver(event: _t.Optional[_t.Dict[str, _t.Any]]):
+    """Hands an event to the subscribers of its invoice in this process, or
+    ends every subscription where the event is `None`.
+
+    :param event: The event.
+    :type event: Dict[str, Any], optional
+    """
+    with _subscriptions_lock:
+        subscriptions = [
+            subscription
+            for subscription in _subscriptions
+            if event is None or event["invoice_id"] in subscription.invoice_ids
+        ]
+    for subscription in subscriptions:
+        subscription.put(event)
+
+
+def channel() -> str:
+    """Returns the name of the `LISTEN/NOTIFY` channel."""
+    return getattr(settings, "PARSE_PROGRESS_CHANNEL", DEFAULT_CHANNEL)
+
+
+def publish(invoice_id: int, stage: str, **details):
+    """Publishes an invoice's progress to its subscribers in every process.
+
+    :param invoice_id: The id of the invoice.
+    :type invoice_id: int
+    :param stage: The stage reached.
+    :type stage: str
+    """
+    event = {"invoice_id": invoice_id, "stage": stage, **details}
+    if connection.vendor == "postgresql":
+        # Notifications are delivered when the transaction commits.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                [channel(), json.dumps(event)],
+            )
+    else:
+        transaction.on_commit(partial(deliver, event))
+
+
+def reporter(invoice_id: int) -> ProgressCallback:
+    """Returns a callback which publishes a parser's progress on an
+    invoice.
+
+    :param invoice_id: The id of the invoice.
+    :type invoice_id: int
+    :return: The callback, for `parse_for_supplier.parse`.
+    :rtype: ProgressCallback
+    """
+    return partial(publish, invoice_id)
+
+
+def statuses(
+    invoices: _t.Iterable[_t.Tuple[int, str]],
+) -> _t.List[_t.Dict[str, _t.Any]]:
+    """Returns an event for the current parse status of each invoice, which
+    is final where it has been parsed or has failed for good.
+
+    :param invoices: The id and `parse_status` of each invoice.
+    :type invoices: Iterable[Tuple[int, str]]
+    :return: The events.
+    :rtype: List[Dict[str, Any]]
+    """
+    stages = {
+        ParseStatus.QUEUED: STORED,
+        ParseStatus.PARSING: PARSING,
+        ParseStatus.PARSED: ITEMS_SAVED,
+        ParseStatus.FAILED: FAILED,
+    }
+    return [
+        {"invoice_id": invoice_id, "stage": stages[status]}
+        for invoice_id, status in invoices
+        if status in stages
+    ]
+
+
+def _message(event: str, data: _t.Dict[str, _t.Any]) -> str:
+    """Formats a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream(
+    subscription: Subscription,
+    current: _t.List[_t.Dict[str, _t.Any]],
+) -> _t.AsyncIterator[str]:
+    """Yields the server-sent events of a subscription's invoices until
+    every invoice is done with, the subscription ends or
+    `PARSE_PROGRESS_TIMEOUT` seconds have passed. A comment is sent every
+    `PARSE_PROGRESS_KEEPALIVE` seconds while idle.
+
+    :param subscription: The subscription, which is ended afterwards.
+    :type subscription: Subscription
+    :param current: The current status of each invoice, from `statuses`,
+        read after subscribing so that no progress is missed.
+    :type current: List[Dict[str, Any]]
+    :return: An iterator over the events.
+    :rtype: AsyncIterator[str]
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.PARSE_PROGRESS_TIMEOUT
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        pending = set(subscription.invoice_ids)
+        for event in current:
+            yield _message("status", event)
+            if is_final(event):
+                pending.discard(event["invoice_id"])
+
+        while pending and not subscription.ended:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            event = await subscription.get(
+                min(remaining, settings.PARSE_PROGRESS_KEEPALIVE)
+            )
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            if event["invoice_id"] not in pending:
+                continue
+            yield _message("progress", event)
+            if is_final(event):
+                pending.discard(event["invoice_id"])
+        if not pending:
+            yield _message("done", {})
+    finally:
+        unsubscribe(subscription)
+
+
+class Listener(threading.Thread):
+    """Listens for notifications from other processes on a dedicated
+    connection, delivering the events in each to the subscribers in this
+    process.
+    """
+
+    def __init__(self):
+        """Initialises a new instance of the Listener class."""
+        super().__init__(name="parse-progress-listener", daemon=True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Lost the parse progress connection.")
+                # Events sent whilst disconnected have been missed.
+                deliver(None)
+                self.stopped.wait(RECONNECT_DELAY)
+
+    def listen(self):
+        """Listens until stopped or the connection is lost."""
+        conn = connection.get_new_connection(
+            connection.get_connection_params()
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{channel()}"')
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([conn], [], [], LISTEN_TIMEOUT)
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def handle(self, payload: str):
+        """Delivers the event in a notification.
+
+        :param payload: The event, as JSON.
+        :type payload: str
+        """
+        try:
+            event = json.loads(payload)
+            event["invoice_id"] = int(event["invoice_id"])
+            if "stage" not in event:
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            logger.warning("Invalid parse progress notification %r.", payload)
+            return
+        deliver(event)
+
+
+_listener: _t.Optional[Listener] = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listening():
+    """Starts listening for notifications from other processes, unless
+    already listening or the database is not Postgres.
+    """
+    global _listener
+    if connection.vendor != "postgresql":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = Listener()
+            _listener.start()
@@ -0,0 +1,172 @@
+"""Reparses invoices which were parsed by an older version of their
+supplier's parser.
+
+Each invoice records the version of the parser which parsed it, so once a
+parser is fixed and its `version` changed, only the invoices it parsed before
+the fix are selected. They are streamed in order of id, parsed a batch at a
+time by `parse_for_supplier.parse_many` and the results of each batch are
+saved in a single transaction along with a `ReparseCheckpoint`, so that an
+interrupted run resumes after the last batch saved.
+"""
+
+import typing as _t
+import logging
+import tempfile
+from datetime import date
+from itertools import islice
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from parser import parse_for_supplier
+from parser.parse_for_supplier import ParseResult
+from . import attachments, ingest
+from .models import Invoice, InvoiceItem, ParseStatus, ReparseCheckpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CHECKPOINT = "reparse"
+
+
+def stale_invoices(
+    suppliers: _t.Optional[_t.Iterable[str]] = None,
+    date_from: _t.Optional[date] = None,
+    date_to: _t.Optional[date] = None,
+) -> QuerySet:
+    """Returns the invoices with attachments which were not parsed by the
+    current version of their supplier's parser, in order of id. Invoices
+    waiting on the `parse_worker` command are left to it.
+
+    :param suppliers: The names of the suppliers whose invoices to select,
+        defaults to every supplier with a parser.
+    :type suppliers: Iterable[str], optional
+    :param date_from: Only select invoices ordered on or after this date.
+    :type date_from: date, optional
+    :param date_to: Only select invoices ordered on or before this date.
+    :type date_to: date, optional
+    :return: The invoices, with their suppliers.
+    :rtype: QuerySet
+    """
+    stale = Q()
+    for supplier in suppliers or parse_for_supplier.SUPPLIER_PARSERS:
+        version = parse_for_supplier.parser_version(supplier)
+        if version is not None:
+            # Includes invoices which have not recorded a version.
+            stale |= Q(supplier__name=supplier) & ~Q(parser_version=version)
+    if not stale:
+        return Invoice.objects.none()
+
+    invoices = (
+        Invoice.objects.filter(stale)
+        .exclude(Q(attachment="") | Q(attachment__isnull=True))
+        .exclude(parse_status__in=[ParseStatus.QUEUED, ParseStatus.PARSING])
+    )
+    if date_from is not None:
+        invoices = invoices.filter(date_ordered__gte=date_from)
+    if date_to is not None:
+        invoices = invoices.filter(date_ordered__lte=date_to)
+    return invoices.select_related("supplier").order_by("id")
+
+
+def parse_batch(
+    invoices: _t.List[Invoice],
+    max_workers: _t.Optional[int] = None,
+) -> _t.Dict[int, ParseResult]:
+    """Parses the attachments of invoices in parallel.
+
+    :param invoices: The invoices.
+    :type invoices: List[Invoice]
+    :param max_workers: The number of processes to parse the invoices with.
+    :type max_workers: int, optional
+    :return: The result for each invoice, keyed by its id. Invoices whose
+        attachment could not be read have no result.
+    :rtype: Dict[int, ParseResult]
+    """
+    with tempfile.TemporaryDirectory(prefix="reparse_") as directory:
+        # Maps the path of each attachment to its invoice.
+        paths = {}
+        for invoice in invoices:
+            try:
+                path = attachments.local_path(invoice.attachment, directory)
+            except Exception:
+                logger.exception("Failed to read invoice %s.", invoice.pk)
+                continue
+            paths[path] = invoice
+        results = parse_for_supplier.parse_many(
+            [(path, invoice.supplier.name) for path, invoice in paths.items()],
+            max_workers=max_workers,
+        )
+        return {paths[result.filepath].id: result for result in results}
+
+
+def reparse(
+    checkpoint: str = DEFAULT_CHECKPOINT,
+    suppliers: _t.Optional[_t.Iterable[str]] = None,
+    date_from: _t.Optional[date] = None,
+    date_to: _t.Optional[date] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_workers: _t.Optional[int] = None,
+    restart: bool = False,
+    on_batch: _t.Optional[_t.Callable[[ReparseCheckpoint], _t.Any]] = None,
+) -> ReparseCheckpoint:
+    """Reparses the invoices selected by `stale_invoices`, replacing their
+    parsed data and items. Where an invoice fails to parse, it is left as it
+    was.
+
+    :param checkpoint: The name of the checkpoint to resume from and record
+        progress on, defaults to `DEFAULT_CHECKPOINT`.
+    :type checkpoint: str, optional
+    :param suppliers: See `stale_invoices`.
+    :type suppliers: Iterable[str], optional
+    :param date_from: See `stale_invoices`.
+    :type date_from: date, optional
+    :param date_to: See `stale_invoices`.
+    :type date_to: date, optional
+    :param batch_size: The number of invoices to parse and save at a time,
+        defaults to `DEFAULT_BATCH_SIZE`.
+    :type batch_size: int, optional
+    :param max_workers: The number of processes to parse the invoices with.
+    :type max_workers: int, optional
+    :param restart: Should the checkpoint be discarded, starting from the
+        first invoice? Defaults to False.
+    :type restart: bool, optional
+    :param on_batch: Called with the checkpoint after each batch is saved.
+    :type on_batch: Callable[[ReparseCheckpoint], Any], optional
+    :return: The checkpoint, which is deleted once the run is complete.
+    :rtype: ReparseCheckpoint
+    """
+    progress, created = ReparseCheckpoint.objects.get_or_create(
+        name=checkpoint
+    )
+    if restart and not created:
+        progress.last_invoice_id = progress.reparsed = progress.failed = 0
+        progress.save()
+
+    # Streamed with a server-side cursor where the database supports it.
+    invoices = (
+        stale_invoices(suppliers, date_from, date_to)
+        .filter(id__gt=progress.last_invoice_id)
+        .iterator(chunk_size=batch_size)
+    )
+    while True:
+        batch = list(islice(invoices, batch_size))
+        if not batch:
+            break
+        results = parse_batch(batch, max_workers)
+        parsed = [
+            invoice
+            for invoice in batch
+            if invoice.id in results and results[invoice.id].ok
+        ]
+        with transaction.atomic():
+            InvoiceItem.objects.filter(invoice__in=parsed).delete()
+            for invoice in parsed:
+                ingest.save_parse_result(invoice, results[invoice.id])
+            progress.last_invoice_id = batch[-1].id
+            progress.reparsed += len(parsed)
+            progress.failed += len(batch) - len(parsed)
+            progress.save()
+        if on_batch is not None:
+            on_batch(progress)
+
+    progress.delete()
+    return progress
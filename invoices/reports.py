@@ -0,0 +1,222 @@
+"""Reports on what users have spent.
+
+Spend is grouped by supplier, category and the month the invoice was placed.
+Reports are read from `SpendRollup`, which `invoices.rollups` keeps up to
+date, so a report reads a row for each supplier, category and month rather
+than every item. As rollups are monthly, where a report is limited to a
+range of dates which starts or ends part way through a month, the spend in
+that month is totalled from the items of the invoices within the range.
+
+Reports are cached until the user's rollups change. The cache key includes
+the latest `SpendRollup.date_modified` of the user's rollups, which changes
+whenever a slice of them is recalculated, along with the number of rollups,
+which changes whenever one is dropped. Checking the key costs a single
+aggregate query over the user's rollups. Reports also carry the names of
+suppliers and categories, so the key includes a version, kept in the cache,
+which `invalidate_names` moves on whenever a supplier or category is saved
+or deleted.
+"""
+
+import typing as _t
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, F, Max, QuerySet, Sum
+from django.db.models.functions import TruncMonth
+from . import rollups
+from .models import InvoiceItem, SpendRollup
+
+CACHE_KEY_PREFIX = "spend-report"
+NAMES_VERSION_KEY = f"{CACHE_KEY_PREFIX}:names-version"
+
+
+def user_rollups(user: _t.Optional[User] = None) -> QuerySet:
+    """Returns the rollups of the invoices a user has access to, as
+    `PermModelAdmin` does for the admin. Superusers have access to every
+    invoice.
+
+    :param user: The user, defaults to every rollup.
+    :type user: Optional[User]
+    :return: The rollups.
+    :rtype: QuerySet
+    """
+    qs = SpendRollup.objects.all()
+    if user is None or user.is_superuser:
+        return qs
+    return qs.filter(user_id=user.id)
+
+
+def _item_spend(
+    user: _t.Optional[User],
+    date_from: date,
+    date_to: date,
+) -> _t.List[_t.Dict[str, _t.Any]]:
+    """Reports the spend on the items of a user's invoices ordered between
+    two dates, totalled from the items rather than the rollups.
+    """
+    items = InvoiceItem.objects.filter(
+        invoice__date_ordered__gte=date_from,
+        invoice__date_ordered__lte=date_to,
+    )
+    if user is not None and not user.is_superuser:
+        items = items.filter(invoice__user_id=user.id)
+    return list(
+        items.values(
+            "category_id",
+            month=TruncMonth("invoice__date_ordered"),
+            supplier_id=F("invoice__supplier_id"),
+            supplier_name=F("invoice__supplier__name"),
+            category_name=F("category__name"),
+        )
+        .annotate(**rollups.item_totals())
+        .order_by("month", "supplier_name", "category_name")
+    )
+
+
+def spend(
+    user: _t.Optional[User] = None,
+    date_from: _t.Optional[date] = None,
+    date_to: _t.Optional[date] = None,
+) -> _t.List[_t.Dict[str, _t.Any]]:
+    """Reports the spend on the items of a user's invoices, by supplier,
+    category and month. Whole months are read from the rollups, while the
+    spend in a month the dates start or end part way through is totalled
+    from its items.
+
+    :param user: The user whose invoices to report on, defaults to every
+        invoice. Superusers are reported on every invoice.
+    :type user: Optional[User]
+    :param date_from: Only report on invoices ordered on or after this date.
+    :type date_from: Optional[date]
+    :param date_to: Only report on invoices ordered on or before this date.
+    :type date_to: Optional[date]
+    :return: A row for each supplier, category and month, in order of month,
+        with the `total_ex_vat` and `vat` spent, the `item_count` and the
+        total `quantity` of the items.
+    :rtype: List[Dict[str, Any]]
+    """
+    if date_from is not None and date_to is not None and date_from > date_to:
+        return []
+    first, last = [], []
+    qs = user_rollups(user)
+    if date_from is not None:
+        if date_from.day != 1:
+            end = rollups.next_month(date_from) - timedelta(days=1)
+            if date_to is not None:
+                end = min(end, date_to)
+            first = _item_spend(user, date_from, end)
+        qs = qs.filter(month__gte=date_from)
+    if date_to is not None:
+        next_month = rollups.next_month(date_to)
+        if next_month - timedelta(days=1) != date_to:
+            start = rollups.month_of(date_to)
+            if date_from is None or date_from < start:
+                last = _item_spend(user, start, date_to)
+            next_month = start
+        qs = qs.filter(month__lt=next_month)
+    return (
+        first
+        + list(
+            qs.values(
+                "month",
+                "supplier_id",
+                "category_id",
+                supplier_name=F("supplier__name"),
+                category_name=F("category__name"),
+            )
+            .annotate(
+                **{field: Sum(field) for field in rollups.TOTAL_FIELDS},
+            )
+            .order_by("month", "supplier_name", "category_name")
+        )
+        + last
+    )
+
+
+def names_version() -> int:
+    """Returns the version of the names of suppliers and categories which
+    cached reports carry.
+
+    :return: The version.
+    :rtype: int
+    """
+    cache = caches[settings.REPORT_CACHE_ALIAS]
+    # A version lost from the cache starts again from a value no earlier
+    # version could have had, rather than from 0.
+    cache.add(NAMES_VERSION_KEY, time.time_ns(), None)
+    return cache.get(NAMES_VERSION_KEY, 0)
+
+
+def invalidate_names():
+    """Moves on the version of the names in cached reports once the current
+    transaction, if any, commits, so that reports are read again with the
+    names of suppliers and categories as they now are.
+    """
+
+    def bump():
+        cache = caches[settings.REPORT_CACHE_ALIAS]
+        try:
+            cache.incr(NAMES_VERSION_KEY)
+        except ValueError:
+            cache.set(NAMES_VERSION_KEY, time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def cache_key(
+    user: _t.Optional[User] = None,
+    date_from: _t.Optional[date] = None,
+    date_to: _t.Optional[date] = None,
+) -> str:
+    """Returns the key a spend report is cached under, which changes
+    whenever any of the rollups it reports on do, or the name of any
+    supplier or category.
+
+    :param user: The user whose invoices are reported on.
+    :type user: Optional[User]
+    :param date_from: The earliest date reported on.
+    :type date_from: Optional[date]
+    :param date_to: The latest date reported on.
+    :type date_to: Optional[date]
+    :return: The cache key.
+    :rtype: str
+    """
+    latest = user_rollups(user).aggregate(
+        modified=Max("date_modified"),
+        count=Count("id"),
+    )
+    scope = "all" if user is None or user.is_superuser else user.id
+    modified = latest["modified"].timestamp() if latest["modified"] else 0
+    return (
+        f"{CACHE_KEY_PREFIX}:{scope}:{date_from}:{date_to}:"
+        f"{latest['count']}:{modified}:{names_version()}"
+    )
+
+
+def cached_spend(
+    user: _t.Optional[User] = None,
+    date_from: _t.Optional[date] = None,
+    date_to: _t.Optional[date] = None,
+) -> _t.List[_t.Dict[str, _t.Any]]:
+    """Returns the spend report of `spend`, from the cache where the user's
+    rollups have not changed since it was read.
+
+    :param user: The user whose invoices to report on.
+    :type user: Optional[User]
+    :param date_from: Only report on the months on or after this date's.
+    :type date_from: Optional[date]
+    :param date_to: Only report on the months on or before this date's.
+    :type date_to: Optional[date]
+    :return: The report.
+    :rtype: List[Dict[str, Any]]
+    """
+    cache = caches[settings.REPORT_CACHE_ALIAS]
+    key = cache_key(user, date_from, date_to)
+    report = cache.get(key)
+    if report is None:
+        report = spend(user, date_from, date_to)
+        cache.set(key, report, settings.REPORT_CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,377 @@
+"""Keeps `SpendRollup`, the spend on each user's items by supplier, category
+and month, up to date as invoices and items change.
+
+Rather than adjusting totals by the difference each change makes, which
+would go wrong for changes made without signals such as the items added by
+`bulk_create` when an invoice is parsed, a change marks the slice of rollups
+it affects, i.e: those of the invoice's user, supplier and month, as dirty.
+Once the transaction commits, each dirty slice is recalculated from its
+items, once however many changes were made to it, and the invoices whose
+items changed are marked as modified, once each. A slice is a single
+month of a single supplier, so recalculating it reads only a handful of
+invoices.
+
+The rollups of a user are recalculated under a lock on the user, so that two
+processes do not write the same rollups at once. Should they ever drift, e.g:
+after changes made with `QuerySet.update`, `check` reports the rollups which
+differ from the items and `rebuild` recalculates them from scratch. Both are
+run by the `rebuild_rollups` command.
+"""
+
+import typing as _t
+import logging
+import threading
+from datetime import date, timedelta
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Func, QuerySet, Sum
+from django.db.models.functions import NullIf, Round, TruncMonth
+from django.utils import timezone
+from .models import Invoice, InvoiceItem, SpendRollup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+# The fields of an invoice which place it in a slice, and all those which
+# affect its rollups.
+KEY_FIELDS = ("user_id", "supplier_id", "date_ordered")
+ROLLUP_FIELDS = frozenset([*KEY_FIELDS, "subtotal", "vat"])
+# The fields of a rollup which are totalled.
+TOTAL_FIELDS = ("total_ex_vat", "vat", "item_count", "quantity")
+
+
+class SliceKey(_t.NamedTuple):
+    """Identifies the rollups of a user's items from a supplier in a
+    month.
+    """
+
+    user_id: int
+    supplier_id: int
+    month: _t.Optional[date]
+
+
+class Mismatch(_t.NamedTuple):
+    """A rollup which differs from the items it totals."""
+
+    user_id: int
+    supplier_id: int
+    category_id: _t.Optional[int]
+    month: _t.Optional[date]
+    # The totals of the items, and of the rollups, or `None` where there
+    # are none.
+    expected: _t.Optional[_t.Dict[str, _t.Any]]
+    actual: _t.Optional[_t.Dict[str, _t.Any]]
+
+
+class _Divide(Func):
+    """Divides one decimal by another. SQLite stores whole decimals as
+    integers, and so would divide them as integers, unless the dividend is
+    first made a real.
+    """
+
+    arg_joiner = " / "
+    template = "(%(expressions)s)"
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            arg_joiner=" * 1.0 / ",
+            **extra_context,
+        )
+
+
+def month_of(day: _t.Optional[date]) -> _t.Optional[date]:
+    """Returns the first day of the month of a date."""
+    return day.replace(day=1) if day is not None else None
+
+
+def next_month(day: date) -> date:
+    """Returns the first day of the month after that of a date."""
+    return month_of(day.replace(day=28) + timedelta(days=4))
+
+
+def item_totals() -> _t.Dict[str, _t.Any]:
+    """Returns the aggregates which total items into each of the
+    `TOTAL_FIELDS` of a rollup.
+
+    Invoices record VAT as a whole, so the VAT on each item is its share of
+    the invoice's VAT, in proportion to its price.
+
+    :return: The aggregate of each field.
+    :rtype: Dict[str, Any]
+    """
+    item_vat = _Divide(
+        F("price_ex_vat") * F("invoice__vat"),
+        NullIf("invoice__subtotal", 0),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    return {
+        "total_ex_vat": Sum("price_ex_vat"),
+        "vat": Round(Sum(item_vat), 2),
+        "item_count": Count("id"),
+        "quantity": Sum("quantity"),
+    }
+
+
+def aggregate(items: QuerySet) -> QuerySet:
+    """Totals items by user, supplier, category and month in the database.
+
+    :param items: The items to total.
+    :type items: QuerySet
+    :return: The values of a rollup for each user, supplier, category and
+        month.
+    :rtype: QuerySet
+    """
+    return (
+        items.values(
+            "category_id",
+            user_id=F("invoice__user_id"),
+            supplier_id=F("invoice__supplier_id"),
+            month=TruncMonth("invoice__date_ordered"),
+        )
+        .annotate(**item_totals())
+        .order_by()
+    )
+
+
+def _slice_items(key: SliceKey) -> QuerySet:
+    """Returns the items in a slice."""
+    items = InvoiceItem.objects.filter(
+        invoice__user_id=key.user_id,
+        invoice__supplier_id=key.supplier_id,
+    )
+    if key.month is None:
+        return items.filter(invoice__date_ordered__isnull=True)
+    return items.filter(
+        invoice__date_ordered__gte=key.month,
+        invoice__date_ordered__lt=next_month(key.month),
+    )
+
+
+def _lock_users(user_ids: _t.Iterable[int]):
+    """Locks users until the end of the transaction, in order of id so that
+    processes locking several users at once do not deadlock.
+    """
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=user_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def refresh(keys: _t.Iterable[SliceKey]):
+    """Recalculates the rollups of slices from their items.
+
+    :param keys: The slices to recalculate.
+    :type keys: Iterable[SliceKey]
+    """
+    for key in sorted(
+        set(keys),
+        key=lambda k: (k.user_id, k.supplier_id, k.month or date.min),
+    ):
+        with transaction.atomic():
+            _lock_users([key.user_id])
+            SpendRollup.objects.filter(
+                user_id=key.user_id,
+                supplier_id=key.supplier_id,
+                month=key.month,
+            ).delete()
+            SpendRollup.objects.bulk_create(
+                SpendRollup(**values)
+                for values in aggregate(_slice_items(key))
+            )
+
+
+class _Pending(threading.local):
+    """The slices marked as dirty in this thread which are yet to be
+    recalculated, along with the invoices whose slices are to be looked up
+    and those to be marked as modified once the transaction commits.
+    """
+
+    def __init__(self):
+        self.keys: _t.Set[SliceKey] = set()
+        self.invoice_ids: _t.Set[int] = set()
+        self.modified_ids: _t.Set[int] = set()
+
+
+_pending = _Pending()
+
+
+def mark_dirty(
+    keys: _t.Iterable[SliceKey] = (),
+    invoice_ids: _t.Iterable[int] = (),
+    modified_ids: _t.Iterable[int] = (),
+):
+    """Marks slices as dirty, to be recalculated once the current
+    transaction commits, or straight away outside of a transaction.
+
+    Slices marked in a transaction which is rolled back are recalculated
+    along with those of the next transaction to commit, which is harmless.
+
+    :param keys: The slices.
+    :type keys: Iterable[SliceKey]
+    :param invoice_ids: The ids of invoices whose current slices are dirty.
+    :type invoice_ids: Iterable[int]
+    :param modified_ids: The ids of invoices whose `date_modified` is to be
+        updated, as their items changed.
+    :type modified_ids: Iterable[int]
+    """
+    _pending.keys.update(keys)
+    _pending.invoice_ids.update(invoice_ids)
+    _pending.modified_ids.update(modified_ids)
+    transaction.on_commit(flush)
+
+
+def invoice_keys(invoices: QuerySet) -> _t.Set[SliceKey]:
+    """Returns the slices of invoices.
+
+    :param invoices: The invoices.
+    :type invoices: QuerySet
+    :return: The slices.
+    :rtype: Set[SliceKey]
+    """
+    return {
+        SliceKey(*values)
+        for values in invoices.annotate(
+            month=TruncMonth("date_ordered")
+        ).values_list("user_id", "supplier_id", "month")
+    }
+
+
+def flush():
+    """Marks the invoices whose items changed as modified and recalculates
+    the slices marked as dirty. Errors are logged rather than raised, as the
+    changes which marked the slices have already been committed, and the
+    rollups are left to be rebuilt.
+    """
+    keys, _pending.keys = _pending.keys, set()
+    invoice_ids, _pending.invoice_ids = _pending.invoice_ids, set()
+    modified_ids, _pending.modified_ids = _pending.modified_ids, set()
+    if modified_ids:
+        Invoice.objects.filter(pk__in=modified_ids).update(
+            date_modified=timezone.now()
+        )
+    if not keys and not invoice_ids:
+        return
+    try:
+        if invoice_ids:
+            keys |= invoice_keys(Invoice.objects.filter(pk__in=invoice_ids))
+        refresh(keys)
+    except Exception:
+        logger.exception(
+            "Failed to update spend rollups, run `rebuild_rollups`."
+        )
+
+
+def _batches(
+    user_ids: _t.Optional[_t.Iterable[int]],
+    batch_size: int,
+) -> _t.Iterator[_t.List[int]]:
+    """Yields the ids of the users with invoices, or of the given users, a
+    batch at a time.
+    """
+    if user_ids is None:
+        user_ids = (
+            Invoice.objects.order_by("user_id")
+            .values_list("user_id", flat=True)
+            .distinct()
+        )
+    user_ids = iter(sorted(set(user_ids)))
+    while True:
+        batch = list(islice(user_ids, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def rebuild(
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_batch: _t.Optional[_t.Callable[[int, int], None]] = None,
+) -> _t.Tuple[int, int]:
+    """Recalculates every rollup from the items, a batch of users at a
+    time. Each batch is replaced in a single transaction, so reports read
+    either the old or the new rollups of a user, never a mix.
+
+    :param batch_size: The number of users to recalculate at a time.
+    :type batch_size: int
+    :param on_batch: Called with the number of users and rollups written
+        so far after each batch.
+    :type on_batch: Callable[[int, int], None], optional
+    :return: The number of users and rollups written.
+    :rtype: Tuple[int, int]
+    """
+    users = rollups = 0
+    for batch in _batches(None, batch_size):
+        with transaction.atomic():
+            _lock_users(batch)
+            SpendRollup.objects.filter(user_id__in=batch).delete()
+            created = SpendRollup.objects.bulk_create(
+                SpendRollup(**values)
+                for values in aggregate(
+                    InvoiceItem.objects.filter(invoice__user_id__in=batch)
+                )
+            )
+        users += len(batch)
+        rollups += len(created)
+        if on_batch is not None:
+            on_batch(users, rollups)
+
+    # Drops the rollups of users who no longer have any invoices.
+    SpendRollup.objects.exclude(
+        user_id__in=Invoice.objects.values("user_id")
+    ).delete()
+    return users, rollups
+
+
+def check(
+    user_ids: _t.Optional[_t.Iterable[int]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> _t.Iterator[Mismatch]:
+    """Compares the rollups with the items they total, a batch of users at
+    a time, yielding those which differ.
+
+    :param user_ids: The users whose rollups to check, defaults to every
+        user with invoices or rollups.
+    :type user_ids: Iterable[int], optional
+    :param batch_size: The number of users to check at a time.
+    :type batch_size: int
+    :return: An iterator over the rollups which differ.
+    :rtype: Iterator[Mismatch]
+    """
+    if user_ids is None:
+        user_ids = {
+            *Invoice.objects.values_list("user_id", flat=True),
+            *SpendRollup.objects.values_list("user_id", flat=True),
+        }
+
+    def by_key(rows: QuerySet) -> _t.Dict[tuple, _t.Dict[str, _t.Any]]:
+        return {
+            (
+                row["user_id"],
+                row["supplier_id"],
+                row["category_id"],
+                row["month"],
+            ): {field: row[field] for field in TOTAL_FIELDS}
+            for row in rows
+        }
+
+    for batch in _batches(user_ids, batch_size):
+        expected = by_key(
+            aggregate(InvoiceItem.objects.filter(invoice__user_id__in=batch))
+        )
+        actual = by_key(
+            SpendRollup.objects.filter(user_id__in=batch)
+            .values("user_id", "supplier_id", "category_id", "month")
+            .annotate(**{field: Sum(field) for field in TOTAL_FIELDS})
+            .order_by()
+        )
+        for key in sorted(
+            expected.keys() | actual.keys(),
+            key=lambda k: (k[0], k[1], k[2] or 0, k[3] or date.min),
+        ):
+            if expected.get(key) != actual.get(key):
+                yield Mismatch(*key, expected.get(key), actual.get(key))
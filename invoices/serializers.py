@@ -0,0 +1,80 @@
+"""Serializers for the invoices API."""
+
+from rest_framework import serializers
+from core.api import SparseFieldsMixin
+from . import models as invoice_models
+
+
+class InvoiceItemSerializer(serializers.ModelSerializer):
+    """Serializes an invoice item along with the names of its product and
+    category.
+    """
+
+    product_name = serializers.CharField(source="product.name")
+    category_name = serializers.CharField(
+        source="category.name",
+        allow_null=True,
+    )
+
+    class Meta:
+        model = invoice_models.InvoiceItem
+        fields = [
+            "id",
+            "invoice",
+            "product",
+            "product_name",
+            "quantity",
+            "price_ex_vat",
+            "category",
+            "category_name",
+        ]
+
+
+class InvoiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Serializes an invoice along with its items. The fields may be
+    narrowed with the `fields` argument.
+    """
+
+    supplier_name = serializers.CharField(source="supplier.name")
+    items = InvoiceItemSerializer(many=True)
+
+    class Meta:
+        model = invoice_models.Invoice
+        fields = [
+            "id",
+            "supplier",
+            "supplier_name",
+            "date_ordered",
+            "date_added",
+            "order_number",
+            "subtotal",
+            "vat",
+            "delivery",
+            "promotion",
+            "total",
+            "parse_status",
+            "attachment",
+            "items",
+        ]
+
+
+class SpendSerializer(serializers.Serializer):
+    """Serializes a row of the spend report, see `reports.spend`."""
+
+    month = serializers.DateField(allow_null=True)
+    supplier_id = serializers.IntegerField()
+    supplier_name = serializers.CharField()
+    category_id = serializers.IntegerField(allow_null=True)
+    category_name = serializers.CharField(allow_null=True)
+    total_ex_vat = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        allow_null=True,
+    )
+    vat = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        allow_null=True,
+    )
+    item_count = serializers.IntegerField()
+    quantity = serializers.IntegerField(allow_null=True)
@@ -0,0 +1,123 @@
+import typing as _t
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from products.models import ProductCategory
+from suppliers.models import Supplier
+from . import reports, rollups
+from .models import Invoice, InvoiceItem
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+def on_item_change(sender, instance: InvoiceItem, **kwargs):
+    """When an item is changed, mark its invoice as modified and its
+    rollups as dirty, once the transaction commits.
+    """
+    invoice_ids = {instance.invoice_id}
+    if getattr(instance, "_old_invoice_id", None) is not None:
+        invoice_ids.add(instance._old_invoice_id)
+    rollups.mark_dirty(invoice_ids=invoice_ids, modified_ids=invoice_ids)
+
+
+@receiver(pre_save, sender=InvoiceItem)
+def on_item_pre_save(sender, instance: InvoiceItem, **kwargs):
+    """Before an item is changed, remember the invoice it was on, in case
+    it is being moved to another.
+    """
+    if not instance._state.adding:
+        instance._old_invoice_id = (
+            InvoiceItem.objects.filter(pk=instance.pk)
+            .values_list("invoice_id", flat=True)
+            .first()
+        )
+
+
+def _saved_fields(update_fields) -> _t.Set[str]:
+    """Returns the attribute names of the fields of an invoice being saved."""
+    if update_fields is None:
+        return {field.attname for field in Invoice._meta.concrete_fields}
+    return {Invoice._meta.get_field(name).attname for name in update_fields}
+
+
+@receiver(pre_save, sender=Invoice)
+def on_invoice_pre_save(
+    sender,
+    instance: Invoice,
+    update_fields=None,
+    **kwargs,
+):
+    """Before an invoice is changed in a way which affects its rollups,
+    remember the slice it was in, which it may be leaving. The slice is
+    known from the values last loaded or saved, where there are any.
+    """
+    instance._old_rollup_keys = set()
+    if instance._state.adding or not (
+        rollups.ROLLUP_FIELDS & _saved_fields(update_fields)
+    ):
+        return
+    loaded = getattr(instance, "_loaded_values", {})
+    if all(field in loaded for field in rollups.KEY_FIELDS):
+        instance._old_rollup_keys = {
+            rollups.SliceKey(
+                loaded["user_id"],
+                loaded["supplier_id"],
+                rollups.month_of(loaded["date_ordered"]),
+            )
+        }
+    else:
+        instance._old_rollup_keys = rollups.invoice_keys(
+            Invoice.objects.filter(pk=instance.pk)
+        )
+
+
+@receiver(post_save, sender=Invoice)
+def on_invoice_change(
+    sender,
+    instance: Invoice,
+    update_fields=None,
+    **kwargs,
+):
+    """When an invoice is changed in a way which affects its rollups, mark
+    the slices it left and joined as dirty.
+    """
+    saved = _saved_fields(update_fields)
+    if not rollups.ROLLUP_FIELDS & saved:
+        return
+    instance._loaded_values = {
+        **getattr(instance, "_loaded_values", {}),
+        **{
+            field: getattr(instance, field)
+            for field in rollups.KEY_FIELDS
+            if field in saved
+        },
+    }
+    rollups.mark_dirty(
+        keys=instance._old_rollup_keys,
+        invoice_ids=[instance.pk],
+    )
+
+
+@receiver(post_delete, sender=Invoice)
+def on_invoice_delete(sender, instance: Invoice, **kwargs):
+    """When an invoice is deleted, mark the slice it was in as dirty."""
+    rollups.mark_dirty(
+        keys=[
+            rollups.SliceKey(
+                instance.user_id,
+                instance.supplier_id,
+                rollups.month_of(instance.date_ordered),
+            )
+        ]
+    )
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def on_name_change(sender, instance, created: bool = False, **kwargs):
+    """When a supplier or category is changed or deleted, drop the cached
+    reports which may carry its old name.
+    """
+    if not created:
+        reports.invalidate_names()
@@ -0,0 +1,305 @@
+"""Tests for the `api` module."""
+
+import json
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from products import models as product_models
+from suppliers import models as supplier_models
+from .. import api as invoice_api, models as invoice_models
+
+
+class BaseApiTestCase(TestCase):
+    """Base test class for the API tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(supplier_models.Supplier)
+
+    def setUp(self):
+        """Set up the test."""
+        self.client.force_login(self.user)
+
+    def make_invoices(self, dates: list, user: User = None) -> list:
+        """Makes an invoice ordered on each date for the user."""
+        return [
+            baker.make(
+                invoice_models.Invoice,
+                user=user or self.user,
+                supplier=self.supplier,
+                date_ordered=date_ordered,
+            )
+            for date_ordered in dates
+        ]
+
+    def get_all(self, url: str) -> list:
+        """Follows the `next` links from `url`, returning every result."""
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.json()["results"])
+            url = response.json()["next"]
+        return results
+
+
+class TestInvoiceViewSet(BaseApiTestCase):
+    """Tests for the `InvoiceViewSet` class."""
+
+    def test_scoped_to_user(self):
+        """Test that users only see their own invoices."""
+        invoices = self.make_invoices([date(2022, 1, 1)])
+        self.make_invoices([date(2022, 1, 1)], baker.make(User))
+        response = self.client.get(reverse("invoices:invoice-list"))
+        self.assertEqual(
+            [invoice["id"] for invoice in response.json()["results"]],
+            [invoices[0].id],
+        )
+
+    def test_superuser(self):
+        """Test that superusers see every invoice."""
+        self.make_invoices([date(2022, 1, 1)])
+        self.make_invoices([date(2022, 1, 1)], baker.make(User))
+        self.client.force_login(baker.make(User, is_superuser=True))
+        response = self.client.get(reverse("invoices:invoice-list"))
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_unauthenticated(self):
+        """Test that the API requires a user."""
+        self.client.logout()
+        response = self.client.get(reverse("invoices:invoice-list"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_retrieve(self):
+        """Test that an invoice is returned with its items where they are
+        included.
+        """
+        invoice = self.make_invoices([date(2022, 1, 1)])[0]
+        item = baker.make(
+            invoice_models.InvoiceItem,
+            invoice=invoice,
+            price_ex_vat=Decimal("1.50"),
+            category=None,
+        )
+        url = reverse("invoices:invoice-detail", kwargs={"pk": invoice.id})
+        self.assertNotIn("items", self.client.get(url).json())
+        body = self.client.get(url + "?include=items").json()
+        self.assertEqual(body["supplier_name"], self.supplier.name)
+        self.assertEqual(
+            body["items"],
+            [
+                {
+                    "id": item.id,
+                    "invoice": invoice.id,
+                    "product": item.product_id,
+                    "product_name": item.product.name,
+                    "quantity": item.quantity,
+                    "price_ex_vat": "1.50",
+                    "category": None,
+                    "category_name": None,
+                }
+            ],
+        )
+
+    def test_pagination(self):
+        """Test that paging through the invoices returns each once, most
+        recently ordered first, after those without a date.
+        """
+        invoices = self.make_invoices(
+            [
+                date(2022, 1, 1),
+                None,
+                date(2022, 3, 1),
+                date(2022, 1, 1),
+                None,
+                date(2022, 2, 1),
+                date(2022, 1, 1),
+            ]
+        )
+        expected = sorted(
+            invoices,
+            key=lambda i: (i.date_ordered is None, i.date_ordered, i.id),
+            reverse=True,
+        )
+        results = self.get_all(
+            reverse("invoices:invoice-list") + "?page_size=2"
+        )
+        self.assertEqual(
+            [invoice["id"] for invoice in results],
+            [invoice.id for invoice in expected],
+        )
+
+    def test_invalid_cursor(self):
+        """Test that an invalid cursor is not found."""
+        response = self.client.get(
+            reverse("invoices:invoice-list") + "?cursor=invalid"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_constant_queries(self):
+        """Test that the number of queries does not depend on the number of
+        invoices or items on a page.
+        """
+        category = baker.make(product_models.ProductCategory)
+
+        def count_queries(n: int) -> int:
+            invoice_models.Invoice.objects.all().delete()
+            for invoice in self.make_invoices([date(2022, 1, 1)] * n):
+                baker.make(
+                    invoice_models.InvoiceItem,
+                    invoice=invoice,
+                    category=category,
+                    _quantity=2,
+                )
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse("invoices:invoice-list")
+                    + "?page_size=500&include=items"
+                )
+            self.assertEqual(len(response.json()["results"]), n)
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_fields(self):
+        """Test that only the requested fields are returned and selected."""
+        self.make_invoices([date(2022, 1, 1)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("invoices:invoice-list") + "?fields=id,total"
+            )
+        self.assertEqual(
+            list(response.json()["results"][0]),
+            ["id", "total"],
+        )
+        select = next(
+            query["sql"]
+            for query in queries
+            if 'FROM "invoice"' in query["sql"]
+        )
+        self.assertNotIn('"invoice"."attachment"', select)
+        self.assertNotIn('"supplier"', select)
+
+    def test_unknown_field(self):
+        """Test that requesting an unknown field is a bad request."""
+        response = self.client.get(
+            reverse("invoices:invoice-list") + "?fields=id,user"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"fields": "Unknown fields: user."},
+        )
+
+
+class TestInvoiceExport(BaseApiTestCase):
+    """Tests for the invoice export."""
+
+    def export(self, query: str = "") -> list:
+        """Exports the invoices, checking that the response is streamed."""
+        response = self.client.get(reverse("invoices:invoice-export") + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_export(self):
+        """Test that every invoice is exported, in the order of the list."""
+        invoices = self.make_invoices(
+            [date(2022, 1, 1), None, date(2022, 3, 1), date(2022, 1, 1)]
+        )
+        self.make_invoices([date(2022, 1, 1)], baker.make(User))
+        with mock.patch.object(invoice_api, "EXPORT_CHUNK_SIZE", 3):
+            results = self.export()
+        self.assertEqual(
+            [invoice["id"] for invoice in results],
+            [
+                invoice["id"]
+                for invoice in self.get_all(reverse("invoices:invoice-list"))
+            ],
+        )
+        self.assertEqual(len(results), len(invoices))
+
+    def test_empty(self):
+        """Test that an empty array is exported where there are no
+        invoices.
+        """
+        self.assertEqual(self.export(), [])
+
+    def test_fields(self):
+        """Test that the fields may be narrowed and items included."""
+        invoice = self.make_invoices([date(2022, 1, 1)])[0]
+        item = baker.make(invoice_models.InvoiceItem, invoice=invoice)
+        self.assertEqual(
+            self.export("?fields=id&include=items"),
+            [
+                {
+                    "id": invoice.id,
+                    "items": [
+                        invoice_api.serializers.InvoiceItemSerializer(
+                            item
+                        ).data
+                    ],
+                }
+            ],
+        )
+
+    def test_queries_per_chunk(self):
+        """Test that the number of queries grows with the number of chunks
+        rather than the number of invoices or items.
+        """
+
+        def count_queries(n: int) -> int:
+            invoice_models.Invoice.objects.all().delete()
+            for invoice in self.make_invoices([date(2022, 1, 1)] * n):
+                baker.make(
+                    invoice_models.InvoiceItem,
+                    invoice=invoice,
+                    _quantity=2,
+                )
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.export("?include=items")), n)
+            return len(queries)
+
+        with mock.patch.object(invoice_api, "EXPORT_CHUNK_SIZE", 10):
+            self.assertEqual(count_queries(2), count_queries(10))
+            self.assertLess(count_queries(10), count_queries(11))
+
+
+class TestInvoiceItemViewSet(BaseApiTestCase):
+    """Tests for the `InvoiceItemViewSet` class."""
+
+    def test_scoped_to_user(self):
+        """Test that users only see the items on their own invoices, and
+        that they may be filtered by invoice.
+        """
+        first, second = self.make_invoices([date(2022, 1, 1)] * 2)
+        items = baker.make(invoice_models.InvoiceItem, invoice=first)
+        baker.make(invoice_models.InvoiceItem, invoice=second)
+        baker.make(
+            invoice_models.InvoiceItem,
+            invoice=self.make_invoices([None], baker.make(User))[0],
+        )
+
+        self.assertEqual(
+            len(self.get_all(reverse("invoices:item-list"))),
+            2,
+        )
+        self.assertEqual(
+            [
+                item["id"]
+                for item in self.get_all(
+                    reverse("invoices:item-list") + f"?invoice={first.id}"
+                )
+            ],
+            [items.id],
+        )
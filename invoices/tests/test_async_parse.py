@@ -0,0 +1,203 @@
+"""Tests for the `async_parse` module and the async upload view."""
+
+import os
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from parser.parse_for_supplier import ParseResult
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import async_parse, jobs, models as invoice_models
+
+JobStatus = invoice_models.JobStatus
+ParseStatus = invoice_models.ParseStatus
+INVOICE_FP = os.path.join("invoices", "tests", "soak_rochford_invoice.pdf")
+
+
+@override_settings(ASYNC_PARSE_WORKERS=1, ASYNC_PARSE_WAIT=1)
+class BaseAsyncParseTestCase(TestCase):
+    """Base test class for the async parse tests. Invoices are parsed in a
+    thread rather than another process.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the executor."""
+        super().setUpClass()
+        cls.executor = futures.ThreadPoolExecutor(max_workers=1)
+        cls.addClassCleanup(cls.executor.shutdown)
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        baker.make(
+            supplier_models.UserSupplier,
+            user=cls.user,
+            supplier=cls.supplier,
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+        patcher = patch.object(
+            async_parse,
+            "executor",
+            return_value=self.executor,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_job(self) -> invoice_models.ParseJob:
+        """Returns a job to parse a Soak Rochford invoice."""
+        with open(INVOICE_FP, "rb") as f:
+            attachment = SimpleUploadedFile("test.pdf", f.read())
+        invoice = baker.make(
+            invoice_models.Invoice,
+            user=self.user,
+            supplier=self.supplier,
+            attachment=attachment,
+        )
+        return invoice_models.ParseJob.enqueue(invoice)
+
+
+class TestParse(BaseAsyncParseTestCase):
+    """Tests for the `parse` function."""
+
+    def test_parse(self):
+        """Test that the job is claimed and its invoice parsed."""
+        job = self.make_job()
+        parsed = async_to_sync(async_parse.parse)(job)
+        self.assertEqual(parsed.status, JobStatus.SUCCEEDED)
+        self.assertEqual(parsed.invoice.parse_status, ParseStatus.PARSED)
+        self.assertTrue(parsed.invoice.items.exists())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.SUCCEEDED)
+        self.assertEqual(job.locked_by, async_parse._worker())
+
+    def test_parse_error(self):
+        """Test that a job whose invoice fails to parse is queued to be
+        retried.
+        """
+        job = self.make_job()
+        with patch(
+            "parser.parse_for_supplier.parse_to_result",
+            return_value=ParseResult(
+                None,
+                "Soak Rochford",
+                error=ValueError("boom"),
+            ),
+        ), self.assertLogs(jobs.logger, "ERROR"):
+            parsed = async_to_sync(async_parse.parse)(job)
+
+        self.assertEqual(parsed.status, JobStatus.QUEUED)
+        self.assertIn("boom", parsed.last_error)
+        self.assertEqual(parsed.invoice.parse_status, ParseStatus.QUEUED)
+
+    def test_broken_pool(self):
+        """Test that a job is put back in the queue, without counting the
+        attempt, and the pool replaced where a process of the pool dies.
+        """
+        job = self.make_job()
+        with patch(
+            "parser.parse_for_supplier.parse_to_result",
+            side_effect=BrokenProcessPool,
+        ), patch.object(async_parse, "_executor", self.executor), patch.object(
+            self.executor, "shutdown"
+        ):
+            self.assertIsNone(async_to_sync(async_parse.parse)(job))
+            self.assertIsNone(async_parse._executor)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertIsNone(job.locked_by)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(job.invoice.parse_status, ParseStatus.QUEUED)
+
+    @override_settings(ASYNC_PARSE_WORKERS=0)
+    def test_disabled(self):
+        """Test that jobs are left queued where parsing within the web
+        process is disabled.
+        """
+        job = self.make_job()
+        self.assertIsNone(async_to_sync(async_parse.parse)(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+
+    @override_settings(ASYNC_PARSE_WAIT=0.01)
+    def test_no_free_turn(self):
+        """Test that a job is left queued where no turn becomes free in
+        time.
+        """
+        job = self.make_job()
+        with patch.object(
+            async_parse,
+            "_semaphore",
+            return_value=threading.BoundedSemaphore(1),
+        ) as semaphore:
+            # A turn taken in another thread, with its own event loop.
+            semaphore.return_value.acquire()
+            self.assertIsNone(async_to_sync(async_parse.parse)(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+
+    def test_turn_released(self):
+        """Test that a turn is released once the job is carried out, for the
+        parses of any other event loop to take.
+        """
+        semaphore = threading.BoundedSemaphore(1)
+        with patch.object(async_parse, "_semaphore", return_value=semaphore):
+            for _ in range(2):
+                job = self.make_job()
+                parsed = async_to_sync(async_parse.parse)(job)
+                self.assertEqual(parsed.status, JobStatus.SUCCEEDED)
+        self.assertTrue(semaphore.acquire(blocking=False))
+
+    def test_already_claimed(self):
+        """Test that a job claimed by a worker is not parsed again."""
+        job = self.make_job()
+        invoice_models.ParseJob.claim("worker")
+        self.assertIsNone(async_to_sync(async_parse.parse)(job))
+        job.refresh_from_db()
+        self.assertEqual(job.locked_by, "worker")
+
+
+class TestInvoiceUpload(BaseAsyncParseTestCase):
+    """Tests for the `invoice_upload` view parsing within the web
+    process.
+    """
+
+    def test_upload_parsed(self):
+        """Test that the response reports the invoice as parsed."""
+        self.client.force_login(self.user)
+        with open(INVOICE_FP, "rb") as f:
+            response = self.client.post(
+                reverse("invoices:upload_new"),
+                data={"supplier": self.supplier.id, "attachment": f},
+            )
+        invoice = invoice_models.Invoice.objects.get()
+        self.assertEqual(
+            response.json(),
+            {
+                "invoice_id": invoice.id,
+                "parse_status": ParseStatus.PARSED,
+                "job_id": invoice.parse_jobs.get().id,
+                "job_status": JobStatus.SUCCEEDED,
+                "duplicate": False,
+            },
+        )
+        self.assertTrue(invoice.items.exists())
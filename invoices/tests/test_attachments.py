@@ -0,0 +1,125 @@
+"""Tests for the `attachments` module."""
+
+import io
+import os
+import unittest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from model_bakery import baker
+from suppliers import models as supplier_models
+from .. import attachments, jobs, models as invoice_models
+
+try:
+    import boto3
+    from moto import mock_s3
+    from storages.backends import s3boto3
+except ImportError:  # pragma: no cover
+    mock_s3 = None
+
+INVOICE_FP = os.path.join("invoices", "tests", "soak_rochford_invoice.pdf")
+BUCKET = "invoices"
+
+
+def invoice_content() -> bytes:
+    """Returns the content of the Soak Rochford invoice."""
+    with open(INVOICE_FP, "rb") as f:
+        return f.read()
+
+
+class TestSpool(unittest.TestCase):
+    """Tests for the `spool` function."""
+
+    def test_in_memory(self):
+        """Test that contents no larger than `max_memory` are held in
+        memory.
+        """
+        with attachments.spool([b"abc", b"def"], 6) as f:
+            self.assertIsInstance(f, io.BytesIO)
+            self.assertEqual(f.read(), b"abcdef")
+
+    def test_spills_to_disk(self):
+        """Test that contents larger than `max_memory` are written to a
+        temporary file.
+        """
+        with attachments.spool([b"abc", b"def", b"g"], 6) as f:
+            self.assertNotIsInstance(f, io.BytesIO)
+            self.assertIsInstance(f, io.BufferedRandom)
+            self.assertEqual(f.read(), b"abcdefg")
+
+
+class TestOpenAttachment(TestCase):
+    """Tests for the `open_attachment` function with local storage."""
+
+    def test_local_path(self):
+        """Test that attachments on the local disk are read where they
+        are.
+        """
+        invoice = baker.make(
+            invoice_models.Invoice,
+            attachment=SimpleUploadedFile("a.pdf", b"%PDF-a"),
+        )
+        with attachments.open_attachment(invoice.attachment) as source:
+            self.assertEqual(source, invoice.attachment.path)
+
+
+@unittest.skipIf(mock_s3 is None, "moto and django-storages are required.")
+@override_settings(
+    DEFAULT_FILE_STORAGE="storages.backends.s3boto3.S3Boto3Storage",
+    AWS_STORAGE_BUCKET_NAME=BUCKET,
+    AWS_S3_REGION_NAME="us-east-1",
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_DEFAULT_ACL=None,
+)
+class TestS3Attachment(TestCase):
+    """Tests for reading attachments from S3, against moto's stand-in."""
+
+    def setUp(self):
+        """Set up the test."""
+        s3 = mock_s3()
+        s3.start()
+        self.addCleanup(s3.stop)
+        boto3.resource("s3", region_name="us-east-1").create_bucket(
+            Bucket=BUCKET
+        )
+        self.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        self.invoice = baker.make(
+            invoice_models.Invoice,
+            supplier=self.supplier,
+            attachment=SimpleUploadedFile("a.pdf", invoice_content()),
+        )
+
+    def test_stored_in_s3(self):
+        """Test that the attachment is stored in S3 rather than locally."""
+        self.assertIsInstance(
+            self.invoice.attachment.storage._wrapped,
+            s3boto3.S3Boto3Storage,
+        )
+        with self.assertRaises(NotImplementedError):
+            self.invoice.attachment.path
+
+    def test_open_in_memory(self):
+        """Test that a small attachment is streamed into memory."""
+        with attachments.open_attachment(self.invoice.attachment) as source:
+            self.assertIsInstance(source, io.BytesIO)
+            self.assertEqual(source.read(), invoice_content())
+
+    @override_settings(ATTACHMENT_SPOOL_MAX_MEMORY=1024)
+    def test_open_spooled(self):
+        """Test that an attachment larger than `ATTACHMENT_SPOOL_MAX_MEMORY`
+        is streamed to a temporary file, which is closed afterwards.
+        """
+        with attachments.open_attachment(self.invoice.attachment) as source:
+            self.assertIsInstance(source, io.BufferedRandom)
+            self.assertEqual(source.read(), invoice_content())
+        self.assertTrue(source.closed)
+
+    @override_settings(ATTACHMENT_SPOOL_MAX_MEMORY=1024)
+    def test_parse_invoice(self):
+        """Test that an invoice is parsed from its attachment in S3."""
+        parsed_data = jobs.parse_invoice(self.invoice)
+        self.assertEqual(parsed_data.order_number, "12345")
+        self.assertIsNone(parsed_data.result().filepath)
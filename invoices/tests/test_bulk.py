@@ -0,0 +1,317 @@
+"""Tests for the `bulk` module and the `InvoiceBulkUpload` view."""
+
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from unittest.mock import ANY, patch
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import bulk, models as invoice_models
+
+INVOICE_FP = os.path.join("invoices", "tests", "soak_rochford_invoice.pdf")
+
+
+def invoice_content() -> bytes:
+    """Returns the content of the Soak Rochford invoice."""
+    with open(INVOICE_FP, "rb") as f:
+        return f.read()
+
+
+def zip_upload(name: str, members: dict) -> SimpleUploadedFile:
+    """Returns an uploaded ZIP archive of `members`, a mapping of names to
+    contents. Names ending with "/" are directories.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for member, content in members.items():
+            archive.writestr(member, content)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class TestExtractUploads(TestCase):
+    """Tests for the `extract_uploads` function."""
+
+    def setUp(self):
+        """Set up the test."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def extract(self, *files) -> list:
+        """Returns the name, content and error of each file extracted."""
+        extracted = []
+        for file in bulk.extract_uploads(files, self.directory.name):
+            content = None
+            if file.path is not None:
+                with open(file.path, "rb") as f:
+                    content = f.read()
+                self.assertEqual(
+                    file.content_hash,
+                    hashlib.sha256(content).hexdigest(),
+                )
+            extracted.append((file.name, content, file.error))
+        return extracted
+
+    def test_pdf(self):
+        """Test that a PDF is written as it is."""
+        self.assertEqual(
+            self.extract(SimpleUploadedFile("a.pdf", b"%PDF-a")),
+            [("a.pdf", b"%PDF-a", None)],
+        )
+
+    def test_not_pdf(self):
+        """Test that a file which is neither a PDF nor an archive is
+        rejected.
+        """
+        ((name, content, error),) = self.extract(
+            SimpleUploadedFile("a.txt", b"text")
+        )
+        self.assertEqual(name, "a.txt")
+        self.assertIsNone(content)
+        self.assertIsNotNone(error)
+
+    def test_zip(self):
+        """Test that each PDF in an archive is written, skipping directories
+        and hidden files and rejecting other files.
+        """
+        extracted = self.extract(
+            zip_upload(
+                "invoices.zip",
+                {
+                    "may/": b"",
+                    "may/a.pdf": b"%PDF-a",
+                    "may/.DS_Store": b"",
+                    "b.PDF": b"%PDF-b",
+                    "notes.txt": b"text",
+                },
+            )
+        )
+        self.assertEqual(
+            [(name, content) for name, content, _ in extracted],
+            [
+                ("invoices.zip/may/a.pdf", b"%PDF-a"),
+                ("invoices.zip/b.PDF", b"%PDF-b"),
+                ("invoices.zip/notes.txt", None),
+            ],
+        )
+        self.assertIsNotNone(extracted[2][2])
+
+    @override_settings(BULK_UPLOAD_MAX_FILE_SIZE=4)
+    def test_too_large(self):
+        """Test that files larger than the limit are rejected."""
+        extracted = self.extract(
+            SimpleUploadedFile("a.pdf", b"%PDF-a"),
+            zip_upload("b.zip", {"b.pdf": b"%PDF-b"}),
+        )
+        self.assertEqual([content for _, content, _ in extracted], [None] * 2)
+        self.assertTrue(all(error for _, _, error in extracted))
+
+    @override_settings(BULK_UPLOAD_MAX_FILES=2)
+    def test_too_many(self):
+        """Test that an error is raised where there are too many files."""
+        with self.assertRaises(bulk.BulkUploadError):
+            self.extract(
+                SimpleUploadedFile("a.pdf", b"%PDF-a"),
+                zip_upload("b.zip", {"b.pdf": b"%PDF-b", "c.pdf": b"%PDF-c"}),
+            )
+
+
+class BaseBulkTestCase(TestCase):
+    """Base test class for bulk uploads."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        baker.make(
+            supplier_models.UserSupplier,
+            user=cls.user,
+            supplier=cls.supplier,
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+
+
+class TestBulkUpload(BaseBulkTestCase):
+    """Tests for the `bulk_upload` function."""
+
+    def test_bulk_upload(self):
+        """Test that each invoice is parsed and saved, detecting the
+        supplier, and that each file is reported on in upload order.
+        """
+        manifest = bulk.bulk_upload(
+            self.user,
+            [
+                zip_upload(
+                    "invoices.zip",
+                    {"a.pdf": invoice_content(), "b.txt": b"text"},
+                ),
+                SimpleUploadedFile("c.pdf", b"not a pdf"),
+            ],
+            max_workers=2,
+        )
+
+        self.assertEqual(
+            [(entry["filename"], entry["status"]) for entry in manifest],
+            [
+                ("invoices.zip/a.pdf", invoice_models.ParseStatus.PARSED),
+                ("invoices.zip/b.txt", "rejected"),
+                ("c.pdf", "rejected"),
+            ],
+        )
+        self.assertIsNotNone(manifest[2]["error"])
+        invoice = invoice_models.Invoice.objects.get(user=self.user)
+        self.assertEqual(invoice.id, manifest[0]["invoice_id"])
+        self.assertEqual(invoice.supplier, self.supplier)
+        self.assertEqual(
+            invoice.content_hash,
+            hashlib.sha256(invoice_content()).hexdigest(),
+        )
+        self.assertTrue(invoice.items.exists())
+
+    def test_duplicates(self):
+        """Test that copies of a file, whether in the same upload or already
+        uploaded, are reported as duplicates of the invoice rather than being
+        parsed and saved again.
+        """
+        manifest = bulk.bulk_upload(
+            self.user,
+            [
+                SimpleUploadedFile("a.pdf", invoice_content()),
+                zip_upload("b.zip", {"b.pdf": invoice_content()}),
+            ],
+            max_workers=1,
+        )
+        invoice = invoice_models.Invoice.objects.get(user=self.user)
+        self.assertEqual(
+            [(entry["status"], entry["invoice_id"]) for entry in manifest],
+            [
+                (invoice_models.ParseStatus.PARSED, invoice.id),
+                ("duplicate", invoice.id),
+            ],
+        )
+
+        with patch.object(
+            bulk.parse_for_supplier,
+            "parse_many",
+            side_effect=lambda invoices, **kwargs: iter(list(invoices)),
+        ) as parse_many:
+            manifest = bulk.bulk_upload(
+                self.user,
+                [SimpleUploadedFile("c.pdf", invoice_content())],
+            )
+        parse_many.assert_called_once_with(
+            [],
+            max_workers=ANY,
+            mp_context=ANY,
+            initializer=ANY,
+        )
+        self.assertEqual(
+            [(entry["status"], entry["invoice_id"]) for entry in manifest],
+            [("duplicate", invoice.id)],
+        )
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+
+    def test_not_users_supplier(self):
+        """Test that invoices from suppliers the user does not have are
+        rejected.
+        """
+        manifest = bulk.bulk_upload(
+            baker.make(User),
+            [SimpleUploadedFile("a.pdf", invoice_content())],
+            max_workers=1,
+        )
+        self.assertEqual(manifest[0]["status"], "rejected")
+        self.assertIn("Soak Rochford", manifest[0]["error"])
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+
+class TestInvoiceBulkUploadView(BaseBulkTestCase):
+    """Tests for the `InvoiceBulkUpload` view."""
+
+    def setUp(self):
+        """Set up the test."""
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_get(self):
+        """Test the GET request."""
+        response = self.client.get(reverse("invoices:upload_bulk"))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(BULK_UPLOAD_WORKERS=1)
+    def test_post(self):
+        """Test that the POST request responds with the manifest."""
+        response = self.client.post(
+            reverse("invoices:upload_bulk"),
+            data={
+                "supplier": self.supplier.id,
+                "files": [
+                    SimpleUploadedFile("a.pdf", invoice_content()),
+                    zip_upload("b.zip", {"b.pdf": invoice_content()}),
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (entry["filename"], entry["status"])
+                for entry in response.json()["files"]
+            ],
+            [
+                ("a.pdf", invoice_models.ParseStatus.PARSED),
+                ("b.zip/b.pdf", "duplicate"),
+            ],
+        )
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+
+    @override_settings(BULK_UPLOAD_MAX_FILES=1)
+    def test_post_too_many(self):
+        """Test that the POST request fails where there are too many files."""
+        response = self.client.post(
+            reverse("invoices:upload_bulk"),
+            data={
+                "files": [
+                    SimpleUploadedFile("a.pdf", b"%PDF-a"),
+                    SimpleUploadedFile("b.pdf", b"%PDF-b"),
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+    def test_post_invalid_form(self):
+        """Test the POST request without any files."""
+        response = self.client.post(reverse("invoices:upload_bulk"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_unauthenticated(self):
+        """Test that the view is not found by unauthenticated users."""
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(reverse("invoices:upload_bulk")).status_code,
+            404,
+        )
+        response = self.client.post(
+            reverse("invoices:upload_bulk"),
+            data={
+                "supplier": self.supplier.id,
+                "files": [SimpleUploadedFile("a.pdf", invoice_content())],
+            },
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
@@ -0,0 +1,198 @@
+"""Tests for the `direct` module and the direct upload views."""
+
+import os
+import unittest
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from suppliers import models as supplier_models
+from .. import direct, models as invoice_models
+
+try:
+    import boto3
+    import requests
+    from moto import mock_s3
+except ImportError:  # pragma: no cover
+    mock_s3 = None
+
+INVOICE_FP = os.path.join("invoices", "tests", "soak_rochford_invoice.pdf")
+BUCKET = "invoices"
+
+
+class BaseDirectUploadTestCase(TestCase):
+    """Base test class for the direct upload tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        baker.make(
+            supplier_models.UserSupplier,
+            user=cls.user,
+            supplier=cls.supplier,
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        self.client.force_login(self.user)
+
+    def create(self, filename: str = "Invoice 1.pdf"):
+        """Requests a presigned POST."""
+        return self.client.post(
+            reverse("invoices:upload_direct"),
+            data={"supplier": self.supplier.id, "filename": filename},
+        )
+
+    def confirm(self, upload_id: int):
+        """Confirms an upload."""
+        return self.client.post(
+            reverse(
+                "invoices:upload_direct_confirm",
+                kwargs={"upload_id": upload_id},
+            )
+        )
+
+
+class TestDirectUploadUnavailable(BaseDirectUploadTestCase):
+    """Tests for direct uploads with local storage."""
+
+    def test_unavailable(self):
+        """Test that direct uploads are refused."""
+        response = self.create()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"error": "Direct uploads are not available."},
+        )
+        self.assertFalse(invoice_models.DirectUpload.objects.exists())
+
+    def test_unauthenticated(self):
+        """Test that the views are not found by unauthenticated users."""
+        upload = baker.make(invoice_models.DirectUpload, user=self.user)
+        self.client.logout()
+        self.assertEqual(self.create().status_code, 404)
+        self.assertEqual(self.confirm(upload.id).status_code, 404)
+        self.assertEqual(invoice_models.DirectUpload.objects.count(), 1)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+
+@unittest.skipIf(mock_s3 is None, "moto and django-storages are required.")
+@override_settings(
+    DEFAULT_FILE_STORAGE="storages.backends.s3boto3.S3Boto3Storage",
+    AWS_STORAGE_BUCKET_NAME=BUCKET,
+    AWS_S3_REGION_NAME="us-east-1",
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_DEFAULT_ACL=None,
+)
+class TestDirectUpload(BaseDirectUploadTestCase):
+    """Tests for direct uploads against moto's S3 stand-in."""
+
+    def setUp(self):
+        """Set up the test."""
+        super().setUp()
+        s3 = mock_s3()
+        s3.start()
+        self.addCleanup(s3.stop)
+        boto3.resource("s3", region_name="us-east-1").create_bucket(
+            Bucket=BUCKET
+        )
+
+    def upload(self, content: bytes) -> int:
+        """Requests a presigned POST and uploads `content` with it as a
+        client would, returning the id of the upload.
+        """
+        body = self.create().json()
+        response = requests.post(
+            body["url"],
+            data=body["fields"],
+            files={"file": ("a.pdf", content, "application/pdf")},
+        )
+        self.assertEqual(response.status_code, 204)
+        return body["upload_id"]
+
+    def test_create(self):
+        """Test that a presigned POST for a unique, `invoice_upload_path`
+        style key is returned.
+        """
+        body = self.create().json()
+        upload = invoice_models.DirectUpload.objects.get(id=body["upload_id"])
+        self.assertEqual(upload.user, self.user)
+        self.assertEqual(body["fields"]["key"], upload.name)
+        directory, name = upload.name.rsplit("/", 1)
+        self.assertTrue(directory.startswith(f"{self.supplier.slug}/"))
+        self.assertTrue(name.endswith("-invoice-1.pdf"))
+        self.assertIn("policy", body["fields"])
+
+    def test_invalid_form(self):
+        """Test that only PDFs may be uploaded."""
+        response = self.create("a.txt")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("filename", response.json()["errors"])
+
+    def test_confirm(self):
+        """Test that confirming an upload creates an invoice with the
+        uploaded attachment and queues it to be parsed.
+        """
+        with open(INVOICE_FP, "rb") as f:
+            content = f.read()
+        upload_id = self.upload(content)
+
+        response = self.confirm(upload_id)
+        self.assertEqual(response.status_code, 200)
+        invoice = invoice_models.Invoice.objects.get()
+        job = invoice.parse_jobs.get()
+        self.assertEqual(
+            response.json(),
+            {
+                "invoice_id": invoice.id,
+                "parse_status": invoice_models.ParseStatus.QUEUED,
+                "job_id": job.id,
+                "job_status": invoice_models.JobStatus.QUEUED,
+            },
+        )
+        self.assertEqual(invoice.user, self.user)
+        self.assertEqual(invoice.attachment.name, invoice.direct_upload.name)
+        with invoice.attachment.open("rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_confirm_twice(self):
+        """Test that confirming an upload again returns the same invoice."""
+        upload_id = self.upload(b"%PDF-1.4")
+        first = self.confirm(upload_id).json()
+        second = self.confirm(upload_id).json()
+        self.assertEqual(first["invoice_id"], second["invoice_id"])
+        self.assertIsNone(second["job_id"])
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+
+    def test_confirm_not_uploaded(self):
+        """Test that an upload cannot be confirmed before it is uploaded."""
+        response = self.confirm(self.create().json()["upload_id"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"error": "The file has not been uploaded."},
+        )
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+    def test_confirm_not_pdf(self):
+        """Test that an upload which is not a PDF is rejected and deleted."""
+        upload_id = self.upload(b"not a pdf")
+        response = self.confirm(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "The file is not a PDF."})
+        upload = invoice_models.DirectUpload.objects.get(id=upload_id)
+        self.assertFalse(direct.storage().exists(upload.name))
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+    def test_confirm_other_user(self):
+        """Test that users cannot confirm each other's uploads."""
+        upload_id = self.upload(b"%PDF-1.4")
+        self.client.force_login(baker.make(User))
+        self.assertEqual(self.confirm(upload_id).status_code, 404)
@@ -0,0 +1,200 @@
+"""Tests for the `export` module, the `InvoiceExport` view and the
+`export_invoices` command.
+"""
+
+import csv
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from model_bakery import baker
+from products import models as product_models
+from suppliers import models as supplier_models
+from .. import export, models as invoice_models
+
+
+class BaseExportTestCase(TestCase):
+    """Base test class for the export tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User, username="user")
+        cls.supplier = baker.make(supplier_models.Supplier, name="Supplier")
+        cls.category = baker.make(product_models.ProductCategory, name="Tea")
+        cls.invoice = baker.make(
+            invoice_models.Invoice,
+            user=cls.user,
+            supplier=cls.supplier,
+            order_number="1",
+            date_ordered=date(2022, 2, 1),
+            total=Decimal("10.00"),
+        )
+        cls.item = baker.make(
+            invoice_models.InvoiceItem,
+            invoice=cls.invoice,
+            product__name="Green Tea",
+            category=cls.category,
+            quantity=2,
+            price_ex_vat=Decimal("4.00"),
+        )
+        cls.empty_invoice = baker.make(
+            invoice_models.Invoice,
+            user=cls.user,
+            supplier=cls.supplier,
+            date_ordered=date(2022, 1, 1),
+        )
+        cls.other_invoice = baker.make(
+            invoice_models.Invoice,
+            supplier=cls.supplier,
+            date_ordered=date(2022, 3, 1),
+        )
+
+    @staticmethod
+    def parse(content: str) -> list:
+        """Parses the CSV into a list of dicts."""
+        return list(csv.DictReader(StringIO(content)))
+
+
+class TestExport(BaseExportTestCase):
+    """Tests for the `export` module."""
+
+    def test_rows(self):
+        """Test that a row is exported for each item, or for each invoice
+        without items, in the order they were placed.
+        """
+        rows = self.parse("".join(export.iter_csv(self.user)))
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "invoice_id": str(self.empty_invoice.id),
+                    "order_number": "",
+                    "supplier": "Supplier",
+                    "date_ordered": "2022-01-01",
+                    "subtotal": "",
+                    "vat": "",
+                    "delivery": "",
+                    "promotion": "",
+                    "total": "",
+                    "item_id": "",
+                    "product": "",
+                    "category": "",
+                    "quantity": "",
+                    "price_ex_vat": "",
+                },
+                {
+                    "invoice_id": str(self.invoice.id),
+                    "order_number": "1",
+                    "supplier": "Supplier",
+                    "date_ordered": "2022-02-01",
+                    "subtotal": "",
+                    "vat": "",
+                    "delivery": "",
+                    "promotion": "",
+                    "total": "10.00",
+                    "item_id": str(self.item.id),
+                    "product": "Green Tea",
+                    "category": "Tea",
+                    "quantity": "2",
+                    "price_ex_vat": "4.00",
+                },
+            ],
+        )
+
+    def test_superuser(self):
+        """Test that superusers, and no user, export every invoice."""
+        superuser = baker.make(User, is_superuser=True)
+        for user in (superuser, None):
+            rows = self.parse("".join(export.iter_csv(user)))
+            self.assertEqual(len(rows), 3)
+
+    def test_dates(self):
+        """Test that the invoices may be limited to those ordered between
+        two dates.
+        """
+        rows = self.parse(
+            "".join(
+                export.iter_csv(
+                    self.user,
+                    date_from=date(2022, 1, 15),
+                    date_to=date(2022, 2, 15),
+                )
+            )
+        )
+        self.assertEqual(
+            [row["invoice_id"] for row in rows],
+            [str(self.invoice.id)],
+        )
+
+    def test_buffered(self):
+        """Test that the CSV is yielded a buffer at a time."""
+        baker.make(
+            invoice_models.InvoiceItem,
+            invoice=self.invoice,
+            _quantity=50,
+        )
+        with patch.object(export, "BUFFER_SIZE", 1024):
+            chunks = list(export.iter_csv(self.user))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(len(self.parse("".join(chunks))), 52)
+
+
+class TestInvoiceExport(BaseExportTestCase):
+    """Tests for the `InvoiceExport` view."""
+
+    def test_export(self):
+        """Test that the user's invoices are streamed as CSV."""
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("invoices:export") + "?from=2022-02-01"
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = self.parse(b"".join(response.streaming_content).decode())
+        self.assertEqual(
+            [row["invoice_id"] for row in rows],
+            [str(self.invoice.id)],
+        )
+
+    def test_invalid_date(self):
+        """Test that an invalid date is a bad request."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("invoices:export") + "?to=2022")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unauthenticated(self):
+        """Test that the export requires a user."""
+        response = self.client.get(reverse("invoices:export"))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestExportInvoicesCommand(BaseExportTestCase):
+    """Tests for the `export_invoices` command."""
+
+    def test_stdout(self):
+        """Test that the user's invoices are written to stdout."""
+        out = StringIO()
+        call_command("export_invoices", "--user", "user", stdout=out)
+        self.assertEqual(len(self.parse(out.getvalue())), 2)
+
+    def test_output(self):
+        """Test that every invoice is written to the output file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "invoices.csv")
+            call_command("export_invoices", "--output", path)
+            with open(path, newline="") as f:
+                self.assertEqual(len(self.parse(f.read())), 3)
+
+    def test_unknown_user(self):
+        """Test that an unknown user is an error."""
+        with self.assertRaises(CommandError):
+            call_command("export_invoices", "--user", "unknown")
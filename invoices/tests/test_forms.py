@@ -1,3 +1,4 @@
+import hashlib
 import os
 from django.test import TestCase
 from django.contrib.auth.models import User
@@ -64,7 +65,7 @@ class InvoiceUploadFormTest(TestCase):
 
     def test_save_with_invoice(self):
         """Test that the `save` method works. In this test, an actual invoice
-        is used, so it is expected that the invoice is parsed.
+        is used, so it is expected that the invoice is queued to be parsed.
         """
         invoice_fp = os.path.join(
             "invoices",
@@ -87,6 +88,42 @@ class InvoiceUploadFormTest(TestCase):
         self.assertTrue(form.is_valid(), form.errors)
         invoice = form.save()
         self.assertEqual(invoice.supplier, self.supplier)
+        self.assertEqual(
+            invoice.parse_status,
+            invoice_models.ParseStatus.QUEUED,
+        )
+        self.assertEqual(form.parse_job.invoice, invoice)
+        self.assertEqual(
+            form.parse_job.status,
+            invoice_models.JobStatus.QUEUED,
+        )
+
+    def test_save_duplicate(self):
+        """Test that saving a file the user has already uploaded returns the
+        existing invoice.
+        """
+
+        def save() -> invoice_models.Invoice:
+            file = SimpleUploadedFile("test.pdf", b"file_content")
+            form = invoice_forms.InvoiceUploadForm(
+                user=self.user,
+                data={"supplier": self.supplier.id},
+                files={"attachment": file},
+            )
+            self.assertTrue(form.is_valid(), form.errors)
+            return form, form.save()
+
+        form, invoice = save()
+        self.assertFalse(form.duplicate)
+        self.assertEqual(
+            invoice.content_hash,
+            hashlib.sha256(b"file_content").hexdigest(),
+        )
+
+        form, duplicate = save()
+        self.assertTrue(form.duplicate)
+        self.assertIsNone(form.parse_job)
+        self.assertEqual(duplicate, invoice)
 
 
 class InvoiceFormTest(TestCase):
@@ -0,0 +1,271 @@
+"""Tests for the `ingest` module."""
+
+import hashlib
+import os
+from datetime import date
+from unittest.mock import patch
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from parser.parse_for_supplier import ParseResult
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import ingest, models as invoice_models
+
+# The most queries each way of ingesting an invoice may make, excluding the
+# savepoints of `transaction.atomic`.
+QUERY_BUDGET = {
+    # Check for a duplicate, insert the invoice and its job.
+    "queued": 3,
+    # Check for a duplicate, insert the invoice, load the supplier's
+    # products, insert the new products, read them back and insert the items.
+    "parsed": 6,
+    # As above, with every product already cached.
+    "parsed_cached": 3,
+    # Update the invoice rather than insert it.
+    "update": 5,
+}
+
+
+def items_breakdown(count: int) -> dict:
+    """Returns an items breakdown with `count` items."""
+    return {
+        f"Product {i}": {"quantity": i + 1, "price_ex_vat": i * 2}
+        for i in range(count)
+    }
+
+
+def parse_result(count: int = 3, **kwargs) -> ParseResult:
+    """Returns a successful parse result with `count` items."""
+    return ParseResult(
+        filepath="invoice.pdf",
+        supplier="Soak Rochford",
+        order_number="123",
+        order_date=date(2022, 5, 1),
+        subtotal=10.0,
+        vat=2.0,
+        delivery=None,
+        promotion=None,
+        total=12.0,
+        items_breakdown=items_breakdown(count),
+        **kwargs,
+    )
+
+
+class BaseIngestTestCase(TestCase):
+    """Base test class for the ingest tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make("auth.User")
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+            slug="soak-rochford",
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+
+    def new_invoice(self, content: bytes = None) -> invoice_models.Invoice:
+        """Returns an unsaved invoice with an attachment."""
+        if content is None:
+            content = os.urandom(16)
+        attachment = SimpleUploadedFile("invoice.pdf", content)
+        return invoice_models.Invoice(
+            user=self.user,
+            supplier=self.supplier,
+            attachment=attachment,
+            content_hash=ingest.content_hash(attachment),
+        )
+
+    def assert_within_budget(self, budget: str, func, *args):
+        """Assert that `func` makes no more queries, excluding savepoints,
+        than the budget allows and return its result.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                value = func(*args)
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertLessEqual(
+            len(queries),
+            QUERY_BUDGET[budget],
+            "\n".join(query[:80] for query in queries),
+        )
+        return value
+
+
+class TestIngest(BaseIngestTestCase):
+    """Tests for the `ingest` function."""
+
+    def test_queued(self):
+        """Test that an invoice without a parse result is saved and queued to
+        be parsed.
+        """
+        invoice = self.new_invoice()
+        job = self.assert_within_budget("queued", ingest.ingest, invoice)
+
+        invoice.refresh_from_db()
+        self.assertEqual(
+            invoice.parse_status, invoice_models.ParseStatus.QUEUED
+        )
+        self.assertEqual(job.invoice, invoice)
+        self.assertEqual(job.status, invoice_models.JobStatus.QUEUED)
+
+    def test_parsed(self):
+        """Test that an invoice is saved with its parsed data and items."""
+        invoice = self.new_invoice()
+        job = self.assert_within_budget(
+            "parsed",
+            ingest.ingest,
+            invoice,
+            parse_result(),
+        )
+
+        self.assertIsNone(job)
+        invoice.refresh_from_db()
+        self.assertEqual(
+            invoice.parse_status, invoice_models.ParseStatus.PARSED
+        )
+        self.assertEqual(invoice.order_number, "123")
+        self.assertEqual(invoice.date_ordered, date(2022, 5, 1))
+        self.assertEqual(invoice.total, 12)
+        self.assertEqual(invoice.delivery, 0)
+        self.assertEqual(invoice.items.count(), 3)
+        self.assertFalse(invoice.parse_jobs.exists())
+        # The attachment is stored under the parsed date and order number.
+        self.assertIn("2022-05-01/123-invoice", invoice.attachment.name)
+
+    def test_parsed_budget_independent_of_items(self):
+        """Test that the budget holds however many items there are, and with
+        the supplier's products cached.
+        """
+        self.assert_within_budget(
+            "parsed",
+            ingest.ingest,
+            self.new_invoice(),
+            parse_result(100),
+        )
+        self.assert_within_budget(
+            "parsed_cached",
+            ingest.ingest,
+            self.new_invoice(),
+            parse_result(100),
+        )
+
+    def test_failed(self):
+        """Test that an invoice which could not be parsed is saved as failed
+        without any items.
+        """
+        invoice = self.new_invoice()
+        ingest.ingest(invoice, parse_result(error=ValueError("error")))
+
+        invoice.refresh_from_db()
+        self.assertEqual(
+            invoice.parse_status, invoice_models.ParseStatus.FAILED
+        )
+        self.assertIsNone(invoice.total)
+        self.assertFalse(invoice.items.exists())
+
+    def test_atomic(self):
+        """Test that nothing is saved where adding the items fails."""
+        with patch.object(
+            invoice_models.Invoice,
+            "add_from_items_breakdown",
+            side_effect=RuntimeError("boom"),
+        ), self.assertRaises(RuntimeError):
+            ingest.ingest(self.new_invoice(), parse_result())
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+
+class TestDuplicates(BaseIngestTestCase):
+    """Tests for ingesting a file the user has already uploaded."""
+
+    def test_content_hash(self):
+        """Test that the hash of a file is its SHA-256 and that the file can
+        be read again afterwards.
+        """
+        attachment = SimpleUploadedFile("invoice.pdf", b"content")
+        self.assertEqual(
+            ingest.content_hash(attachment),
+            hashlib.sha256(b"content").hexdigest(),
+        )
+        self.assertEqual(attachment.read(), b"content")
+
+    def test_duplicate(self):
+        """Test that nothing is saved for a duplicate, not even its
+        attachment.
+        """
+        invoice = self.new_invoice(b"content")
+        ingest.ingest(invoice)
+
+        duplicate = self.new_invoice(b"content")
+        with patch.object(
+            duplicate.attachment.storage, "save"
+        ) as save, self.assertRaises(ingest.DuplicateInvoice) as context:
+            ingest.ingest(duplicate, parse_result())
+        self.assertEqual(context.exception.invoice, invoice)
+        save.assert_not_called()
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+        self.assertFalse(invoice_models.InvoiceItem.objects.exists())
+
+    def test_duplicate_other_user(self):
+        """Test that another user may upload the same file."""
+        ingest.ingest(self.new_invoice(b"content"))
+        invoice = self.new_invoice(b"content")
+        invoice.user = baker.make("auth.User")
+        ingest.ingest(invoice)
+        self.assertEqual(invoice_models.Invoice.objects.count(), 2)
+
+    def test_duplicate_at_same_time(self):
+        """Test that a duplicate saved after checking for duplicates is
+        caught by the unique constraint and its attachment removed.
+        """
+        invoice = self.new_invoice(b"content")
+        ingest.ingest(invoice)
+
+        duplicate = self.new_invoice(b"content")
+        with patch.object(
+            invoice_models.Invoice,
+            "find_duplicate",
+            side_effect=[None, invoice],
+        ), self.assertRaises(ingest.DuplicateInvoice) as context:
+            ingest.ingest(duplicate)
+        self.assertEqual(context.exception.invoice, invoice)
+        self.assertFalse(duplicate.attachment)
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+
+
+class TestSaveParseResult(BaseIngestTestCase):
+    """Tests for the `save_parse_result` function."""
+
+    def test_save_parse_result(self):
+        """Test that an existing invoice is updated with its parsed data and
+        items.
+        """
+        invoice = self.new_invoice()
+        ingest.ingest(invoice)
+
+        self.assert_within_budget(
+            "update",
+            ingest.save_parse_result,
+            invoice,
+            parse_result(50),
+        )
+
+        invoice.refresh_from_db()
+        self.assertEqual(
+            invoice.parse_status, invoice_models.ParseStatus.PARSED
+        )
+        self.assertEqual(invoice.subtotal, 10)
+        self.assertEqual(invoice.items.count(), 50)
@@ -0,0 +1,258 @@
+"""Tests for the `jobs` module and the `parse_worker` command."""
+
+import os
+from io import StringIO
+from datetime import timedelta
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from model_bakery import baker
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import jobs, models as invoice_models
+
+JobStatus = invoice_models.JobStatus
+ParseStatus = invoice_models.ParseStatus
+
+
+class BaseJobTestCase(TestCase):
+    """Base test class for the job tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+
+    def make_invoice(self) -> invoice_models.Invoice:
+        """Returns an invoice with a Soak Rochford invoice attached."""
+        invoice_fp = os.path.join(
+            "invoices",
+            "tests",
+            "soak_rochford_invoice.pdf",
+        )
+        with open(invoice_fp, "rb") as f:
+            attachment = SimpleUploadedFile("test.pdf", f.read())
+        return baker.make(
+            invoice_models.Invoice,
+            supplier=self.supplier,
+            attachment=attachment,
+        )
+
+
+class TestParseJob(BaseJobTestCase):
+    """Tests for the `ParseJob` model."""
+
+    def test_enqueue(self):
+        """Test that enqueuing an invoice creates a job and marks the invoice
+        as queued.
+        """
+        invoice = baker.make(invoice_models.Invoice, supplier=self.supplier)
+        job = invoice_models.ParseJob.enqueue(invoice)
+        invoice.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(invoice.parse_status, ParseStatus.QUEUED)
+
+    def test_claim(self):
+        """Test that claiming a job marks it as running for the worker."""
+        job = baker.make(invoice_models.ParseJob)
+        claimed = invoice_models.ParseJob.claim("worker-1")
+        self.assertEqual(claimed, [job])
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertEqual(job.locked_by, "worker-1")
+        self.assertIsNotNone(job.locked_at)
+        self.assertEqual(job.attempts, 1)
+
+    def test_claim_limit(self):
+        """Test that no more than `limit` jobs are claimed."""
+        baker.make(invoice_models.ParseJob, _quantity=3)
+        self.assertEqual(len(invoice_models.ParseJob.claim("worker", 2)), 2)
+        self.assertEqual(len(invoice_models.ParseJob.claim("worker", 2)), 1)
+        self.assertEqual(invoice_models.ParseJob.claim("worker", 2), [])
+
+    def test_claim_skips_jobs_not_due(self):
+        """Test that jobs waiting to be retried are not claimed."""
+        baker.make(
+            invoice_models.ParseJob,
+            run_after=timezone.now() + timedelta(minutes=1),
+        )
+        self.assertEqual(invoice_models.ParseJob.claim("worker"), [])
+
+    @override_settings(PARSE_JOB_LEASE=60)
+    def test_claim_expired_lease(self):
+        """Test that a running job is only claimed by another worker once its
+        lease has expired.
+        """
+        job = baker.make(
+            invoice_models.ParseJob,
+            status=JobStatus.RUNNING,
+            locked_by="worker-1",
+            locked_at=timezone.now() - timedelta(seconds=30),
+            attempts=1,
+        )
+        self.assertEqual(invoice_models.ParseJob.claim("worker-2"), [])
+
+        job.locked_at = timezone.now() - timedelta(seconds=90)
+        job.save()
+        self.assertEqual(invoice_models.ParseJob.claim("worker-2"), [job])
+        job.refresh_from_db()
+        self.assertEqual(job.locked_by, "worker-2")
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(PARSE_JOB_LEASE=60)
+    def test_claim_expired_lease_last_attempt(self):
+        """Test that a running job whose lease expired on its last attempt
+        is dead rather than claimed, and its invoice is marked as failed.
+        """
+        job = baker.make(
+            invoice_models.ParseJob,
+            status=JobStatus.RUNNING,
+            locked_by="worker-1",
+            locked_at=timezone.now() - timedelta(seconds=90),
+            attempts=3,
+            max_attempts=3,
+        )
+        queued = baker.make(invoice_models.ParseJob)
+        self.assertEqual(invoice_models.ParseJob.claim("worker-2"), [queued])
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DEAD)
+        self.assertIsNone(job.locked_by)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(job.invoice.parse_status, ParseStatus.FAILED)
+
+    @override_settings(PARSE_JOB_RETRY_DELAY=10)
+    def test_fail_retries_with_backoff(self):
+        """Test that a failed job is queued again with a delay which doubles
+        with each attempt.
+        """
+        job = baker.make(invoice_models.ParseJob, max_attempts=3)
+        for attempt, delay in ((1, 10), (2, 20)):
+            job.attempts = attempt
+            before = timezone.now()
+            job.fail("error")
+            job.refresh_from_db()
+            self.assertEqual(job.status, JobStatus.QUEUED)
+            self.assertEqual(job.last_error, "error")
+            self.assertIsNone(job.locked_by)
+            self.assertGreaterEqual(
+                job.run_after,
+                before + timedelta(seconds=delay),
+            )
+            self.assertLess(
+                job.run_after,
+                before + timedelta(seconds=delay * 2),
+            )
+
+    def test_fail_dead(self):
+        """Test that a job which has run out of attempts is dead and its
+        invoice is marked as failed.
+        """
+        job = baker.make(invoice_models.ParseJob, max_attempts=2, attempts=2)
+        job.fail("error")
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DEAD)
+        self.assertEqual(job.invoice.parse_status, ParseStatus.FAILED)
+        self.assertEqual(invoice_models.ParseJob.claim("worker"), [])
+
+
+class TestRunJob(BaseJobTestCase):
+    """Tests for the `run_job` function."""
+
+    def test_run_job(self):
+        """Test that running a job parses the invoice."""
+        invoice = self.make_invoice()
+        invoice_models.ParseJob.enqueue(invoice)
+        (job,) = invoice_models.ParseJob.claim("worker")
+
+        self.assertTrue(jobs.run_job(job))
+        job.refresh_from_db()
+        invoice.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.SUCCEEDED)
+        self.assertEqual(invoice.parse_status, ParseStatus.PARSED)
+        self.assertIsNotNone(invoice.total)
+        self.assertTrue(invoice.items.exists())
+
+    def test_run_job_failure(self):
+        """Test that a job which fails is queued to be retried and nothing
+        that was parsed is saved.
+        """
+        invoice = self.make_invoice()
+        invoice_models.ParseJob.enqueue(invoice)
+        (job,) = invoice_models.ParseJob.claim("worker")
+
+        with patch.object(
+            invoice_models.Invoice,
+            "add_from_items_breakdown",
+            side_effect=RuntimeError("boom"),
+        ), self.assertLogs(jobs.logger, "ERROR"):
+            self.assertFalse(jobs.run_job(job))
+
+        job.refresh_from_db()
+        invoice.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertIn("boom", job.last_error)
+        self.assertEqual(invoice.parse_status, ParseStatus.QUEUED)
+        self.assertIsNone(invoice.total)
+
+    @override_settings(PARSE_JOB_LEASE=60)
+    def test_run_job_lease_lost(self):
+        """Test that the result of a job whose lease expired and which was
+        claimed again by another worker is discarded.
+        """
+        invoice = self.make_invoice()
+        invoice_models.ParseJob.enqueue(invoice)
+        (job,) = invoice_models.ParseJob.claim("worker-1")
+        invoice_models.ParseJob.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=90)
+        )
+        self.assertEqual(
+            invoice_models.ParseJob.claim("worker-2"),
+            [job],
+        )
+
+        with self.assertLogs(jobs.logger, "WARNING"):
+            self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        invoice.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertEqual(job.locked_by, "worker-2")
+        self.assertIsNone(invoice.total)
+        self.assertFalse(invoice.items.exists())
+
+
+class TestParseWorkerCommand(BaseJobTestCase):
+    """Tests for the `parse_worker` command."""
+
+    def test_once(self):
+        """Test that the worker runs every job that is due and then exits."""
+        invoices = [self.make_invoice() for _ in range(2)]
+        for invoice in invoices:
+            invoice_models.ParseJob.enqueue(invoice)
+
+        out = StringIO()
+        call_command(
+            "parse_worker",
+            "--once",
+            "--worker-id=test",
+            stdout=out,
+        )
+        self.assertEqual(
+            invoice_models.ParseJob.objects.filter(
+                status=JobStatus.SUCCEEDED,
+                locked_by="test",
+            ).count(),
+            2,
+        )
+        self.assertIn("succeeded", out.getvalue())
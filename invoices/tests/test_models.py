@@ -1,7 +1,11 @@
 from datetime import date
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from products import models as product_models
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
 from .. import models as invoice_models
 
 
@@ -111,6 +115,156 @@ class TestInvoice(TestCase):
             invoice.add_item(1, 10)
 
 
+class TestAddFromItemsBreakdown(TestCase):
+    """Test the `Invoice.add_from_items_breakdown` method."""
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+
+    @staticmethod
+    def items_breakdown(count: int) -> dict:
+        """Returns an items breakdown with `count` items."""
+        return {
+            f"Product {i}": {"quantity": i + 1, "price_ex_vat": i * 2}
+            for i in range(count)
+        }
+
+    def assert_items(self, invoice, items_breakdown):
+        """Assert that the invoice has an item for each item in the items
+        breakdown.
+        """
+        self.assertEqual(
+            {
+                item.product.name: {
+                    "quantity": item.quantity,
+                    "price_ex_vat": item.price_ex_vat,
+                }
+                for item in invoice.items.select_related("product")
+            },
+            items_breakdown,
+        )
+
+    def test_bulk(self):
+        """Test that an item is added for each item in the breakdown, creating
+        the products which do not exist and reusing those that do.
+        """
+        invoice = baker.make(invoice_models.Invoice)
+        category = baker.make(product_models.ProductCategory)
+        existing = baker.make(
+            product_models.Product,
+            name="Product 0",
+            supplier=invoice.supplier,
+            default_category=category,
+        )
+        items_breakdown = self.items_breakdown(3)
+
+        invoice.add_from_items_breakdown(items_breakdown)
+
+        self.assert_items(invoice, items_breakdown)
+        self.assertEqual(
+            product_models.Product.objects.filter(
+                supplier=invoice.supplier
+            ).count(),
+            3,
+        )
+        item = invoice.items.get(product=existing)
+        self.assertEqual(item.category, category)
+        self.assertEqual(
+            product_models.Product.objects.get(name="Product 1").slug,
+            "product-1",
+        )
+
+    def test_bulk_matches_per_item(self):
+        """Test that the bulk mode adds the same items as adding each item
+        individually.
+        """
+        items_breakdown = self.items_breakdown(5)
+        bulk_invoice = baker.make(invoice_models.Invoice)
+        per_item_invoice = baker.make(invoice_models.Invoice)
+
+        bulk_invoice.add_from_items_breakdown(items_breakdown)
+        per_item_invoice.add_from_items_breakdown(items_breakdown, bulk=False)
+
+        self.assert_items(bulk_invoice, items_breakdown)
+        self.assert_items(per_item_invoice, items_breakdown)
+
+    def test_bulk_same_slug(self):
+        """Test that products are matched on their slug where there is no
+        product with the name, as a supplier's products must have unique
+        slugs.
+        """
+        invoice = baker.make(invoice_models.Invoice)
+        product = baker.make(
+            product_models.Product,
+            name="Test Product",
+            slug="test-product",
+            supplier=invoice.supplier,
+        )
+
+        items = invoice.add_from_items_breakdown(
+            {
+                "Test Product!": {"quantity": 1, "price_ex_vat": 1},
+                "test product": {"quantity": 2, "price_ex_vat": 2},
+            }
+        )
+
+        self.assertEqual([item.product for item in items], [product] * 2)
+        self.assertEqual(product_models.Product.objects.count(), 1)
+
+    def test_bulk_constant_queries(self):
+        """Test that the number of queries does not depend on the number of
+        items, whether or not the products already exist.
+        """
+        supplier = baker.make(supplier_models.Supplier)
+
+        def queries(count: int) -> int:
+            invoice = baker.make(invoice_models.Invoice, supplier=supplier)
+            get_product_cache().invalidate()
+            with CaptureQueriesContext(connection) as context:
+                invoice.add_from_items_breakdown(self.items_breakdown(count))
+            self.assertEqual(invoice.items.count(), count)
+            return len(context.captured_queries)
+
+        new_products = queries(1)
+        self.assertEqual(queries(100), new_products)
+        # Every product now exists, so none are created.
+        existing_products = queries(100)
+        self.assertEqual(queries(1), existing_products)
+        self.assertLess(existing_products, new_products)
+
+    def test_bulk_cached_products(self):
+        """Test that the supplier's products are only looked up once, and
+        that products created for an invoice are cached once committed.
+        """
+        supplier = baker.make(supplier_models.Supplier)
+        items_breakdown = self.items_breakdown(10)
+        with self.captureOnCommitCallbacks(execute=True):
+            baker.make(
+                invoice_models.Invoice,
+                supplier=supplier,
+            ).add_from_items_breakdown(items_breakdown)
+
+        invoice = baker.make(invoice_models.Invoice, supplier=supplier)
+        with CaptureQueriesContext(connection) as context:
+            invoice.add_from_items_breakdown(items_breakdown)
+        self.assertFalse(
+            [
+                query
+                for query in context.captured_queries
+                if query["sql"].startswith("SELECT")
+            ]
+        )
+        self.assert_items(invoice, items_breakdown)
+
+    def test_bulk_empty(self):
+        """Test that nothing is queried for an empty breakdown."""
+        invoice = baker.make(invoice_models.Invoice)
+        with self.assertNumQueries(0):
+            self.assertEqual(invoice.add_from_items_breakdown({}), [])
+
+
 class TestInvoiceItem(TestCase):
     """Test the `InvoiceItem` model."""
 
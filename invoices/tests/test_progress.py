@@ -0,0 +1,243 @@
+"""Tests for the `progress` module and the `invoice_progress` view."""
+
+import os
+import threading
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from parser import cache as extraction_cache
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import jobs, models as invoice_models, progress
+
+ParseStatus = invoice_models.ParseStatus
+
+
+async def drain(subscription: progress.Subscription) -> list:
+    """Returns the events a subscription has received so far."""
+    events = []
+    while True:
+        event = await subscription.get(0)
+        if event is None:
+            return events
+        events.append(event)
+
+
+async def collect(stream) -> list:
+    """Returns everything a stream yields."""
+    return [part async for part in stream]
+
+
+@override_settings(PARSE_PROGRESS_TIMEOUT=1, PARSE_PROGRESS_KEEPALIVE=1)
+class BaseProgressTestCase(TestCase):
+    """Base test class for the progress tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        cls.invoice = baker.make(
+            invoice_models.Invoice,
+            user=cls.user,
+            supplier=cls.supplier,
+            parse_status=ParseStatus.QUEUED,
+        )
+
+    def subscribe(self, *invoice_ids: int) -> progress.Subscription:
+        """Subscribes to invoices until the end of the test."""
+        subscription = progress.subscribe(invoice_ids or [self.invoice.id])
+        self.addCleanup(progress.unsubscribe, subscription)
+        return subscription
+
+
+class TestPublish(BaseProgressTestCase):
+    """Tests for the `publish` function."""
+
+    def test_delivered_on_commit(self):
+        """Test that events reach the subscribers of their invoice once the
+        transaction commits.
+        """
+        subscription = self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            progress.publish(self.invoice.id, progress.PARSING)
+            progress.publish(self.invoice.id + 1, progress.PARSING)
+            self.assertEqual(async_to_sync(drain)(subscription), [])
+        self.assertEqual(
+            async_to_sync(drain)(subscription),
+            [{"invoice_id": self.invoice.id, "stage": progress.PARSING}],
+        )
+
+    def test_run_job(self):
+        """Test that the stages of a parse are published as it runs."""
+        invoice_fp = os.path.join(
+            "invoices",
+            "tests",
+            "soak_rochford_invoice.pdf",
+        )
+        with open(invoice_fp, "rb") as f:
+            self.invoice.attachment = SimpleUploadedFile("a.pdf", f.read())
+        self.invoice.save()
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+        subscription = self.subscribe()
+        # Pages read from the extraction cache are not extracted.
+        with patch.object(
+            extraction_cache,
+            "get_default_cache",
+            return_value=None,
+        ), self.captureOnCommitCallbacks(execute=True):
+            job = invoice_models.ParseJob.enqueue(self.invoice)
+            (job,) = invoice_models.ParseJob.claim("worker", job_ids=[job.id])
+            jobs.run_job(job)
+
+        stages = [e["stage"] for e in async_to_sync(drain)(subscription)]
+        self.assertEqual(stages[0], progress.PARSING)
+        self.assertIn(progress.EXTRACTING, stages)
+        self.assertEqual(stages[-2:], [progress.PARSED, progress.ITEMS_SAVED])
+
+    def test_failed(self):
+        """Test that a failed parse reports whether it will be retried."""
+        baker.make(invoice_models.ParseJob, invoice=self.invoice)
+        (job,) = invoice_models.ParseJob.claim("worker")
+        subscription = self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.fail_job(job, "boom")
+        (event,) = async_to_sync(drain)(subscription)
+        self.assertEqual(event["stage"], progress.FAILED)
+        self.assertTrue(event["retrying"])
+        self.assertFalse(progress.is_final(event))
+
+
+class TestStream(BaseProgressTestCase):
+    """Tests for the `stream` function."""
+
+    def test_until_done(self):
+        """Test that the current status and then the progress of each
+        invoice is sent until every invoice is done with.
+        """
+        other = baker.make(
+            invoice_models.Invoice,
+            parse_status=ParseStatus.PARSED,
+        )
+        subscription = self.subscribe(self.invoice.id, other.id)
+        current = progress.statuses(
+            [(self.invoice.id, ParseStatus.QUEUED), (other.id, "parsed")]
+        )
+        for stage in (progress.PARSING, progress.ITEMS_SAVED):
+            progress.deliver({"invoice_id": self.invoice.id, "stage": stage})
+
+        parts = async_to_sync(collect)(progress.stream(subscription, current))
+        self.assertEqual(
+            parts,
+            [
+                f"retry: {progress.RETRY_MS}\n\n",
+                "event: status\ndata: "
+                f'{{"invoice_id": {self.invoice.id}, "stage": "stored"}}\n\n',
+                "event: status\ndata: "
+                f'{{"invoice_id": {other.id}, "stage": "items_saved"}}\n\n',
+                "event: progress\ndata: "
+                f'{{"invoice_id": {self.invoice.id}, "stage": "parsing"}}\n\n',
+                "event: progress\ndata: "
+                f'{{"invoice_id": {self.invoice.id}, '
+                '"stage": "items_saved"}\n\n',
+                "event: done\ndata: {}\n\n",
+            ],
+        )
+
+    @override_settings(
+        PARSE_PROGRESS_TIMEOUT=0.05, PARSE_PROGRESS_KEEPALIVE=0.01
+    )
+    def test_timeout(self):
+        """Test that keepalives are sent while idle, and that the stream is
+        closed once it times out.
+        """
+        subscription = self.subscribe()
+        parts = async_to_sync(collect)(progress.stream(subscription, []))
+        self.assertIn(": keepalive\n\n", parts)
+        self.assertNotIn("event: done", parts[-1])
+
+    def test_ended(self):
+        """Test that the stream is closed where events may have been
+        missed, and that it unsubscribes.
+        """
+        subscription = self.subscribe()
+        progress.deliver(None)
+        parts = async_to_sync(collect)(progress.stream(subscription, []))
+        self.assertEqual(len(parts), 1)
+        self.assertNotIn(subscription, progress._subscriptions)
+
+
+class TestInvoiceProgress(BaseProgressTestCase):
+    """Tests for the `invoice_progress` view."""
+
+    def setUp(self):
+        """Set up the test."""
+        self.client.force_login(self.user)
+
+    def read(self, response) -> str:
+        """Returns the streamed content of a response."""
+        return b"".join(response.streaming_content).decode()
+
+    def test_progress(self):
+        """Test that the invoice's progress is streamed as it happens."""
+        response = self.client.get(
+            reverse("invoices:invoice-progress", args=[self.invoice.id])
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        timer = threading.Timer(
+            0.05,
+            progress.deliver,
+            [{"invoice_id": self.invoice.id, "stage": progress.ITEMS_SAVED}],
+        )
+        timer.start()
+        self.addCleanup(timer.cancel)
+        content = self.read(response)
+        self.assertIn('"stage": "stored"', content)
+        self.assertIn('"stage": "items_saved"', content)
+        self.assertTrue(content.endswith("event: done\ndata: {}\n\n"))
+
+    def test_many(self):
+        """Test that the progress of many invoices may be streamed, leaving
+        out those of other users.
+        """
+        parsed = baker.make(
+            invoice_models.Invoice,
+            user=self.user,
+            parse_status=ParseStatus.PARSED,
+        )
+        other = baker.make(invoice_models.Invoice)
+        response = self.client.get(
+            reverse("invoices:progress") + f"?ids={parsed.id},{other.id}"
+        )
+        content = self.read(response)
+        self.assertIn(f'"invoice_id": {parsed.id}', content)
+        self.assertNotIn(f'"invoice_id": {other.id}', content)
+        self.assertTrue(content.endswith("event: done\ndata: {}\n\n"))
+
+    def test_invalid_ids(self):
+        """Test that invalid ids are a bad request."""
+        for ids in ("", "a", ",".join(map(str, range(1, 200)))):
+            response = self.client.get(
+                reverse("invoices:progress") + f"?ids={ids}"
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_no_access(self):
+        """Test that the progress of another user's invoice is not
+        found.
+        """
+        self.client.force_login(baker.make(User))
+        response = self.client.get(
+            reverse("invoices:invoice-progress", args=[self.invoice.id])
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(progress._subscriptions, set())
@@ -0,0 +1,191 @@
+"""Tests for the `reparse` module and the `reparse_invoices` command."""
+
+import os
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from model_bakery import baker
+from parser import parse_for_supplier
+from products.cache import get_product_cache
+from suppliers import models as supplier_models
+from .. import models as invoice_models, reparse
+
+INVOICE_FP = os.path.join("invoices", "tests", "soak_rochford_invoice.pdf")
+ParseStatus = invoice_models.ParseStatus
+
+
+class BaseReparseTestCase(TestCase):
+    """Base test class for the reparse tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        cls.version = parse_for_supplier.parser_version("Soak Rochford")
+
+    def setUp(self):
+        """Set up the test."""
+        # Products cached by other tests were rolled back.
+        get_product_cache().invalidate()
+
+    def make_invoice(self, content: bytes = None, **kwargs):
+        """Returns an invoice with a Soak Rochford invoice attached."""
+        if content is None:
+            with open(INVOICE_FP, "rb") as f:
+                content = f.read()
+        kwargs.setdefault("supplier", self.supplier)
+        kwargs.setdefault("parse_status", ParseStatus.PARSED)
+        return baker.make(
+            invoice_models.Invoice,
+            attachment=SimpleUploadedFile("test.pdf", content),
+            **kwargs,
+        )
+
+
+class TestStaleInvoices(BaseReparseTestCase):
+    """Tests for the `stale_invoices` function."""
+
+    def test_selects_older_versions(self):
+        """Test that only invoices not parsed by the current version of the
+        parser are selected.
+        """
+        unversioned = self.make_invoice()
+        older = self.make_invoice(parser_version="0")
+        self.make_invoice(parser_version=self.version)
+        self.assertEqual(
+            list(reparse.stale_invoices()),
+            [unversioned, older],
+        )
+
+    def test_excludes_pending(self):
+        """Test that invoices without attachments or waiting to be parsed
+        are not selected.
+        """
+        baker.make(invoice_models.Invoice, supplier=self.supplier)
+        self.make_invoice(parse_status=ParseStatus.QUEUED)
+        self.make_invoice(parse_status=ParseStatus.PARSING)
+        failed = self.make_invoice(parse_status=ParseStatus.FAILED)
+        self.assertEqual(list(reparse.stale_invoices()), [failed])
+
+    def test_filters(self):
+        """Test that invoices may be filtered by supplier and date."""
+        invoice = self.make_invoice(date_ordered=date(2022, 2, 1))
+        self.make_invoice(date_ordered=date(2022, 1, 1))
+        self.make_invoice(date_ordered=date(2022, 3, 1))
+        self.make_invoice(
+            supplier=baker.make(
+                supplier_models.Supplier,
+                name="Tiny Box Company",
+            ),
+            date_ordered=date(2022, 2, 1),
+        )
+        self.assertEqual(
+            list(
+                reparse.stale_invoices(
+                    ["Soak Rochford"],
+                    date(2022, 1, 15),
+                    date(2022, 2, 15),
+                )
+            ),
+            [invoice],
+        )
+
+    def test_no_parser(self):
+        """Test that nothing is selected for suppliers without a parser."""
+        self.make_invoice()
+        self.assertFalse(reparse.stale_invoices(["Amazon"]).exists())
+
+
+class TestReparse(BaseReparseTestCase):
+    """Tests for the `reparse` function."""
+
+    def test_reparse(self):
+        """Test that the parsed data and items of stale invoices are
+        replaced, and the checkpoint is removed once complete.
+        """
+        invoice = self.make_invoice(parser_version="0", order_number="old")
+        stale_item = baker.make(invoice_models.InvoiceItem, invoice=invoice)
+        progress = reparse.reparse(max_workers=1)
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.order_number, "12345")
+        self.assertEqual(invoice.parser_version, self.version)
+        self.assertEqual(invoice.items.count(), 27)
+        self.assertFalse(invoice.items.filter(id=stale_item.id).exists())
+        self.assertEqual((progress.reparsed, progress.failed), (1, 0))
+        self.assertFalse(invoice_models.ReparseCheckpoint.objects.exists())
+        self.assertFalse(reparse.stale_invoices().exists())
+
+    def test_failure(self):
+        """Test that an invoice which fails to parse is left as it was."""
+        invoice = self.make_invoice(b"%PDF-a", order_number="old")
+        progress = reparse.reparse(max_workers=1)
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.order_number, "old")
+        self.assertEqual(invoice.parse_status, ParseStatus.PARSED)
+        self.assertIsNone(invoice.parser_version)
+        self.assertEqual((progress.reparsed, progress.failed), (0, 1))
+
+    def test_resume(self):
+        """Test that an interrupted run resumes after the last batch it
+        saved.
+        """
+        first = self.make_invoice(b"%PDF-a")
+        second = self.make_invoice(b"%PDF-b")
+
+        def interrupt(progress):
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            reparse.reparse(batch_size=1, max_workers=1, on_batch=interrupt)
+        checkpoint = invoice_models.ReparseCheckpoint.objects.get()
+        self.assertEqual(checkpoint.last_invoice_id, first.id)
+
+        with patch.object(
+            reparse,
+            "parse_batch",
+            wraps=reparse.parse_batch,
+        ) as parse_batch:
+            progress = reparse.reparse(batch_size=1, max_workers=1)
+        parse_batch.assert_called_once_with([second], 1)
+        self.assertEqual(progress.failed, 2)
+
+    def test_restart(self):
+        """Test that a run may be restarted from the first invoice."""
+        invoice = self.make_invoice(b"%PDF-a")
+        invoice_models.ReparseCheckpoint.objects.create(
+            name=reparse.DEFAULT_CHECKPOINT,
+            last_invoice_id=invoice.id,
+            failed=1,
+        )
+        progress = reparse.reparse(max_workers=1, restart=True)
+        self.assertEqual(progress.failed, 1)
+
+
+class TestReparseInvoicesCommand(BaseReparseTestCase):
+    """Tests for the `reparse_invoices` command."""
+
+    def test_command(self):
+        """Test that the command reparses stale invoices and reports its
+        progress.
+        """
+        invoice = self.make_invoice(date_ordered=date(2022, 2, 1))
+        out = StringIO()
+        call_command(
+            "reparse_invoices",
+            "--supplier=Soak Rochford",
+            "--from=2022-01-01",
+            "--workers=1",
+            stdout=out,
+        )
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.parser_version, self.version)
+        self.assertIn("Done. Reparsed 1, failed 0.", out.getvalue())
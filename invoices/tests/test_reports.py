@@ -0,0 +1,292 @@
+"""Tests for the `reports` module and the `SpendReportView` view."""
+
+from datetime import date
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from products import models as product_models
+from suppliers import models as supplier_models
+from .. import models as invoice_models, reports
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    },
+    REPORT_CACHE_ALIAS="default",
+)
+class BaseReportTestCase(TestCase):
+    """Base test class for the report tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.make_data()
+
+    @classmethod
+    def make_data(cls):
+        """Makes the invoices reported on."""
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(supplier_models.Supplier, name="Supplier")
+        cls.tea = baker.make(product_models.ProductCategory, name="Tea")
+        cls.packaging = baker.make(
+            product_models.ProductCategory,
+            name="Packaging",
+        )
+        cls.january = cls.make_invoice(date(2022, 1, 5))
+        cls.make_item(cls.january, cls.tea, "4.00", 2)
+        cls.make_item(cls.january, cls.tea, "6.00", 1)
+        cls.make_item(cls.january, cls.packaging, "10.00", 5)
+        cls.february = cls.make_invoice(date(2022, 2, 5))
+        cls.make_item(cls.february, cls.tea, "20.00", 4)
+        cls.make_item(
+            cls.make_invoice(date(2022, 1, 5), user=baker.make(User)),
+            cls.tea,
+            "100.00",
+            1,
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        caches["default"].clear()
+
+    @classmethod
+    def make_invoice(cls, date_ordered: date, user: User = None):
+        """Makes an invoice with 20% VAT."""
+        return baker.make(
+            invoice_models.Invoice,
+            user=user or cls.user,
+            supplier=cls.supplier,
+            date_ordered=date_ordered,
+            subtotal=Decimal("20.00"),
+            vat=Decimal("4.00"),
+        )
+
+    @staticmethod
+    def make_item(invoice, category, price_ex_vat: str, quantity: int):
+        """Makes an item on an invoice."""
+        return baker.make(
+            invoice_models.InvoiceItem,
+            invoice=invoice,
+            category=category,
+            price_ex_vat=Decimal(price_ex_vat),
+            quantity=quantity,
+        )
+
+
+class TestSpend(BaseReportTestCase):
+    """Tests for the `spend` function."""
+
+    def test_spend(self):
+        """Test that spend is totalled by supplier, category and month, with
+        VAT apportioned to each item by its price, from the rollups.
+        """
+        self.assertEqual(
+            [
+                (
+                    row["month"],
+                    row["supplier_id"],
+                    row["category_name"],
+                    row["total_ex_vat"],
+                    row["vat"],
+                    row["item_count"],
+                    row["quantity"],
+                )
+                for row in reports.spend(self.user)
+            ],
+            [
+                (
+                    date(2022, 1, 1),
+                    self.supplier.id,
+                    "Packaging",
+                    Decimal("10.00"),
+                    Decimal("2.00"),
+                    1,
+                    5,
+                ),
+                (
+                    date(2022, 1, 1),
+                    self.supplier.id,
+                    "Tea",
+                    Decimal("10.00"),
+                    Decimal("2.00"),
+                    2,
+                    3,
+                ),
+                (
+                    date(2022, 2, 1),
+                    self.supplier.id,
+                    "Tea",
+                    Decimal("20.00"),
+                    Decimal("4.00"),
+                    1,
+                    4,
+                ),
+            ],
+        )
+
+    def test_superuser(self):
+        """Test that superusers are reported on every invoice."""
+        superuser = baker.make(User, is_superuser=True)
+        tea = [
+            row
+            for row in reports.spend(superuser)
+            if row["month"] == date(2022, 1, 1)
+            and row["category_name"] == "Tea"
+        ]
+        self.assertEqual(tea[0]["total_ex_vat"], Decimal("110.00"))
+
+    def test_dates(self):
+        """Test that the report may be limited to a range of months."""
+        rows = reports.spend(
+            self.user,
+            date_from=date(2022, 2, 1),
+            date_to=date(2022, 2, 28),
+        )
+        self.assertEqual([row["month"] for row in rows], [date(2022, 2, 1)])
+        self.assertEqual(rows[0]["total_ex_vat"], Decimal("20.00"))
+
+    def test_partial_months(self):
+        """Test that a report limited to dates part way through a month only
+        includes the invoices ordered between those dates, and matches the
+        rollups where it covers every invoice in a month.
+        """
+        for date_from, date_to, months in (
+            (date(2022, 1, 6), None, [date(2022, 2, 1)]),
+            (None, date(2022, 2, 4), [date(2022, 1, 1)] * 2),
+            (date(2022, 1, 6), date(2022, 2, 4), []),
+            (date(2022, 1, 5), date(2022, 1, 5), [date(2022, 1, 1)] * 2),
+            (
+                date(2022, 1, 2),
+                date(2022, 2, 10),
+                [date(2022, 1, 1)] * 2 + [date(2022, 2, 1)],
+            ),
+            (date(2022, 2, 10), date(2022, 1, 2), []),
+        ):
+            with self.subTest(date_from=date_from, date_to=date_to):
+                rows = reports.spend(self.user, date_from, date_to)
+                self.assertEqual([row["month"] for row in rows], months)
+                self.assertEqual(
+                    rows,
+                    [
+                        row
+                        for row in reports.spend(self.user)
+                        if row["month"] in months
+                    ],
+                )
+
+
+class TestCachedSpend(BaseReportTestCase):
+    """Tests for the `cached_spend` function."""
+
+    def test_cached(self):
+        """Test that the report is only calculated once while the user's
+        invoices are unchanged.
+        """
+        report = reports.cached_spend(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(reports.cached_spend(self.user), report)
+
+    def test_item_changed(self):
+        """Test that the report is recalculated once an item changes."""
+        reports.cached_spend(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_item(self.february, self.tea, "5.00", 1)
+        rows = reports.cached_spend(self.user)
+        self.assertEqual(rows[-1]["total_ex_vat"], Decimal("25.00"))
+
+    def test_invoice_deleted(self):
+        """Test that the report is recalculated once an invoice is
+        deleted.
+        """
+        reports.cached_spend(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.february.delete()
+        rows = reports.cached_spend(self.user)
+        self.assertNotIn(date(2022, 2, 1), [row["month"] for row in rows])
+
+    def test_other_user_changed(self):
+        """Test that another user's changes leave the report cached."""
+        key = reports.cache_key(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_item(
+                self.make_invoice(date(2022, 1, 1), user=baker.make(User)),
+                self.tea,
+                "1.00",
+                1,
+            )
+        self.assertEqual(reports.cache_key(self.user), key)
+
+    def test_renamed(self):
+        """Test that the report is recalculated once a supplier or category
+        is renamed.
+        """
+        reports.cached_spend(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.name = "Renamed supplier"
+            self.supplier.save()
+            self.tea.name = "Renamed tea"
+            self.tea.save()
+        rows = reports.cached_spend(self.user)
+        self.assertEqual(
+            {row["supplier_name"] for row in rows},
+            {"Renamed supplier"},
+        )
+        self.assertIn("Renamed tea", [row["category_name"] for row in rows])
+
+    def test_names_version_lost(self):
+        """Test that the version of the names starts again from a new value
+        where it is lost from the cache.
+        """
+        version = reports.names_version()
+        caches["default"].delete(reports.NAMES_VERSION_KEY)
+        self.assertNotEqual(reports.names_version(), version)
+
+
+class TestSpendReportView(BaseReportTestCase):
+    """Tests for the `SpendReportView` view."""
+
+    def test_report(self):
+        """Test that the user's report is returned."""
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("invoices:report-spend") + "?from=2022-02-01"
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "results": [
+                    {
+                        "month": "2022-02-01",
+                        "supplier_id": self.supplier.id,
+                        "supplier_name": "Supplier",
+                        "category_id": self.tea.id,
+                        "category_name": "Tea",
+                        "total_ex_vat": "20.00",
+                        "vat": "4.00",
+                        "item_count": 1,
+                        "quantity": 4,
+                    }
+                ]
+            },
+        )
+
+    def test_invalid_date(self):
+        """Test that an invalid date is a bad request."""
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("invoices:report-spend") + "?to=2022"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_unauthenticated(self):
+        """Test that the report requires a user."""
+        response = self.client.get(reverse("invoices:report-spend"))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,269 @@
+"""Tests for the `rollups` module and the `rebuild_rollups` command."""
+
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from products import models as product_models
+from suppliers import models as supplier_models
+from .. import models as invoice_models, rollups
+
+
+class BaseRollupTestCase(TestCase):
+    """Base test class for the rollup tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(supplier_models.Supplier)
+        cls.tea = baker.make(product_models.ProductCategory, name="Tea")
+        cls.coffee = baker.make(product_models.ProductCategory, name="Coffee")
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.invoice = cls.make_invoice(date(2022, 1, 5))
+            cls.item = baker.make(
+                invoice_models.InvoiceItem,
+                invoice=cls.invoice,
+                category=cls.tea,
+                price_ex_vat=Decimal("10.00"),
+                quantity=2,
+            )
+
+    @classmethod
+    def make_invoice(cls, date_ordered: date, **kwargs):
+        """Makes an invoice with 20% VAT."""
+        return baker.make(
+            invoice_models.Invoice,
+            user=cls.user,
+            supplier=cls.supplier,
+            date_ordered=date_ordered,
+            subtotal=Decimal("10.00"),
+            vat=Decimal("2.00"),
+            **kwargs,
+        )
+
+    def rollups(self) -> list:
+        """Returns the user's rollups."""
+        return list(
+            invoice_models.SpendRollup.objects.filter(user=self.user)
+            .order_by("month", "category__name")
+            .values_list(
+                "supplier_id",
+                "category_id",
+                "month",
+                "total_ex_vat",
+                "vat",
+                "item_count",
+                "quantity",
+            )
+        )
+
+    def assertConsistent(self):
+        """Asserts that every rollup matches the items."""
+        self.assertEqual(list(rollups.check()), [])
+
+
+class TestIncrementalRollups(BaseRollupTestCase):
+    """Tests for keeping the rollups up to date as invoices change."""
+
+    def test_created(self):
+        """Test that a rollup is made for a new invoice's items."""
+        self.assertEqual(
+            self.rollups(),
+            [
+                (
+                    self.supplier.id,
+                    self.tea.id,
+                    date(2022, 1, 1),
+                    Decimal("10.00"),
+                    Decimal("2.00"),
+                    1,
+                    2,
+                )
+            ],
+        )
+        self.assertConsistent()
+
+    def test_bulk_created(self):
+        """Test that items added without signals along with a change to
+        their invoice, as when an invoice is parsed, are rolled up.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.invoice.subtotal = Decimal("20.00")
+                self.invoice.save(update_fields=["subtotal"])
+                invoice_models.InvoiceItem.objects.bulk_create(
+                    [
+                        baker.prepare(
+                            invoice_models.InvoiceItem,
+                            invoice=self.invoice,
+                            category=self.coffee,
+                            price_ex_vat=Decimal("10.00"),
+                            quantity=1,
+                            _save_related=True,
+                        )
+                    ]
+                )
+        self.assertEqual(
+            [(row[1], row[4]) for row in self.rollups()],
+            [
+                (self.coffee.id, Decimal("1.00")),
+                (self.tea.id, Decimal("1.00")),
+            ],
+        )
+        self.assertConsistent()
+
+    def test_category_changed(self):
+        """Test that reassigning an item's category moves its spend."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.category = self.coffee
+            self.item.save()
+        self.assertEqual(
+            [row[1] for row in self.rollups()],
+            [self.coffee.id],
+        )
+        self.assertConsistent()
+
+    def test_invoice_moved(self):
+        """Test that changing an invoice's date or supplier moves its items'
+        spend out of the slice it was in.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.date_ordered = date(2022, 3, 1)
+            self.invoice.save()
+        self.assertEqual(
+            [row[2] for row in self.rollups()],
+            [date(2022, 3, 1)],
+        )
+
+        supplier = baker.make(supplier_models.Supplier)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.supplier = supplier
+            self.invoice.save()
+        self.assertEqual(
+            [row[0] for row in self.rollups()],
+            [supplier.id],
+        )
+        self.assertConsistent()
+
+    def test_item_moved(self):
+        """Test that moving an item to another invoice moves its spend."""
+        with self.captureOnCommitCallbacks(execute=True):
+            other = self.make_invoice(None)
+            self.item.invoice = other
+            self.item.save()
+        self.assertEqual([row[2] for row in self.rollups()], [None])
+        self.assertConsistent()
+
+    def test_deleted(self):
+        """Test that deleting an invoice drops its rollups."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.delete()
+        self.assertEqual(self.rollups(), [])
+
+    def test_unrelated_change(self):
+        """Test that changes which do not affect the spend are ignored."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.invoice.parse_status = invoice_models.ParseStatus.PARSED
+            self.invoice.save(update_fields=["parse_status"])
+        self.assertEqual(callbacks, [])
+
+    def test_slice_refreshed_once(self):
+        """Test that many changes to a slice in a transaction recalculate
+        it once.
+        """
+        with patch.object(
+            rollups,
+            "refresh",
+            wraps=rollups.refresh,
+        ) as refresh, self.captureOnCommitCallbacks(execute=True):
+            baker.make(
+                invoice_models.InvoiceItem,
+                invoice=self.invoice,
+                category=self.tea,
+                _quantity=5,
+            )
+        refresh.assert_called_once()
+        self.assertEqual(self.rollups()[0][5], 6)
+
+    def test_invoice_modified_once(self):
+        """Test that many changes to an invoice's items mark it as modified
+        once, after the transaction commits.
+        """
+        self.invoice.refresh_from_db()
+        modified = self.invoice.date_modified
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                baker.make(
+                    invoice_models.InvoiceItem,
+                    invoice=self.invoice,
+                    category=self.tea,
+                    _quantity=5,
+                )
+                self.invoice.refresh_from_db()
+                self.assertEqual(self.invoice.date_modified, modified)
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in context.captured_queries
+                    if query["sql"].startswith("UPDATE")
+                    and "date_modified" in query["sql"]
+                ]
+            ),
+            1,
+        )
+        self.invoice.refresh_from_db()
+        self.assertGreater(self.invoice.date_modified, modified)
+
+
+class TestRebuild(BaseRollupTestCase):
+    """Tests for the `rebuild` and `check` functions."""
+
+    def test_rebuild(self):
+        """Test that drifted rollups are found and recalculated, and that
+        rollups of users without invoices are dropped.
+        """
+        expected = self.rollups()
+        invoice_models.SpendRollup.objects.update(item_count=5)
+        baker.make(invoice_models.SpendRollup, supplier=self.supplier)
+
+        mismatches = list(rollups.check())
+        self.assertEqual(len(mismatches), 2)
+        self.assertEqual(mismatches[0].expected["item_count"], 1)
+        self.assertEqual(mismatches[0].actual["item_count"], 5)
+
+        self.assertEqual(rollups.rebuild(batch_size=1), (1, 1))
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(invoice_models.SpendRollup.objects.count(), 1)
+        self.assertConsistent()
+
+
+class TestRebuildRollupsCommand(BaseRollupTestCase):
+    """Tests for the `rebuild_rollups` command."""
+
+    def test_check(self):
+        """Test that the check fails where the rollups have drifted."""
+        out = StringIO()
+        call_command("rebuild_rollups", "--check", stdout=out)
+        self.assertIn("match", out.getvalue())
+
+        invoice_models.SpendRollup.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--check", stdout=StringIO())
+
+    def test_rebuild(self):
+        """Test that the rollups are rebuilt."""
+        invoice_models.SpendRollup.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_rollups", stdout=out)
+        self.assertIn("Rebuilt 1 rollups for 1 users", out.getvalue())
+        self.assertConsistent()
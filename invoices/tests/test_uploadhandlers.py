@@ -0,0 +1,157 @@
+"""Tests for the `uploadhandlers` module."""
+
+import hashlib
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from suppliers import models as supplier_models
+from .. import models as invoice_models, uploadhandlers
+
+
+def upload(
+    handler: uploadhandlers.InvoiceUploadHandler,
+    chunks: list,
+) -> uploadhandlers.InvoiceUploadedFile:
+    """Uploads `chunks` through `handler` as the upload handler machinery
+    would, returning the uploaded file.
+    """
+    handler.new_file("file", "a.pdf", "application/pdf", None)
+    start = 0
+    for chunk in chunks:
+        handler.receive_data_chunk(chunk, start)
+        start += len(chunk)
+    return handler.file_complete(start)
+
+
+class TestSniff(TestCase):
+    """Tests for the `sniff` function."""
+
+    def test_pdf(self):
+        """Test that a PDF header within the first bytes is a PDF."""
+        self.assertEqual(uploadhandlers.sniff(b"%PDF-1.4"), "pdf")
+        self.assertEqual(uploadhandlers.sniff(b"\n\n%PDF-1.4"), "pdf")
+
+    def test_zip(self):
+        """Test that a ZIP archive is a ZIP archive, even where it contains
+        a PDF.
+        """
+        self.assertEqual(uploadhandlers.sniff(b"PK\x03\x04a.pdf%PDF-"), "zip")
+
+    def test_other(self):
+        """Test that anything else has no type."""
+        self.assertIsNone(uploadhandlers.sniff(b"plain text"))
+
+
+class TestInvoiceUploadHandler(TestCase):
+    """Tests for the `InvoiceUploadHandler` class."""
+
+    def test_upload(self):
+        """Test that the file is written, hashed and sniffed in one pass."""
+        chunks = [b"%PDF-1.4\n", b"a" * 2000, b"b" * 10]
+        file = upload(uploadhandlers.InvoiceUploadHandler(), chunks)
+        self.assertEqual(file.read(), b"".join(chunks))
+        self.assertEqual(file.size, 2019)
+        self.assertEqual(
+            file.content_hash,
+            hashlib.sha256(b"".join(chunks)).hexdigest(),
+        )
+        self.assertEqual(file.sniffed_type, uploadhandlers.PDF)
+        self.assertIsNone(file.upload_error)
+
+    def test_too_large(self):
+        """Test that a file larger than the maximum size is rejected and
+        discarded.
+        """
+        handler = uploadhandlers.InvoiceUploadHandler(max_size=10)
+        file = upload(handler, [b"%PDF-1.4\n", b"abc"])
+        self.assertIn("larger than 10 bytes", file.upload_error)
+        self.assertIsNone(file.content_hash)
+        self.assertEqual(file.read(), b"")
+
+    def test_not_allowed_type(self):
+        """Test that a file of a type which is not allowed is rejected."""
+        handler = uploadhandlers.InvoiceUploadHandler()
+        file = upload(handler, [b"x" * 2000])
+        self.assertEqual(file.upload_error, "The file is not a PDF.")
+        self.assertIsNone(file.content_hash)
+        self.assertEqual(file.read(), b"")
+
+    def test_allowed_types(self):
+        """Test that other types may be allowed."""
+        handler = uploadhandlers.InvoiceUploadHandler(
+            allowed_types=(uploadhandlers.PDF, uploadhandlers.ZIP)
+        )
+        file = upload(handler, [b"PK\x05\x06" + b"\0" * 18])
+        self.assertEqual(file.sniffed_type, uploadhandlers.ZIP)
+        self.assertIsNone(file.upload_error)
+
+
+class TestInvoiceUploadMixin(TestCase):
+    """Tests for the `InvoiceUploadMixin` class via the `InvoiceUpload`
+    view.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data."""
+        super().setUpTestData()
+        cls.user = baker.make(User)
+        cls.supplier = baker.make(
+            supplier_models.Supplier,
+            name="Soak Rochford",
+        )
+        baker.make(
+            supplier_models.UserSupplier,
+            user=cls.user,
+            supplier=cls.supplier,
+        )
+
+    def setUp(self):
+        """Set up the test."""
+        self.client.force_login(self.user)
+
+    def post(self, content: bytes, client: Client = None):
+        """Uploads `content` as an invoice."""
+        return (client or self.client).post(
+            reverse("invoices:upload_new"),
+            data={
+                "supplier": self.supplier.id,
+                "attachment": SimpleUploadedFile("a.pdf", content),
+            },
+        )
+
+    def test_hash_from_handler(self):
+        """Test that the invoice is saved with the hash computed by the
+        handler.
+        """
+        response = self.post(b"%PDF-1.4 invoice")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            invoice_models.Invoice.objects.get().content_hash,
+            hashlib.sha256(b"%PDF-1.4 invoice").hexdigest(),
+        )
+
+    def test_not_pdf(self):
+        """Test that a file which is not a PDF is rejected."""
+        response = self.post(b"not a pdf")
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+    @override_settings(INVOICE_UPLOAD_MAX_SIZE=10)
+    def test_too_large(self):
+        """Test that a file larger than `INVOICE_UPLOAD_MAX_SIZE` is
+        rejected.
+        """
+        response = self.post(b"%PDF-1.4 invoice")
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
+
+    def test_csrf(self):
+        """Test that CSRF protection still applies."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = self.post(b"%PDF-1.4 invoice", client)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(invoice_models.Invoice.objects.exists())
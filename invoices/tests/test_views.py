@@ -38,8 +38,8 @@ class BaseTestCase(TestCase):
         return self.client.get(path).wsgi_request
 
 
-class TestWithInvoice(BaseTestCase):
-    """Test the `with_invoice` decorator."""
+class TestGetInvoice(BaseTestCase):
+    """Test the `get_invoice` function, through the `invoice_edit` view."""
 
     def setUp(self):
         """Set up the test."""
@@ -49,7 +49,7 @@ class TestWithInvoice(BaseTestCase):
             supplier=self.supplier,
         )
 
-    def test_with_invoice_superuser(self):
+    def test_superuser(self):
         """Test that the view is accessible to superusers."""
         res = self.client.get(
             reverse("invoices:invoice-edit", args=[self.invoice.id])
@@ -126,3 +126,48 @@ class TestInvoice(BaseTestCase):
             },
         )
         self.assertEqual(response.status_code, 200)
+
+    def test_post_queues_parse_job(self):
+        """Test that the POST request returns the invoice and its job without
+        waiting for the invoice to be parsed.
+        """
+        response = self.client.post(
+            reverse("invoices:upload_new"),
+            data={"supplier": self.supplier.id},
+        )
+        invoice = invoice_models.Invoice.objects.get()
+        job = invoice.parse_jobs.get()
+        self.assertEqual(
+            response.json(),
+            {
+                "invoice_id": invoice.id,
+                "parse_status": invoice_models.ParseStatus.QUEUED,
+                "job_id": job.id,
+                "job_status": invoice_models.JobStatus.QUEUED,
+                "duplicate": False,
+            },
+        )
+
+    def test_post_duplicate(self):
+        """Test that uploading the same file again responds with the invoice
+        it was first uploaded as.
+        """
+        responses = [
+            self.client.post(
+                reverse("invoices:upload_new"),
+                data={
+                    "supplier": self.supplier.id,
+                    "attachment": SimpleUploadedFile("a.pdf", b"%PDF-a"),
+                },
+            ).json()
+            for _ in range(2)
+        ]
+        self.assertFalse(responses[0]["duplicate"])
+        self.assertTrue(responses[1]["duplicate"])
+        self.assertEqual(
+            responses[0]["invoice_id"],
+            responses[1]["invoice_id"],
+        )
+        self.assertIsNone(responses[1]["job_id"])
+        self.assertEqual(invoice_models.Invoice.objects.count(), 1)
+        self.assertEqual(invoice_models.ParseJob.objects.count(), 1)
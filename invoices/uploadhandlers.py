@@ -0,0 +1,233 @@
+"""The upload handler used by the views which accept invoices.
+
+Each uploaded file is written straight to a temporary file as it streams in
+while, in the same pass, its SHA-256 is computed, its size is checked and its
+type is sniffed from its first bytes. The results are set on the uploaded
+file, so nothing needs to read the file again to hash or validate it.
+"""
+
+import typing as _t
+import hashlib
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+# The number of leading bytes used to sniff the type of a file. A PDF's
+# header need only be within the first 1024 bytes.
+SNIFF_SIZE = 1024
+PDF = "pdf"
+ZIP = "zip"
+TYPE_NAMES = {PDF: "a PDF", ZIP: "a ZIP archive"}
+
+
+def sniff(head: bytes) -> _t.Optional[str]:
+    """Returns the type of a file from its leading bytes.
+
+    :param head: Up to the first `SNIFF_SIZE` bytes of the file.
+    :type head: bytes
+    :return: The type of the file, either `PDF` or `ZIP`, or None where it is
+        neither.
+    :rtype: Optional[str]
+    """
+    # Local file header, or the end of central directory record of an empty
+    # archive. Checked first as a stored PDF's header follows the first
+    # local file header.
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return ZIP
+    if b"%PDF-" in head[:SNIFF_SIZE]:
+        return PDF
+    return None
+
+
+class InvoiceUploadedFile(TemporaryUploadedFile):
+    """A file uploaded through `InvoiceUploadHandler`."""
+
+    # The SHA-256 hex digest of the file's contents.
+    content_hash: _t.Optional[str] = None
+    # The type of the file as sniffed from its contents.
+    sniffed_type: _t.Optional[str] = None
+    # Why the file was rejected. Its contents are discarded when rejected.
+    upload_error: _t.Optional[str] = None
+
+
+class InvoiceUploadHandler(FileUploadHandler):
+    """Streams each uploaded file to a temporary file, hashing, measuring
+    and sniffing it as it goes.
+
+    Files which are too large or of a type which is not allowed are rejected
+    rather than aborting the request, so that the view can report on them.
+    Nothing more of a rejected file is written to disk.
+    """
+
+    def __init__(
+        self,
+        request: _t.Optional[HttpRequest] = None,
+        max_size: _t.Optional[int] = None,
+        allowed_types: _t.Collection[str] = (PDF,),
+    ):
+        """Initialises a new instance of the InvoiceUploadHandler class.
+
+        :param request: The request, defaults to None.
+        :type request: HttpRequest, optional
+        :param max_size: The maximum size of each file in bytes, defaults to
+            no limit.
+        :type max_size: int, optional
+        :param allowed_types: The types of file which may be uploaded,
+            defaults to PDFs only.
+        :type allowed_types: Collection[str], optional
+        """
+        super().__init__(request)
+        self.max_size = max_size
+        self.allowed_types = allowed_types
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = InvoiceUploadedFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+        )
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+
+    def receive_data_chunk(self, raw_data: bytes, start: int):
+        if self.file.upload_error:
+            return None
+
+        self.size += len(raw_data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.reject(f"The file is larger than {self.max_size} bytes.")
+            return None
+
+        if self.file.sniffed_type is None and len(self.head) < SNIFF_SIZE:
+            self.head += raw_data[: SNIFF_SIZE - len(self.head)]
+            if len(self.head) >= SNIFF_SIZE and not self.check_type():
+                return None
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size: int) -> InvoiceUploadedFile:
+        if not self.file.upload_error and self.file.sniffed_type is None:
+            self.check_type()
+        self.file.seek(0)
+        self.file.size = file_size
+        if not self.file.upload_error:
+            self.file.content_hash = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+    def check_type(self) -> bool:
+        """Sniffs the type of the file, rejecting it where the type is not
+        allowed.
+
+        :return: Whether the type is allowed.
+        :rtype: bool
+        """
+        self.file.sniffed_type = sniff(self.head)
+        if self.file.sniffed_type in self.allowed_types:
+            return True
+        self.reject(
+            "The file is not "
+            + " or ".join(TYPE_NAMES[t] for t in self.allowed_types)
+            + "."
+        )
+        return False
+
+    def reject(self, error: str):
+        """Rejects the file, discarding what has been written of it.
+
+        :param error: Why the file was rejected.
+        :type error: str
+        """
+        self.file.upload_error = error
+        self.file.seek(0)
+        self.file.truncate()
+
+
+class InvoiceUploadMixin:
+    """Uploads files to a view through `InvoiceUploadHandler`.
+
+    The upload handlers must be replaced before the request's body is read,
+    which the CSRF middleware would otherwise do, so CSRF protection is
+    applied once they have been replaced instead.
+    """
+
+    # Passed to `InvoiceUploadHandler`.
+    upload_max_size: _t.Optional[int] = None
+    upload_allowed_types: _t.Collection[str] = (PDF,)
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+        request.upload_handlers = [
+            InvoiceUploadHandler(
+                request,
+                self.get_upload_max_size(),
+                self.upload_allowed_types,
+            )
+        ]
+        return self._dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def _dispatch(self, request: HttpRequest, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_upload_max_size(self) -> _t.Optional[int]:
+        """Returns the maximum size of each uploaded file in bytes."""
+        return self.upload_max_size
+
+
+def _check_csrf(request: HttpRequest) -> _t.Optional[HttpResponse]:
+    """Applies CSRF protection to a request, returning the response to
+    reject it with, if any.
+    """
+    return CsrfViewMiddleware(lambda r: None).process_view(
+        request, None, (), {}
+    )
+
+
+def async_invoice_upload(
+    get_max_size: _t.Callable[[], _t.Optional[int]],
+    allowed_types: _t.Collection[str] = (PDF,),
+):
+    """Decorator which uploads files to an async view through
+    `InvoiceUploadHandler`, as `InvoiceUploadMixin` does for class-based
+    views. The request's body is read, and CSRF protection applied, in a
+    thread, so that neither blocks the event loop.
+
+    :param get_max_size: Returns the maximum size of each uploaded file in
+        bytes.
+    :type get_max_size: Callable[[], Optional[int]]
+    :param allowed_types: The types of file which may be uploaded, defaults
+        to PDFs only.
+    :type allowed_types: Collection[str], optional
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request: HttpRequest, *args, **kwargs):
+            request.upload_handlers = [
+                InvoiceUploadHandler(request, get_max_size(), allowed_types)
+            ]
+            rejection = await sync_to_async(_check_csrf)(request)
+            if rejection is not None:
+                return rejection
+            return await view(request, *args, **kwargs)
+
+        # `csrf_exempt` would make the view synchronous.
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
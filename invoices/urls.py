@@ -1,13 +1,34 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework import routers
+from . import api, views
 
 app_name = "invoices"
 
+router = routers.SimpleRouter()
+router.register("invoices", api.InvoiceViewSet, basename="invoice")
+router.register("items", api.InvoiceItemViewSet, basename="item")
+
 urlpatterns = [
-    path("", views.InvoiceUpload.as_view(), name="upload_new"),
+    path("api/", include(router.urls)),
+    path(
+        "api/reports/spend/",
+        api.SpendReportView.as_view(),
+        name="report-spend",
+    ),
+    path("", views.invoice_upload, name="upload_new"),
+    path("bulk/", views.InvoiceBulkUpload.as_view(), name="upload_bulk"),
+    path("direct/", views.DirectUpload.as_view(), name="upload_direct"),
+    path(
+        "direct/<int:upload_id>/confirm/",
+        views.DirectUploadConfirm.as_view(),
+        name="upload_direct_confirm",
+    ),
+    path("export/", views.InvoiceExport.as_view(), name="export"),
+    path("progress/", views.invoice_progress, name="progress"),
+    path("<int:invoice_id>/edit/", views.invoice_edit, name="invoice-edit"),
     path(
-        "<int:invoice_id>/edit/",
-        views.InvoiceEdit.as_view(),
-        name="invoice-edit",
+        "<int:invoice_id>/progress/",
+        views.invoice_progress,
+        name="invoice-progress",
     ),
 ]
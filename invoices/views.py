@@ -1,72 +1,329 @@
-from functools import wraps
+import typing as _t
+from datetime import date
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import Http404
 from django.views import View
-from django.http import HttpRequest, HttpResponse
-from django.utils.decorators import method_decorator
-from . import forms as invoice_forms, models as invoice_models
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from core.streaming import AsyncStreamingHttpResponse
+from . import (
+    async_parse,
+    bulk,
+    direct,
+    export,
+    forms as invoice_forms,
+    models as invoice_models,
+    progress,
+    uploadhandlers,
+)
 
 
-def with_invoice(func):
-    """Decorator to ensure that the invoice is passed to view."""
+def get_invoice(
+    request: HttpRequest, invoice_id: int
+) -> invoice_models.Invoice:
+    """Returns an invoice the user of a request has access to.
+
+    :param request: The request.
+    :type request: HttpRequest
+    :param invoice_id: The invoice's id.
+    :type invoice_id: int
+    :raises Http404: Where the invoice does not exist, the user is not
+        logged in or does not have access to it.
+    :return: The invoice.
+    :rtype: Invoice
+    """
+    invoice = get_object_or_404(invoice_models.Invoice, pk=invoice_id)
+    user = request.user
+    if not user.is_authenticated:
+        raise Http404("You must be logged in to view this page.")
+    if user.has_perm("view_invoice", invoice) or invoice.user == user:
+        return invoice
+    raise Http404("This invoice does not exist or you do not have access.")
+
+
+def _render_upload(request: HttpRequest) -> HttpResponse:
+    """Renders the page where the user uploads an invoice."""
+    return render(
+        request,
+        "invoices/upload_new.html",
+        {"form": invoice_forms.InvoiceUploadForm(user=request.user)},
+    )
+
+
+def _upload_form(
+    request: HttpRequest,
+) -> _t.Tuple[
+    invoice_forms.InvoiceUploadForm, _t.Optional[invoice_models.Invoice]
+]:
+    """Saves an uploaded invoice, returning the form and, where it was
+    valid, the invoice.
+    """
+    form = invoice_forms.InvoiceUploadForm(
+        request.POST,
+        request.FILES,
+        user=request.user,
+    )
+    if not form.is_valid():
+        messages.error(request, form.errors)
+        return form, None
+    return form, form.save()
 
-    @wraps(func)
-    def wrapper(request, invoice_id, *args, **kwargs):
-        invoice = get_object_or_404(invoice_models.Invoice, pk=invoice_id)
-        user = request.user
-        if not user.is_authenticated:
-            raise Http404("You must be logged in to view this page.")
-        if user.has_perm("view_invoice", invoice) or invoice.user == user:
-            return func(request, invoice, *args, **kwargs)
-        raise Http404("This invoice does not exist or you do not have access.")
 
-    return wrapper
+@uploadhandlers.async_invoice_upload(lambda: settings.INVOICE_UPLOAD_MAX_SIZE)
+async def invoice_upload(request: HttpRequest) -> HttpResponse:
+    """View where users are able to upload invoices.
 
+    The invoice is queued to be parsed by the `parse_worker` command. Where
+    `ASYNC_PARSE_WORKERS` is set, it is parsed before responding instead,
+    unless it has to wait too long for its turn.
+    """
+    if request.method == "GET":
+        return await sync_to_async(_render_upload)(request)
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["GET", "POST"])
 
-class InvoiceUpload(View):
-    """View where users are able to upload invoices."""
+    form, invoice = await sync_to_async(_upload_form)(request)
+    if invoice is None:
+        return redirect("invoices:upload_new")
+    job = form.parse_job
+    if job is not None:
+        parsed = await async_parse.parse(job)
+        if parsed is not None:
+            job, invoice = parsed, parsed.invoice
+    return JsonResponse(
+        {
+            "invoice_id": invoice.id,
+            "parse_status": invoice.parse_status,
+            "job_id": job.id if job else None,
+            "job_status": job.status if job else None,
+            "duplicate": form.duplicate,
+        }
+    )
+
+
+class InvoiceBulkUpload(uploadhandlers.InvoiceUploadMixin, View):
+    """View where users are able to upload many invoices at once, as PDFs or
+    ZIP archives of PDFs. Responds with the outcome for each file.
+    """
+
+    upload_allowed_types = (uploadhandlers.PDF, uploadhandlers.ZIP)
+
+    def get_upload_max_size(self) -> int:
+        return settings.BULK_UPLOAD_MAX_SIZE
 
     def get(self, request: HttpRequest) -> HttpResponse:
+        if not request.user.is_authenticated:
+            raise Http404("You must be logged in to view this page.")
         return render(
             request,
             "invoices/upload_new.html",
-            {"form": invoice_forms.InvoiceUploadForm(user=request.user)},
+            {"form": invoice_forms.InvoiceBulkUploadForm(user=request.user)},
         )
 
     def post(self, request: HttpRequest) -> HttpResponse:
-        form = invoice_forms.InvoiceUploadForm(
+        if not request.user.is_authenticated:
+            raise Http404("You must be logged in to view this page.")
+        form = invoice_forms.InvoiceBulkUploadForm(
             request.POST,
             request.FILES,
             user=request.user,
         )
-        if form.is_valid():
-            form.save()
-            return HttpResponse("OK")
-        else:
+        if not form.is_valid():
             messages.error(request, form.errors)
-            return redirect("invoices:upload_new")
+            return redirect("invoices:upload_bulk")
 
+        try:
+            manifest = bulk.bulk_upload(
+                request.user,
+                request.FILES.getlist("files"),
+                form.cleaned_data["supplier"],
+            )
+        except bulk.BulkUploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse({"files": manifest})
 
-@method_decorator(with_invoice, name="dispatch")
-class InvoiceEdit(View):
-    """View where users are able to edit the invoice and the invoice items."""
 
-    def get(
-        self,
-        request: HttpRequest,
-        invoice: invoice_models.Invoice,
-    ) -> HttpResponse:
-        invoice_form = invoice_forms.InvoiceForm(instance=invoice)
-        invoice_items_formset = invoice_forms.invoice_item_formset(
-            invoice.items.all()
+class DirectUpload(View):
+    """View which permits users to upload an invoice directly to object
+    storage, responding with a presigned POST to upload it with.
+    """
+
+    def post(self, request: HttpRequest) -> HttpResponse:
+        if not request.user.is_authenticated:
+            raise Http404("You must be logged in to view this page.")
+        form = invoice_forms.DirectUploadForm(request.POST, user=request.user)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        try:
+            upload, presigned_post = direct.create(
+                request.user,
+                form.cleaned_data["supplier"],
+                form.cleaned_data["filename"],
+            )
+        except direct.DirectUploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(
+            {
+                "upload_id": upload.id,
+                "url": presigned_post["url"],
+                "fields": presigned_post["fields"],
+                "expires_at": upload.expires_at,
+            }
         )
 
-        return render(
-            request,
-            "invoices/edit.html",
+
+class DirectUploadConfirm(View):
+    """View where users confirm that they have uploaded an invoice directly
+    to object storage, queueing it to be parsed.
+    """
+
+    def post(self, request: HttpRequest, upload_id: int) -> HttpResponse:
+        if not request.user.is_authenticated:
+            raise Http404("You must be logged in to view this page.")
+        upload = get_object_or_404(
+            invoice_models.DirectUpload,
+            pk=upload_id,
+            user_id=request.user.id,
+        )
+        try:
+            invoice, job = direct.confirm(upload)
+        except direct.DirectUploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(
             {
-                "invoice_form": invoice_form,
-                "invoice_items_formset": invoice_items_formset,
+                "invoice_id": invoice.id,
+                "parse_status": invoice.parse_status,
+                "job_id": job.id if job else None,
+                "job_status": job.status if job else None,
+            }
+        )
+
+
+class InvoiceExport(View):
+    """View where users are able to export their invoices and items as CSV,
+    optionally limited to those ordered between `?from=` and `?to=`.
+    """
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        if not request.user.is_authenticated:
+            raise Http404("You must be logged in to view this page.")
+        try:
+            dates = {
+                name: date.fromisoformat(request.GET[param])
+                for name, param in (("date_from", "from"), ("date_to", "to"))
+                if request.GET.get(param)
+            }
+        except ValueError:
+            return JsonResponse(
+                {"error": "Dates must be in the form YYYY-MM-DD."},
+                status=400,
+            )
+        return StreamingHttpResponse(
+            export.iter_csv(request.user, **dates),
+            content_type="text/csv",
+            headers={
+                "Content-Disposition": 'attachment; filename="invoices.csv"'
+            },
+        )
+
+
+def _render_edit(request: HttpRequest, invoice_id: int) -> HttpResponse:
+    """Renders the page where the user edits an invoice."""
+    invoice = get_invoice(request, invoice_id)
+    invoice_form = invoice_forms.InvoiceForm(instance=invoice)
+    invoice_items_formset = invoice_forms.invoice_item_formset(
+        invoice.items.all()
+    )
+
+    return render(
+        request,
+        "invoices/edit.html",
+        {
+            "invoice_form": invoice_form,
+            "invoice_items_formset": invoice_items_formset,
+        },
+    )
+
+
+async def invoice_edit(request: HttpRequest, invoice_id: int) -> HttpResponse:
+    """View where users are able to edit the invoice and the invoice items."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    return await sync_to_async(_render_edit)(request, invoice_id)
+
+
+def _subscribe(
+    request: HttpRequest,
+    invoice_id: _t.Optional[int],
+) -> _t.Union[HttpResponse, progress.Subscription]:
+    """Subscribes to the progress of the invoice, or of the `?ids=` of the
+    invoices, a request asks after, returning the subscription or the
+    response to reject the request with.
+    """
+    if invoice_id is not None:
+        return progress.subscribe([get_invoice(request, invoice_id).id])
+
+    if not request.user.is_authenticated:
+        raise Http404("You must be logged in to view this page.")
+    try:
+        invoice_ids = {
+            int(i) for i in request.GET.get("ids", "").split(",") if i
+        }
+    except ValueError:
+        invoice_ids = set()
+    if not invoice_ids or len(invoice_ids) > progress.MAX_INVOICES:
+        return JsonResponse(
+            {
+                "error": "ids must be a comma separated list of up to "
+                f"{progress.MAX_INVOICES} invoice ids."
             },
+            status=400,
         )
+    return progress.subscribe(
+        export.user_invoices(request.user)
+        .filter(pk__in=invoice_ids)
+        .values_list("id", flat=True)
+    )
+
+
+def _current_statuses(subscription: progress.Subscription) -> list:
+    """Returns the current status of a subscription's invoices."""
+    return progress.statuses(
+        invoice_models.Invoice.objects.filter(
+            pk__in=subscription.invoice_ids
+        ).values_list("id", "parse_status")
+    )
+
+
+async def invoice_progress(
+    request: HttpRequest,
+    invoice_id: _t.Optional[int] = None,
+) -> HttpResponse:
+    """View which streams the progress of parsing an invoice, or several
+    invoices given as `?ids=`, as server-sent events. Each invoice's current
+    status is sent first, then its progress until it is done with.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    subscription = await sync_to_async(_subscribe)(request, invoice_id)
+    if isinstance(subscription, HttpResponse):
+        return subscription
+    try:
+        # Read once subscribed, so that no progress is missed in between.
+        current = await sync_to_async(_current_statuses)(subscription)
+    except BaseException:
+        progress.unsubscribe(subscription)
+        raise
+    return AsyncStreamingHttpResponse(
+        progress.stream(subscription, current),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,120 @@
+"""Backends used to extract the text from invoices.
+
+Each supplier in `parse_for_supplier.SUPPLIER_PARSERS` names the backend used
+to read its invoices. Before moving a supplier to a different backend, check
+that its parser produces the same output under both using
+`python -m parser.differential`.
+"""
+
+import typing as _t
+import re
+from abc import ABC, abstractmethod
+from . import pdf
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover
+    pypdf = None
+
+DEFAULT_BACKEND = "borb"
+
+
+class ExtractionBackend(ABC):
+    """An abstract base class for extracting the text from an invoice."""
+
+    # The name the backend is registered under.
+    name: str
+    # Forms part of the key used to cache extracted text. Must change
+    # whenever the text extracted by the backend changes.
+    version: str
+
+    def __str__(self):
+        return self.name
+
+    def available(self) -> bool:
+        """Whether the dependencies of the backend are installed."""
+        return True
+
+    @abstractmethod
+    def iter_pages(self, file_path: pdf.Source) -> _t.Iterator[str]:
+        """Yields the text of each page of an invoice, stopping at the first
+        page without any text. Pages that have not been reached when the
+        generator is closed should not be decoded. Where the number of pages
+        is known without reading them, the text is yielded as a
+        `pdf.PageText` carrying it.
+
+        :param file_path: The path to or a file object of the invoice.
+        :type file_path: pdf.Source
+        :return: An iterator over the text of each page.
+        :rtype: Iterator[str]
+        """
+
+
+class BorbBackend(ExtractionBackend):
+    """Renders each page with borb to work out the layout of the text. Slow,
+    but able to cope with most PDFs.
+    """
+
+    name = "borb"
+    version = pdf.EXTRACTOR_VERSION
+
+    def iter_pages(self, file_path: pdf.Source) -> _t.Iterator[str]:
+        return pdf.iter_pages(file_path)
+
+
+class PypdfBackend(ExtractionBackend):
+    """Reads the text layer of each page with pypdf without rendering it.
+    Many times faster than borb for PDFs with a simple text layer.
+
+    Each line is stripped, runs of spaces are collapsed and blank lines are
+    dropped to bring the output close to borb's. It is not always identical,
+    for example pypdf keeps the spaces borb drops either side of punctuation.
+    """
+
+    name = "pypdf"
+    version = f"pypdf-{getattr(pypdf, '__version__', None)}.1"
+
+    def available(self) -> bool:
+        return pypdf is not None
+
+    def iter_pages(self, file_path: pdf.Source) -> _t.Iterator[str]:
+        with pdf.open_source(file_path) as f:
+            pages = pypdf.PdfReader(f).pages
+            for page in pages:
+                page_text = self.normalise(page.extract_text())
+                if not page_text:
+                    return
+                yield pdf.PageText(page_text, len(pages))
+
+    @staticmethod
+    def normalise(page_text: str) -> str:
+        """Normalises the whitespace of the text of a page."""
+        lines = (
+            re.sub(r" {2,}", " ", line.strip())
+            for line in page_text.split("\n")
+        )
+        return "\n".join(line for line in lines if line)
+
+
+BACKENDS: _t.Dict[str, ExtractionBackend] = {
+    backend.name: backend for backend in (BorbBackend(), PypdfBackend())
+}
+
+
+def get_backend(name: _t.Optional[str] = None) -> ExtractionBackend:
+    """Returns a backend by name. Where the backend's dependencies are not
+    installed, the default backend is returned instead.
+
+    :param name: The name of the backend, defaults to the default backend.
+    :type name: str, optional
+    :raises ValueError: Where there is no backend with the name.
+    :return: The backend.
+    :rtype: ExtractionBackend
+    """
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Extraction backend {name} does not exist.")
+    backend = BACKENDS[name]
+    if not backend.available():
+        return BACKENDS[DEFAULT_BACKEND]
+    return backend
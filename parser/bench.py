@@ -0,0 +1,322 @@
+"""Benchmarks for the parsers.
+
+Times each stage of parsing (extraction, items breakdown, summary and
+metadata) separately for every fixture invoice, reporting the mean and 95th
+percentile time and the peak memory allocated by each stage. Results can be
+written as JSON and compared against a previous run to catch regressions.
+
+Run with `python -m parser.bench`.
+"""
+
+import typing as _t
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+import time
+import timeit
+import tracemalloc
+from . import pdf, parse_for_supplier
+from .parse_for_supplier import SUPPLIER_PARSERS, BaseSupplierParser
+
+FIXTURES_DIR = os.path.join("parser", "tests", "invoices")
+# Invoices whose supplier is detected rather than taken from the directory.
+OTHER_FIXTURES = os.path.join("invoices", "tests", "*.pdf")
+
+STAGES = ("extraction", "items_breakdown", "summary", "metadata")
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 20.0
+
+
+def supplier_fixtures() -> _t.Iterator[_t.Tuple[str, str]]:
+    """Yields the path and supplier of each PDF in the fixtures directory.
+    Each supplier's invoices are kept in a directory named after the
+    supplier, e.g: `tiny_box_company` for "Tiny Box Company".
+    """
+    suppliers = {
+        name.lower().replace(" ", "_"): name for name in SUPPLIER_PARSERS
+    }
+    for directory in sorted(os.listdir(FIXTURES_DIR)):
+        if directory not in suppliers:
+            continue
+        supplier_dir = os.path.join(FIXTURES_DIR, directory)
+        for filename in sorted(os.listdir(supplier_dir)):
+            if filename.endswith(".pdf"):
+                yield (
+                    os.path.join(supplier_dir, filename),
+                    suppliers[directory],
+                )
+
+
+def all_fixtures() -> _t.Iterator[_t.Tuple[str, str]]:
+    """Yields the path and supplier of every fixture invoice, including
+    those outside of the parser's fixtures directory.
+    """
+    yield from supplier_fixtures()
+    for filepath in sorted(glob.glob(OTHER_FIXTURES)):
+        supplier = parse_for_supplier.detect_supplier(filepath)
+        if supplier is not None:
+            yield filepath, supplier
+
+
+def parser_class(supplier: str) -> _t.Type[BaseSupplierParser]:
+    """Returns the parser class for a supplier."""
+    return getattr(parse_for_supplier, SUPPLIER_PARSERS[supplier]["class"])
+
+
+def percentile(samples: _t.List[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _stage_funcs(
+    parser: BaseSupplierParser,
+) -> _t.Dict[str, _t.Callable[[], _t.Any]]:
+    """Returns a function to run each stage of parsing with `parser`."""
+
+    def extraction():
+        # The cache would otherwise mean that only the first run extracts.
+        parser.invoice_data = parser.read_invoice(use_cache=False)
+
+    return {
+        "extraction": extraction,
+        "items_breakdown": parser._items_breakdown,
+        "summary": parser._summary,
+        "metadata": parser._metadata,
+    }
+
+
+def bench_invoice(
+    filepath: str,
+    supplier: str,
+    repeat: int = DEFAULT_REPEAT,
+) -> _t.Dict[str, _t.Dict[str, float]]:
+    """Benchmarks each stage of parsing an invoice.
+
+    :param filepath: The path to the invoice.
+    :type filepath: str
+    :param supplier: The name of the supplier.
+    :type supplier: str
+    :param repeat: The number of times to time each stage.
+    :type repeat: int, optional
+    :return: The mean and 95th percentile time in seconds and the peak
+        memory allocated in bytes by each stage.
+    :rtype: Dict[str, Dict[str, float]]
+    """
+    parser = parser_class(supplier)(filepath, supplier)
+    stage_funcs = _stage_funcs(parser)
+
+    results = {}
+    for stage in STAGES:
+        func = stage_funcs[stage]
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+
+        # Memory is measured in a separate run as tracing slows down
+        # allocation heavy code.
+        tracemalloc.start()
+        try:
+            func()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        results[stage] = {
+            "mean": sum(samples) / len(samples),
+            "p95": percentile(samples, 95),
+            "peak_memory": peak_memory,
+        }
+    return results
+
+
+def run(repeat: int = DEFAULT_REPEAT) -> _t.Dict[str, _t.Any]:
+    """Benchmarks every fixture invoice.
+
+    :param repeat: The number of times to time each stage.
+    :type repeat: int, optional
+    :return: The results, keyed by the path of each invoice.
+    :rtype: Dict[str, Any]
+    """
+    return {
+        "repeat": repeat,
+        "invoices": {
+            filepath: {
+                "supplier": supplier,
+                "stages": bench_invoice(filepath, supplier, repeat),
+            }
+            for filepath, supplier in all_fixtures()
+        },
+    }
+
+
+def compare(
+    results: _t.Dict[str, _t.Any],
+    baseline: _t.Dict[str, _t.Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> _t.List[_t.Tuple[str, str, float]]:
+    """Compares the mean time of each stage against a baseline.
+
+    :param results: The results of `run`.
+    :type results: Dict[str, Any]
+    :param baseline: The results of a previous `run`.
+    :type baseline: Dict[str, Any]
+    :param threshold: The percentage by which a stage may be slower than the
+        baseline before it is a regression.
+    :type threshold: float, optional
+    :return: The invoice, stage and percentage change of each regression.
+    :rtype: List[Tuple[str, str, float]]
+    """
+    regressions = []
+    for filepath, invoice in results["invoices"].items():
+        baseline_invoice = baseline["invoices"].get(filepath)
+        if baseline_invoice is None:
+            continue
+        for stage, result in invoice["stages"].items():
+            baseline_result = baseline_invoice["stages"].get(stage)
+            if not baseline_result or not baseline_result["mean"]:
+                continue
+            change = (result["mean"] / baseline_result["mean"] - 1) * 100
+            if change > threshold:
+                regressions.append((filepath, stage, change))
+    return regressions
+
+
+def _per_field_search(patterns: _t.Dict[str, str], text: str) -> dict:
+    """How summaries were found before `SummaryScanner`: a `re.search` per
+    field using the uncompiled pattern.
+    """
+    values = {}
+    for field, pattern in patterns.items():
+        match = re.search(pattern, text)
+        if match:
+            values[field] = match.group(1)
+    return values
+
+
+def _merged_alternation(patterns: _t.Dict[str, str]) -> _t.Callable:
+    """Returns a function which finds every field in a single pass using one
+    alternation of all of the patterns.
+    """
+    merged = re.compile(
+        "|".join(f"(?P<{field}>{p})" for field, p in patterns.items())
+    )
+    value_groups = {field: merged.groupindex[field] + 1 for field in patterns}
+
+    def scan(text: str) -> dict:
+        values = {}
+        for match in merged.finditer(text):
+            field = match.lastgroup
+            if field not in values:
+                values[field] = match.group(value_groups[field])
+                if len(values) == len(patterns):
+                    break
+        return values
+
+    return scan
+
+
+def bench_summary(number: int) -> _t.List[_t.Tuple[str, str, float]]:
+    """Times each strategy for finding the summary fields of each fixture.
+
+    :param number: The number of times to scan each invoice.
+    :type number: int
+    :return: The fixture, strategy and the mean time taken in microseconds.
+    :rtype: List[Tuple[str, str, float]]
+    """
+    results = []
+    for filepath, supplier in supplier_fixtures():
+        scanner = parser_class(supplier).summary_scanner
+        if scanner is None:
+            continue
+        patterns = {
+            field: pattern.pattern
+            for field, pattern in scanner.patterns.items()
+        }
+        text = "\n".join(pdf.parser(filepath))
+        merged = _merged_alternation(patterns)
+        strategies = {
+            "re.search per field": lambda: _per_field_search(patterns, text),
+            "merged alternation": lambda: merged(text),
+            "SummaryScanner": lambda: scanner.scan(text),
+        }
+        for strategy, func in strategies.items():
+            seconds = timeit.timeit(func, number=number)
+            results.append((filepath, strategy, seconds / number * 1e6))
+    return results
+
+
+def main(argv: _t.Optional[_t.List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="The number of times to time each stage.",
+    )
+    arg_parser.add_argument(
+        "--output",
+        help="A path to write the results to as JSON.",
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        help="A path to the JSON results of a previous run to compare to.",
+    )
+    arg_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="The percentage a stage may slow down by compared to the "
+        "baseline before the run fails.",
+    )
+    arg_parser.add_argument(
+        "--summary-strategies",
+        type=int,
+        metavar="NUMBER",
+        help="Instead, compare the strategies for finding the summary of "
+        "each invoice, scanning each NUMBER times.",
+    )
+    args = arg_parser.parse_args(argv)
+
+    if args.summary_strategies:
+        for filepath, strategy, micros in bench_summary(
+            args.summary_strategies
+        ):
+            print(f"{filepath:<60} {strategy:<22} {micros:>8.2f}µs")
+        return 0
+
+    results = run(args.repeat)
+    for filepath, invoice in results["invoices"].items():
+        print(f"{filepath} ({invoice['supplier']})")
+        for stage, result in invoice["stages"].items():
+            print(
+                f"    {stage:<16}"
+                f" mean {result['mean'] * 1000:>10.3f}ms"
+                f" p95 {result['p95'] * 1000:>10.3f}ms"
+                f" peak {result['peak_memory'] / 1024:>10.1f}KiB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for filepath, stage, change in regressions:
+            print(f"REGRESSION {filepath} {stage}: {change:+.1f}%")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
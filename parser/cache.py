@@ -0,0 +1,264 @@
+"""A persistent cache for the text extracted from invoices.
+
+Extracting text from a PDF is by far the most expensive part of parsing an
+invoice. The same file is often parsed more than once (re-uploads, reparses
+after a parser fix, tests), so the extracted lines are cached against the
+SHA-256 of the file's contents and the version of the extractor which produced
+them. Hashing a file is orders of magnitude cheaper than decoding it.
+"""
+
+import typing as _t
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from .pdf import Source, open_source
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_DIRECTORY = os.path.join(
+    tempfile.gettempdir(),
+    "invoice_api_parser_cache",
+)
+
+
+def file_hash(file_path: Source) -> str:
+    """Returns the SHA-256 hex digest of the contents of a file.
+
+    :param file_path: The path to or a file object of the file.
+    :type file_path: Source
+    :return: The hex digest of the file's contents.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open_source(file_path) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Caches extracted invoice text on the local disk, and optionally in a
+    Django cache so that it may be shared between nodes.
+
+    Entries are evicted in least recently used order once the total size of
+    the entries on disk exceeds `max_size` bytes. The recency of an entry is
+    tracked using the modification time of its file which is updated on each
+    hit.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_DIRECTORY,
+        max_size: int = DEFAULT_MAX_SIZE,
+        django_cache_alias: _t.Optional[str] = None,
+    ):
+        """Initialises a new instance of the ExtractionCache class.
+
+        :param directory: The directory in which to store the cache entries.
+        :type directory: str
+        :param max_size: The maximum number of bytes the entries on disk may
+            occupy before the least recently used entries are evicted.
+        :type max_size: int
+        :param django_cache_alias: The alias of a Django cache to use in
+            addition to the local disk, defaults to None.
+        :type django_cache_alias: str, optional
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.django_cache_alias = django_cache_alias
+        self.hits = 0
+        self.misses = 0
+        self._size: _t.Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"ExtractionCache({self.directory})"
+
+    @staticmethod
+    def key(digest: str, version: str) -> str:
+        """Returns the key to store an extraction under.
+
+        :param digest: The SHA-256 hex digest of the file.
+        :type digest: str
+        :param version: The version of the extractor.
+        :type version: str
+        :return: The cache key.
+        :rtype: str
+        """
+        return hashlib.sha256(f"{digest}:{version}".encode()).hexdigest()
+
+    def get(self, key: str) -> _t.Optional[_t.List[str]]:
+        """Returns the lines stored against `key` or `None` if there is no
+        such entry.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The cached lines.
+        :rtype: List[str], optional
+        """
+        lines = self._disk_get(key)
+        if lines is None and self.django_cache_alias:
+            lines = self._django_cache().get(self._django_key(key))
+            if lines is not None:
+                self._disk_set(key, lines)
+
+        with self._lock:
+            if lines is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return lines
+
+    def set(self, key: str, lines: _t.List[str]):
+        """Stores `lines` against `key`.
+
+        :param key: The cache key.
+        :type key: str
+        :param lines: The extracted lines.
+        :type lines: List[str]
+        """
+        self._disk_set(key, lines)
+        if self.django_cache_alias:
+            self._django_cache().set(self._django_key(key), lines, None)
+
+    def clear(self):
+        """Removes every entry stored on disk."""
+        for path, _, _ in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._size = 0
+
+    def stats(self) -> _t.Dict[str, int]:
+        """Returns the hit/miss counters along with the size of the cache."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "size": self._current_size(),
+        }
+
+    def evict(self):
+        """Evicts the least recently used entries until the entries on disk
+        fit within `max_size`.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_size:
+                break
+            if self._remove(path):
+                size -= entry_size
+        with self._lock:
+            self._size = size
+
+    def _path(self, key: str) -> str:
+        """Returns the path of the file for an entry."""
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    @staticmethod
+    def _django_key(key: str) -> str:
+        return f"parser:extraction:{key}"
+
+    def _django_cache(self):
+        from django.core.cache import caches
+
+        return caches[self.django_cache_alias]
+
+    def _disk_get(self, key: str) -> _t.Optional[_t.List[str]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = json.load(f)
+            # Mark the entry as recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return lines
+
+    def _disk_set(self, key: str, lines: _t.List[str]):
+        path = self._path(key)
+        data = json.dumps(lines).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so that concurrent readers never
+            # see a partially written entry.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The cache is an optimisation, failing to write to it should
+            # never prevent an invoice from being parsed.
+            return
+
+        size = self._current_size() + len(data)
+        with self._lock:
+            self._size = size
+        if size > self.max_size:
+            self.evict()
+
+    def _current_size(self) -> int:
+        with self._lock:
+            if self._size is not None:
+                return self._size
+        size = sum(entry[1] for entry in self._entries())
+        with self._lock:
+            self._size = size
+        return size
+
+    def _entries(self) -> _t.Iterator[_t.Tuple[str, int, float]]:
+        """Yields the path, size and last used time of each entry on disk."""
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+
+_default_cache: _t.Optional[ExtractionCache] = None
+
+
+def get_default_cache() -> _t.Optional[ExtractionCache]:
+    """Returns the cache configured in the Django settings, or `None` where
+    caching has been disabled by setting `PARSER_CACHE_DIR` to `None`.
+
+    Where Django has not been configured, a cache using the default settings
+    is returned.
+    """
+    global _default_cache
+    if _default_cache is not None:
+        return _default_cache
+
+    directory, max_size, alias = DEFAULT_DIRECTORY, DEFAULT_MAX_SIZE, None
+    try:
+        from django.conf import settings
+
+        if settings.configured:
+            directory = getattr(settings, "PARSER_CACHE_DIR", directory)
+            max_size = getattr(settings, "PARSER_CACHE_MAX_SIZE", max_size)
+            alias = getattr(settings, "PARSER_CACHE_ALIAS", alias)
+    except ImportError:  # pragma: no cover
+        pass
+
+    if directory is None:
+        return None
+    _default_cache = ExtractionCache(directory, max_size, alias)
+    return _default_cache
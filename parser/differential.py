@@ -0,0 +1,104 @@
+"""Compares the output of the supplier parsers under each extraction backend.
+
+A supplier can only be moved to a different backend where its parser produces
+identical output under it for every invoice in the fixtures.
+
+Run with `python -m parser.differential`.
+"""
+
+import typing as _t
+import argparse
+from . import backends, parse_for_supplier
+from .bench import supplier_fixtures
+
+
+def parser_output(
+    filepath: str,
+    supplier: str,
+    backend: str,
+) -> _t.Dict[str, _t.Any]:
+    """Returns everything a supplier's parser finds in an invoice when the
+    text is extracted by `backend`.
+
+    :param filepath: The path to the invoice.
+    :type filepath: str
+    :param supplier: The name of the supplier.
+    :type supplier: str
+    :param backend: The name of the backend.
+    :type backend: str
+    :return: The output of the parser, or the error raised.
+    :rtype: Dict[str, Any]
+    """
+    parser_class = getattr(
+        parse_for_supplier,
+        parse_for_supplier.SUPPLIER_PARSERS[supplier]["class"],
+    )
+    parser = parser_class(filepath, supplier, backend=backend)
+    try:
+        parser.process_invoice()
+    except Exception as e:
+        return {"error": repr(e)}
+    return {
+        "items_breakdown": parser.items_breakdown,
+        "summary": parser.summary(),
+        "order_number": parser.order_number,
+        "order_date": parser.order_date,
+    }
+
+
+def differences(
+    filepath: str,
+    supplier: str,
+    backend_names: _t.Optional[_t.Iterable[str]] = None,
+) -> _t.Dict[str, _t.Dict[str, _t.Any]]:
+    """Returns the output of each backend which differs from the output of
+    the default backend.
+
+    :param filepath: The path to the invoice.
+    :type filepath: str
+    :param supplier: The name of the supplier.
+    :type supplier: str
+    :param backend_names: The backends to compare against the default,
+        defaults to every available backend.
+    :type backend_names: Iterable[str], optional
+    :return: A mapping of the name of each backend whose output differs to
+        its output. Includes the default backend where anything differs.
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    if backend_names is None:
+        backend_names = [
+            name
+            for name, backend in backends.BACKENDS.items()
+            if backend.available()
+        ]
+
+    expected = parser_output(filepath, supplier, backends.DEFAULT_BACKEND)
+    diffs = {}
+    for name in backend_names:
+        output = parser_output(filepath, supplier, name)
+        if output != expected:
+            diffs[name] = output
+    if diffs:
+        diffs[backends.DEFAULT_BACKEND] = expected
+    return diffs
+
+
+def main(argv: _t.Optional[_t.List[str]] = None):
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--backend",
+        action="append",
+        dest="backends",
+        help="A backend to compare. Defaults to every available backend.",
+    )
+    args = arg_parser.parse_args(argv)
+
+    for filepath, supplier in supplier_fixtures():
+        diffs = differences(filepath, supplier, args.backends)
+        print(f"{'DIFFERS' if diffs else 'OK':<8} {supplier:<20} {filepath}")
+        for name, output in diffs.items():
+            print(f"    {name}: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Contains the index used to detect the supplier of an invoice."""
+
+import typing as _t
+
+
+class FingerprintIndex:
+    """Maps fingerprints to the suppliers they identify. A fingerprint is the
+    leading words of a line which only appears on a supplier's invoices, such
+    as the header of its table of items.
+    """
+
+    def __init__(self):
+        """Initialises a new instance of the FingerprintIndex class."""
+        self._suppliers: _t.Dict[str, _t.Set[str]] = {}
+        # The number of words in each fingerprint, so that only the prefixes
+        # of a line which could match are looked up.
+        self._lengths: _t.Set[int] = set()
+
+    def __len__(self):
+        return len(self._suppliers)
+
+    def add(self, fingerprint: str, supplier: str):
+        """Adds a fingerprint for a supplier.
+
+        :param fingerprint: The leading words of a line.
+        :type fingerprint: str
+        :param supplier: The name of the supplier.
+        :type supplier: str
+        """
+        words = fingerprint.split()
+        self._suppliers.setdefault(" ".join(words), set()).add(supplier)
+        self._lengths.add(len(words))
+
+    def match(self, lines: _t.Iterable[str]) -> _t.Set[str]:
+        """Returns every supplier with a fingerprint matching the start of
+        any of `lines`.
+
+        :param lines: The lines to match, typically the first page.
+        :type lines: Iterable[str]
+        :return: The names of the suppliers matched.
+        :rtype: Set[str]
+        """
+        suppliers = set()
+        for line in lines:
+            words = line.split()
+            for length in self._lengths:
+                if length > len(words):
+                    continue
+                prefix = " ".join(words[:length])
+                suppliers.update(self._suppliers.get(prefix, ()))
+        return suppliers
@@ -1,52 +1,339 @@
 """This module contains methods to parse the data from a supplier."""
 
 import typing as _t
+import os
 import re
+import time
+from itertools import islice
+from concurrent import futures
+import dataclasses
 from datetime import date, datetime
 from abc import ABC, abstractmethod
-from .pdf import parser as pdf_parser
+from . import backends, cache as extraction_cache
+from .pdf import Source
+from .fingerprint import FingerprintIndex
+from .scanner import SummaryScanner
 
+# Each supplier may set the name of the `backends` module backend used to
+# extract the text from its invoices. Otherwise, the default backend is used.
 SUPPLIER_PARSERS = {
-    "Amazon": {"parser": pdf_parser},
-    "Amazon Order Summary": {
-        "parser": pdf_parser,
-        "class": "AmazonOrderSummary",
-    },
-    "Soak Rochford": {
-        "parser": pdf_parser,
-        "class": "SoakRochford",
-    },
-    "Tiny Box Company": {
-        "parser": pdf_parser,
-        "class": "TinyBoxCompany",
-    },
+    "Amazon": {},
+    "Amazon Order Summary": {"class": "AmazonOrderSummary"},
+    "Soak Rochford": {"class": "SoakRochford"},
+    "Tiny Box Company": {"class": "TinyBoxCompany", "backend": "pypdf"},
 }
 
 ITERATION_LIMIT = 100
 
-
-def parse(filepath: str, supplier: str) -> "BaseSupplierParser":
+# The number of files `parse_many` keeps queued per worker. Bounding this
+# means that arbitrarily large batches are not read into memory up front.
+BATCH_QUEUE_FACTOR = 4
+
+# The backend used to read the first page of an invoice when detecting its
+# supplier. The fingerprints of each parser must match the text it extracts.
+DETECTION_BACKEND = "pypdf"
+
+# The stages a parser reports to its `on_progress` callback.
+EXTRACTING = "extracting"
+PARSED = "parsed"
+# Called with a stage and the details of the parser's progress, e.g: the
+# page being extracted.
+ProgressCallback = _t.Callable[..., None]
+
+
+def parse(
+    filepath: Source,
+    supplier: _t.Optional[str],
+    lines: _t.Optional[_t.List[str]] = None,
+    detect: bool = False,
+    on_progress: _t.Optional[ProgressCallback] = None,
+) -> "BaseSupplierParser":
     """Parse the data from a supplier's invoice.
 
-    :param filepath: The path to the invoice file.
-    :type filepath: str
-    :param supplier: The name of the supplier.
-    :type supplier: str
+    :param filepath: The path to the invoice file, or a seekable binary file
+        object of it, e.g: one streamed from storage.
+    :type filepath: Source
+    :param supplier: The name of the supplier. Where `None`, the supplier is
+        detected from the invoice.
+    :type supplier: str, optional
+    :param lines: The lines of the invoice where they have already been
+        extracted, defaults to None.
+    :type lines: List[str], optional
+    :param detect: Should the supplier be detected from the invoice, using
+        `supplier` only where it cannot be? Defaults to False.
+    :type detect: bool, optional
+    :param on_progress: Called as the parser makes progress, see
+        `BaseSupplierParser`.
+    :type on_progress: ProgressCallback, optional
+    :raises ValueError: Where no supplier is given and it cannot be detected.
     :return: An instance of the supplier's parser.
     :rtype: BaseSupplierParser
     """
+    if detect or supplier is None:
+        supplier = detect_supplier(filepath) or supplier
+    if supplier is None:
+        raise ValueError(f"Could not detect the supplier of {filepath}.")
 
     parser_class = SUPPLIER_PARSERS[supplier]["class"]
-    return globals()[parser_class](filepath, supplier)
+    return globals()[parser_class](
+        filepath,
+        supplier,
+        lines=lines,
+        on_progress=on_progress,
+    )
+
+
+def parser_version(supplier: str) -> _t.Optional[str]:
+    """Returns the version of a supplier's parser.
+
+    :param supplier: The name of the supplier.
+    :type supplier: str
+    :return: The version, or `None` where the supplier has no parser.
+    :rtype: str, optional
+    """
+    parser_class = SUPPLIER_PARSERS.get(supplier, {}).get("class")
+    if parser_class is None:
+        return None
+    return globals()[parser_class].version
+
+
+def detect_supplier(filepath: Source) -> _t.Optional[str]:
+    """Detects the supplier of an invoice by matching the lines of its first
+    page against the fingerprints of each parser. Only the first page of the
+    invoice is read.
+
+    :param filepath: The path to or a file object of the invoice file.
+    :type filepath: Source
+    :return: The name of the supplier, or `None` where no supplier or more
+        than one supplier matched.
+    :rtype: str, optional
+    """
+    pages = backends.get_backend(DETECTION_BACKEND).iter_pages(filepath)
+    try:
+        first_page = next(pages, "")
+    finally:
+        pages.close()
+
+    suppliers = FINGERPRINT_INDEX.match(first_page.split("\n"))
+    if len(suppliers) == 1:
+        return suppliers.pop()
+    return None
+
+
+@dataclasses.dataclass
+class ParseResult:
+    """The output of a supplier's parser without the raw text of the invoice.
+    Unlike a parser instance, this is cheap to pickle and so can be passed
+    between processes.
+    """
+
+    # The path to the invoice, or None where it was parsed from a file
+    # object.
+    filepath: _t.Optional[str]
+    supplier: str
+    order_number: _t.Optional[str] = None
+    order_date: _t.Optional[date] = None
+    subtotal: _t.Optional[float] = None
+    vat: _t.Optional[float] = None
+    delivery: _t.Optional[float] = None
+    promotion: _t.Optional[float] = None
+    total: _t.Optional[float] = None
+    items_breakdown: _t.Optional[_t.Dict[str, _t.Dict[str, str]]] = None
+    error: _t.Optional[BaseException] = None
+    parser_version: _t.Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the invoice was parsed without error."""
+        return self.error is None
+
+    def summary(self) -> _t.Dict[str, str]:
+        """Returns a summary of the invoice."""
+        return {
+            "subtotal": self.subtotal,
+            "vat": self.vat,
+            "delivery": self.delivery,
+            "promotion": self.promotion,
+            "total": self.total,
+        }
+
+
+@dataclasses.dataclass
+class BatchStats:
+    """Throughput statistics for a call to `parse_many`."""
+
+    parsed: int = 0
+    failed: int = 0
+    started: float = dataclasses.field(default_factory=time.monotonic)
+    finished: _t.Optional[float] = None
+
+    @property
+    def total(self) -> int:
+        """The number of files that have been processed."""
+        return self.parsed + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        """The number of seconds spent processing the batch."""
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def files_per_second(self) -> float:
+        """The number of files processed per second."""
+        elapsed = self.elapsed
+        return self.total / elapsed if elapsed else 0.0
+
+
+def parse_to_result(
+    filepath: str,
+    supplier: _t.Optional[str],
+) -> ParseResult:
+    """Parses and processes an invoice, returning the result. Any exception
+    raised is carried on the result rather than raised. Suitable for running
+    in another process.
+
+    :param filepath: The path to the invoice.
+    :type filepath: str
+    :param supplier: The name of the supplier, detected where `None`.
+    :type supplier: str, optional
+    :return: The result.
+    :rtype: ParseResult
+    """
+    try:
+        parser = parse(filepath, supplier)
+        parser.process_invoice()
+        return parser.result()
+    except Exception as e:
+        return ParseResult(filepath, supplier, error=e)
+
+
+def parse_many(
+    invoices: _t.Iterable[_t.Tuple[str, _t.Optional[str]]],
+    max_workers: _t.Optional[int] = None,
+    ordered: bool = False,
+    stats: _t.Optional[BatchStats] = None,
+    mp_context: _t.Optional[_t.Any] = None,
+    initializer: _t.Optional[_t.Callable[[], _t.Any]] = None,
+) -> _t.Iterator[ParseResult]:
+    """Parse many invoices in parallel across a pool of processes.
+
+    A failure to parse one invoice does not abort the batch, instead the
+    exception is carried on the `error` attribute of that invoice's result.
+
+    :param invoices: An iterable of `(filepath, supplier)` pairs. Where the
+        supplier is `None`, it is detected from the invoice.
+    :type invoices: Iterable[Tuple[str, str]]
+    :param max_workers: The number of processes to use. Defaults to the
+        number of processors on the machine.
+    :type max_workers: int, optional
+    :param ordered: Should the results be yielded in the same order as
+        `invoices`? Otherwise, results are yielded as soon as they complete.
+        Defaults to False.
+    :type ordered: bool, optional
+    :param stats: An object to record the throughput of the batch on. It is
+        updated as each result is yielded.
+    :type stats: BatchStats, optional
+    :param mp_context: The multiprocessing context the processes are
+        started with, e.g: a "spawn" context where the caller runs threads
+        which should not be forked. Defaults to the platform's default.
+    :type mp_context: multiprocessing.context.BaseContext, optional
+    :param initializer: Called in each process as it starts.
+    :type initializer: Callable[[], Any], optional
+    :return: An iterator over the results.
+    :rtype: Iterator[ParseResult]
+    """
+    if stats is None:
+        stats = BatchStats()
+    stats.started = time.monotonic()
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_pending = max_workers * BATCH_QUEUE_FACTOR
+    invoices = iter(invoices)
+    # Maps each future to the invoice it is parsing, in submission order.
+    pending: _t.Dict[futures.Future, _t.Tuple[str, str]] = {}
+
+    def collect(future: futures.Future) -> ParseResult:
+        invoice = pending.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker died or the result could not be pickled.
+            result = ParseResult(*invoice, error=e)
+        if result.ok:
+            stats.parsed += 1
+        else:
+            stats.failed += 1
+        return result
+
+    with futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=initializer,
+    ) as executor:
+        while True:
+            for invoice in islice(invoices, max_pending - len(pending)):
+                future = executor.submit(parse_to_result, *invoice)
+                pending[future] = invoice
+            if not pending:
+                break
+
+            if ordered:
+                done = [next(iter(pending))]
+            else:
+                done, _ = futures.wait(
+                    pending,
+                    return_when=futures.FIRST_COMPLETED,
+                )
+            for future in done:
+                yield collect(future)
+
+    stats.finished = time.monotonic()
 
 
 class BaseSupplierParser(ABC):
     """An abstract base class for parsing data from a supplier."""
 
-    def __init__(self, filepath: str, supplier: str):
-        """Initializes a new instance of the SupplierParser class."""
+    # Finds the fields of the summary. Used by `_scan_summary`.
+    summary_scanner: _t.Optional[SummaryScanner] = None
+    # The leading words of lines on the first page of an invoice which
+    # identify the supplier. Used by `detect_supplier`.
+    fingerprints: _t.Tuple[str, ...] = ()
+    # Recorded against each invoice the parser parses. Must be changed
+    # whenever a fix changes the parser's output, so that the invoices it
+    # parsed before are picked up by the `reparse_invoices` command.
+    version: str = "1"
+
+    def __init__(
+        self,
+        filepath: Source,
+        supplier: str,
+        lines: _t.Optional[_t.List[str]] = None,
+        backend: _t.Optional[str] = None,
+        on_progress: _t.Optional[ProgressCallback] = None,
+    ):
+        """Initializes a new instance of the SupplierParser class. The invoice
+        is not read until its data is first needed.
+
+        :param filepath: The path to or a file object of the invoice file.
+        :type filepath: Source
+        :param supplier: The name of the supplier.
+        :type supplier: str
+        :param lines: The lines of the invoice where they have already been
+            extracted, in which case the file is never read. Defaults to None.
+        :type lines: List[str], optional
+        :param backend: The name of the backend to extract the text with,
+            defaults to the backend registered for the supplier.
+        :type backend: str, optional
+        :param on_progress: Called with `EXTRACTING` and the `page` and
+            number of `pages`, where known, as each page is extracted, then
+            with `PARSED` once the invoice has been processed.
+        :type on_progress: ProgressCallback, optional
+        """
         self.filepath = filepath
         self.supplier = supplier
+        self.backend = backend
+        self.on_progress = on_progress
 
         # Default values. It is possible that not all of these attributes will
         # be set by `_summary`. Thefore, to avoid having to handle attributes
@@ -60,8 +347,8 @@ class BaseSupplierParser(ABC):
         self.total: float = None
         self.items_breakdown = None
 
-        self.invoice_data = self.read_invoice()
-        self.invoice_data_str = "\n".join(self.invoice_data)
+        self._invoice_data = lines
+        self._invoice_data_str: _t.Optional[str] = None
 
     def __str__(self):
         if self.order_date:
@@ -77,10 +364,30 @@ class BaseSupplierParser(ABC):
             "items": self.items_breakdown,
         }
 
+    @property
+    def invoice_data(self) -> _t.List[str]:
+        """The lines of the invoice, read on first access."""
+        if self._invoice_data is None:
+            self._invoice_data = self.read_invoice()
+        return self._invoice_data
+
+    @invoice_data.setter
+    def invoice_data(self, lines: _t.List[str]):
+        self._invoice_data = lines
+        self._invoice_data_str = None
+
+    @property
+    def invoice_data_str(self) -> str:
+        """The lines of the invoice joined into a single string."""
+        if self._invoice_data_str is None:
+            self._invoice_data_str = "\n".join(self.invoice_data)
+        return self._invoice_data_str
+
     def process_invoice(self):
         self.items_breakdown = self._items_breakdown()
         self._summary()
         self._metadata()
+        self._report(PARSED)
 
     def summary(self) -> _t.Dict[str, str]:
         """Returns a summary of the invoice."""
@@ -92,11 +399,111 @@ class BaseSupplierParser(ABC):
             "total": self.total,
         }
 
-    def read_invoice(self) -> _t.List[str]:
-        """Parses the data from the supplier."""
+    def result(self) -> ParseResult:
+        """Returns the output of the parser without the raw invoice data."""
+        return ParseResult(
+            filepath=(
+                self.filepath
+                if isinstance(self.filepath, (str, os.PathLike))
+                else None
+            ),
+            supplier=self.supplier,
+            order_number=self.order_number,
+            order_date=self.order_date,
+            subtotal=self.subtotal,
+            vat=self.vat,
+            delivery=self.delivery,
+            promotion=self.promotion,
+            total=self.total,
+            items_breakdown=self.items_breakdown,
+            parser_version=self.version,
+        )
+
+    def read_invoice(self, use_cache: bool = True) -> _t.List[str]:
+        """Parses the data from the supplier. Where the same file has been
+        read before by the same version of the extractor, the lines are
+        returned from the extraction cache instead.
+
+        :param use_cache: Should the extraction cache be used? Defaults to
+            True.
+        :type use_cache: bool, optional
+        :return: The lines of the invoice.
+        :rtype: List[str]
+        """
         if self.supplier not in SUPPLIER_PARSERS:
             raise ValueError(f"Supplier {self.supplier} is not supported.")
-        return SUPPLIER_PARSERS[self.supplier]["parser"](self.filepath)
+        backend = backends.get_backend(
+            self.backend or SUPPLIER_PARSERS[self.supplier].get("backend")
+        )
+
+        cache = extraction_cache.get_default_cache() if use_cache else None
+        if cache is None:
+            return self._read_pages(backend.iter_pages)
+
+        # How much of the document is read depends on `has_enough_data`, so
+        # the parser class forms part of the key.
+        key = cache.key(
+            extraction_cache.file_hash(self.filepath),
+            f"{backend.version}:{type(self).__name__}",
+        )
+        lines = cache.get(key)
+        if lines is None:
+            lines = self._read_pages(backend.iter_pages)
+            cache.set(key, lines)
+        return lines
+
+    def _read_pages(
+        self,
+        pages: _t.Callable[[str], _t.Iterator[str]],
+    ) -> _t.List[str]:
+        """Reads the lines of the invoice page by page until either the end
+        of the document or `has_enough_data` is satisfied.
+
+        :param pages: A function yielding the text of each page of a file.
+            Where the text is a `pdf.PageText`, its `page_count` is reported
+            to `on_progress`.
+        :type pages: Callable[[str], Iterator[str]]
+        :return: The lines read.
+        :rtype: List[str]
+        """
+        lines = []
+        page_iter = pages(self.filepath)
+        try:
+            for page, page_text in enumerate(page_iter, 1):
+                self._report(
+                    EXTRACTING,
+                    page=page,
+                    pages=getattr(page_text, "page_count", None),
+                )
+                page_lines = page_text.split("\n")
+                lines.extend(page_lines)
+                if self.has_enough_data(page_lines):
+                    break
+        finally:
+            # Stops the remaining pages from being decoded.
+            page_iter.close()
+
+        while len(lines) > 1 and not lines[-1]:
+            lines.pop()
+        return lines or [""]
+
+    def _report(self, stage: str, **details):
+        """Reports the parser's progress to `on_progress`, if set."""
+        if self.on_progress is not None:
+            self.on_progress(stage, **details)
+
+    def has_enough_data(self, page_lines: _t.List[str]) -> bool:
+        """Called with the lines of each page as it is read. Returning `True`
+        stops any further pages from being read. By default, the whole
+        document is read.
+
+        :param page_lines: The lines of the page that has just been read.
+        :type page_lines: List[str]
+        :return: Whether the lines read so far contain everything needed to
+            process the invoice.
+        :rtype: bool
+        """
+        return False
 
     @abstractmethod
     def _items_breakdown(self) -> _t.Dict[str, _t.Dict[str, str]]:
@@ -121,10 +528,26 @@ class BaseSupplierParser(ABC):
         """
         return {}
 
+    def _scan_summary(self):
+        """Sets each summary field found by the class's `summary_scanner`."""
+        values = self.summary_scanner.scan(self.invoice_data_str)
+        for field, value in values.items():
+            setattr(self, field, value)
+
 
 class AmazonOrderSummary(BaseSupplierParser):
     """Parses the data from an Amazon Order Summary PDF."""
 
+    summary_scanner = SummaryScanner(
+        {
+            "subtotal": r"Item\(s\) Subtotal: *.?(\d{1,}\.\d{2})",
+            "delivery": r"Postage & Packing: *.?(\d{1,}\.\d{2})",
+            "vat": r"VAT: *.?(\d{1,}\.\d{2})",
+            "total": r"Grand Total: *.?(\d{1,}\.\d{2})",
+        }
+    )
+    fingerprints = ("Items Ordered",)
+
     def _items_breakdown(self):
         items = {}
         for i in range(len(self.invoice_data)):
@@ -169,24 +592,24 @@ class AmazonOrderSummary(BaseSupplierParser):
         return items
 
     def _summary(self):
-
-        re_patterns = {
-            "subtotal": r"(Item\(s\) Subtotal: *.?(\d{1,}\.\d{2}))",
-            "delivery": r"(Postage & Packing: *.?(\d{1,}\.\d{2}))",
-            "vat": r"(VAT: *.?(\d{1,}\.\d{2}))",
-            "total": r"(Grand Total: *.?(\d{1,}\.\d{2}))",
-        }
-
-        for field, re_pattern in re_patterns.items():
-            match = re.search(re_pattern, self.invoice_data_str)
-            if match:
-                setattr(self, field, match.groups()[1])
+        self._scan_summary()
 
     def _metadata(self):
         pass
 
 
 class SoakRochford(BaseSupplierParser):
+    summary_scanner = SummaryScanner(
+        {
+            "subtotal": r"Subtotal £(\d{1,}\.\d{2})",
+            "delivery": r"Shipping £(\d{1,}\.\d{2})",
+            "promotion": r"Cart Discount -£(\d{1,}\.\d{2})",
+            "vat": r"VAT £(\d{1,}\.\d{2})",
+            "total": r"Total £(\d{1,}\.\d{2})",
+        }
+    )
+    fingerprints = ("SKU Product Quantity Price Total Price",)
+
     def _items_breakdown(self) -> _t.Dict[str, _t.Dict[str, str]]:
         items = {}
         for i in range(len(self.invoice_data)):
@@ -252,19 +675,12 @@ class SoakRochford(BaseSupplierParser):
 
             return items
 
-    def _summary(self):
-        re_patterns = {
-            "subtotal": r"(Subtotal £(\d{1,}\.\d{2}))",
-            "delivery": r"(Shipping £(\d{1,}\.\d{2}))",
-            "promotion": r"(Cart Discount -£(\d{1,}\.\d{2}))",
-            "vat": r"(VAT £(\d{1,}\.\d{2}))",
-            "total": r"(Total £(\d{1,}\.\d{2}))",
-        }
+    def has_enough_data(self, page_lines: _t.List[str]) -> bool:
+        # The total is the last thing needed from the invoice.
+        return any(line.startswith("Total £") for line in page_lines)
 
-        for field, re_pattern in re_patterns.items():
-            match = re.search(re_pattern, self.invoice_data_str)
-            if match:
-                setattr(self, field, match.groups()[1])
+    def _summary(self):
+        self._scan_summary()
 
     def _metadata(self):
         self.order_number = self._order_number()
@@ -296,6 +712,17 @@ class SoakRochford(BaseSupplierParser):
 class TinyBoxCompany(BaseSupplierParser):
     """Parses the data from an Tiny Box Company PDF invoice."""
 
+    summary_scanner = SummaryScanner(
+        {
+            "subtotal": r"Subtotal £(\d{1,}\.\d{2})",
+            "delivery": r"Shipping.*?Handling £(\d{1,}\.\d{2})",
+            "vat": r"VAT £(\d{1,}\.\d{2})",
+            "total": r"GRAND ?TOTAL £(\d{1,}\.\d{2})",
+        },
+        cast=float,
+    )
+    fingerprints = ("PRODUCT NAME SKU PRICE QTY SUBTOTAL",)
+
     def _items_breakdown(self):
         items = {}
         i = 0
@@ -334,18 +761,12 @@ class TinyBoxCompany(BaseSupplierParser):
             items[product_name] = {"price_ex_vat": price, "quantity": ordered}
         return items
 
-    def _summary(self):
-        re_patterns = {
-            "subtotal": r"Subtotal £(\d{1,}\.\d{2})",
-            "delivery": r"Shipping.*?Handling £(\d{1,}\.\d{2})",
-            "vat": r"VAT £(\d{1,}\.\d{2})",
-            "total": r"GRANDTOTAL £(\d{1,}\.\d{2})",
-        }
+    def has_enough_data(self, page_lines: _t.List[str]) -> bool:
+        # The grand total is the last thing needed from the invoice.
+        return any(re.match("GRAND ?TOTAL £", line) for line in page_lines)
 
-        for field, re_pattern in re_patterns.items():
-            match = re.search(re_pattern, self.invoice_data_str)
-            if match:
-                setattr(self, field, float(match.groups()[0]))
+    def _summary(self):
+        self._scan_summary()
 
     def _metadata(self):
         self.order_number = self._order_number()
@@ -372,3 +793,17 @@ class TinyBoxCompany(BaseSupplierParser):
             return datetime.strptime(order_date.groups()[0], "%d %B %Y").date()
         except ValueError:
             return None
+
+
+def build_fingerprint_index() -> FingerprintIndex:
+    """Builds an index of the fingerprints of each supplier's parser."""
+    index = FingerprintIndex()
+    for supplier, supplier_parser in SUPPLIER_PARSERS.items():
+        if "class" not in supplier_parser:
+            continue
+        for fingerprint in globals()[supplier_parser["class"]].fingerprints:
+            index.add(fingerprint, supplier)
+    return index
+
+
+FINGERPRINT_INDEX = build_fingerprint_index()
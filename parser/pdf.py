@@ -1,23 +1,197 @@
 """Parses PDF invoices."""
 
 import typing as _t
+import contextlib
+import os
+import queue
+import threading
 from borb.pdf.pdf import PDF
+from borb.pdf.canvas.event.begin_page_event import BeginPageEvent
+from borb.pdf.canvas.event.end_page_event import EndPageEvent
+from borb.pdf.canvas.event.event_listener import Event
 from borb.toolkit.text.simple_text_extraction import SimpleTextExtraction
 
+# Identifies the output of this module. This forms part of the key used to
+# cache extracted text, so it must be changed whenever a change to this module
+# alters the text that is extracted.
+EXTRACTOR_VERSION = "borb-2.0.24.1"
 
-def parser(file_path: str) -> _t.List[str]:
+# How long the extraction thread waits on a full queue before checking
+# whether the consumer has gone away.
+_PUT_TIMEOUT = 0.1
+
+_DONE = object()
+
+# An invoice given either as a path or as a seekable binary file object, e.g:
+# as returned by `open(path, "rb")` or `io.BytesIO`.
+Source = _t.Union[str, os.PathLike, _t.BinaryIO]
+
+
+@contextlib.contextmanager
+def open_source(source: Source) -> _t.Iterator[_t.BinaryIO]:
+    """Opens an invoice for reading. Paths are opened and closed again, while
+    file objects are rewound and left open for the caller to close.
+
+    :param source: The path to or a file object of the invoice.
+    :type source: Source
+    :return: A context manager yielding the file object.
+    :rtype: Iterator[BinaryIO]
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield f
+    else:
+        source.seek(0)
+        yield source
+
+
+class PageText(str):
+    """The text of a page, along with the number of pages of its document
+    where known.
+    """
+
+    page_count: _t.Optional[int]
+
+    def __new__(cls, text: str, page_count: _t.Optional[int] = None):
+        page_text = super().__new__(cls, text)
+        page_text.page_count = page_count
+        return page_text
+
+
+def _page_count(page: _t.Any) -> _t.Optional[int]:
+    """Returns the number of pages of the document a borb page is in, from
+    the root of its page tree.
+    """
+    count = None
+    node = page.get_parent()
+    while node is not None:
+        if isinstance(node, dict) and node.get("Type") == "Pages":
+            count = node.get("Count", count)
+        node = node.get_parent() if hasattr(node, "get_parent") else None
+    return int(count) if count is not None else None
+
+
+class _ExtractionStopped(Exception):
+    """Raised inside borb to abandon the extraction of the remaining pages."""
+
+
+class _PageTextExtraction(SimpleTextExtraction):
+    """Extracts the text of each page, handing it to `on_page` as soon as the
+    page has been processed.
+    """
+
+    def __init__(
+        self,
+        on_page: _t.Callable[[str], _t.Any],
+        stop: threading.Event,
+    ):
+        """Initialises a new instance of the _PageTextExtraction class.
+
+        :param on_page: Called with the text of each page.
+        :type on_page: Callable[[str], Any]
+        :param stop: Once set, the extraction is abandoned before the next
+            page is decoded.
+        :type stop: threading.Event
+        """
+        super().__init__()
+        self._on_page = on_page
+        self._stop = stop
+        self._page_count: _t.Optional[int] = None
+
+    def _event_occurred(self, event: Event):
+        if isinstance(event, BeginPageEvent):
+            if self._stop.is_set():
+                raise _ExtractionStopped()
+            if self._page_count is None:
+                self._page_count = _page_count(event.get_page())
+
+        super()._event_occurred(event)
+
+        if isinstance(event, EndPageEvent):
+            page_text = self.get_text_for_page(self._current_page)
+            # Free the text render events for the page as soon as possible.
+            self._text_render_info_per_page.pop(self._current_page, None)
+            self._text_per_page.pop(self._current_page, None)
+            self._on_page(PageText(page_text, self._page_count))
+
+
+def iter_pages(file_path: Source) -> _t.Iterator[str]:
+    """Yields the text of each page of a PDF as it is decoded, as `PageText`
+    carrying the number of pages in the document. Decoding stops
+    at the first page without any text, or as soon as the generator is closed,
+    so consumers that only need the first few pages do not pay for the rest
+    of the document.
+
+    :param file_path: The path to or a file object of the PDF.
+    :type file_path: Source
+    :return: An iterator over the text of each page.
+    :rtype: Iterator[str]
+    """
+    # borb pushes pages to its listeners, so the document is decoded in a
+    # separate thread which is kept at most one page ahead of the consumer.
+    pages = queue.Queue(maxsize=1)
+    consumer_gone = threading.Event()
+
+    def put(item: _t.Any):
+        while not consumer_gone.is_set():
+            try:
+                pages.put(item, timeout=_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def extract():
+        try:
+            with open_source(file_path) as pdf_file:
+                PDF.loads(
+                    pdf_file,
+                    [_PageTextExtraction(put, consumer_gone)],
+                )
+        except _ExtractionStopped:
+            pass
+        except Exception as e:
+            put(e)
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=extract, daemon=True)
+    thread.start()
+    try:
+        while True:
+            page_text = pages.get()
+            if page_text is _DONE or not page_text:
+                return
+            if isinstance(page_text, Exception):
+                raise page_text
+            yield page_text
+    finally:
+        consumer_gone.set()
+        thread.join()
+
+
+def iter_lines(file_path: Source) -> _t.Iterator[str]:
+    """Yields the lines of a PDF page by page. See `iter_pages`.
+
+    :param file_path: The path to or a file object of the PDF.
+    :type file_path: Source
+    :return: An iterator over the lines of the PDF.
+    :rtype: Iterator[str]
+    """
+    # Blank lines are held back until a line with text follows them so that
+    # trailing blank lines at the end of the document are dropped.
+    blank_lines = 0
+    for page_text in iter_pages(file_path):
+        for line in page_text.split("\n"):
+            if not line:
+                blank_lines += 1
+                continue
+            for _ in range(blank_lines):
+                yield ""
+            blank_lines = 0
+            yield line
+
+
+def parser(file_path: Source) -> _t.List[str]:
     """Parses a PDF invoice."""
-    extractor = SimpleTextExtraction()
-    with open(file_path, "rb") as pdf_file:
-        PDF.loads(pdf_file, [extractor])
-
-    text = ""
-    page = 0
-    while True:
-        page_text = extractor.get_text_for_page(page)
-        if not bool(page_text):
-            break
-        text += page_text + "\n"
-        page += 1
-
-    return text.rstrip("\n").split("\n")
+    # A document without any text has always produced a single empty line.
+    return list(iter_lines(file_path)) or [""]
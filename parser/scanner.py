@@ -0,0 +1,64 @@
+"""Contains the scanner used to extract summary fields from invoices."""
+
+import typing as _t
+import re
+
+
+class SummaryScanner:
+    """Extracts a set of fields from the text of an invoice using a regular
+    expression per field. Patterns are compiled once when the scanner is
+    created, which is expected to be when the parser class using it is
+    defined.
+
+    Each pattern must contain exactly one capturing group, which holds the
+    value of the field. The value of a field is taken from the first match of
+    its pattern.
+    """
+
+    def __init__(
+        self,
+        patterns: _t.Dict[str, str],
+        cast: _t.Callable[[str], _t.Any] = str,
+    ):
+        """Initialises a new instance of the SummaryScanner class.
+
+        :param patterns: A mapping of field names to the pattern used to find
+            the value of the field.
+        :type patterns: Dict[str, str]
+        :param cast: A function to convert each value found, defaults to str.
+        :type cast: Callable[[str], Any], optional
+        :raises ValueError: Where a pattern does not contain exactly one
+            capturing group.
+        """
+        self.patterns: _t.Dict[str, re.Pattern] = {}
+        for field, pattern in patterns.items():
+            compiled = re.compile(pattern)
+            if compiled.groups != 1:
+                raise ValueError(
+                    f"The pattern for {field} must contain exactly one "
+                    f"capturing group, found {compiled.groups}."
+                )
+            self.patterns[field] = compiled
+        self.cast = cast
+
+    def __str__(self):
+        return f"SummaryScanner({', '.join(self.patterns)})"
+
+    def scan(self, text: str) -> _t.Dict[str, _t.Any]:
+        """Returns the value of each field found in `text`. Fields that could
+        not be found are omitted.
+
+        :param text: The text to scan.
+        :type text: str
+        :return: A mapping of field names to their values.
+        :rtype: Dict[str, Any]
+        """
+        # Searching for each pattern separately is deliberate. `re` can skip
+        # straight to the literal prefix of a single pattern, which it cannot
+        # do for an alternation of every pattern. See `parser.bench`.
+        values = {}
+        for field, pattern in self.patterns.items():
+            match = pattern.search(text)
+            if match:
+                values[field] = self.cast(match.group(1))
+        return values
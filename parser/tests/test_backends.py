@@ -0,0 +1,103 @@
+"""Unittests for the `backends` and `differential` modules."""
+
+import unittest
+from unittest.mock import patch
+from .. import backends, differential
+from ..bench import supplier_fixtures
+from ..parse_for_supplier import SUPPLIER_PARSERS
+
+
+class TestGetBackend(unittest.TestCase):
+    """Unittests for the `get_backend` function."""
+
+    def test_default(self):
+        """Test that the default backend is returned where no name is
+        given.
+        """
+        self.assertEqual(backends.get_backend().name, "borb")
+
+    def test_named(self):
+        """Test that the backend with the given name is returned."""
+        self.assertEqual(backends.get_backend("pypdf").name, "pypdf")
+
+    def test_does_not_exist(self):
+        """Test that a `ValueError` is raised for an unknown backend."""
+        with self.assertRaises(ValueError):
+            backends.get_backend("invalid")
+
+    def test_unavailable(self):
+        """Test that the default backend is returned where the backend's
+        dependencies are not installed.
+        """
+        with patch.object(
+            backends.PypdfBackend,
+            "available",
+            return_value=False,
+        ):
+            self.assertEqual(backends.get_backend("pypdf").name, "borb")
+
+
+class TestPypdfBackend(unittest.TestCase):
+    """Unittests for the `PypdfBackend` class."""
+
+    def test_iter_pages(self):
+        """Test that the text of each page is yielded."""
+        self.assertEqual(
+            list(
+                backends.PypdfBackend().iter_pages("parser/tests/test_pdf.pdf")
+            ),
+            ["Page 1\nparagraph 1", "page 2\nparagraph 2"],
+        )
+
+    def test_iter_pages_file_object(self):
+        """Test that a file object may be read in place of a path."""
+        with open("parser/tests/test_pdf.pdf", "rb") as f:
+            self.assertEqual(
+                list(backends.PypdfBackend().iter_pages(f)),
+                ["Page 1\nparagraph 1", "page 2\nparagraph 2"],
+            )
+
+    def test_normalise(self):
+        """Test that the whitespace of a page is normalised."""
+        self.assertEqual(
+            backends.PypdfBackend.normalise(" a  b \n \n\nc "),
+            "a b\nc",
+        )
+
+
+class ReversedBackend(backends.ExtractionBackend):
+    """A backend which reverses the text of each page."""
+
+    name = "reversed"
+    version = "reversed"
+
+    def iter_pages(self, file_path):
+        for page_text in backends.get_backend().iter_pages(file_path):
+            yield page_text[::-1]
+
+
+class TestDifferential(unittest.TestCase):
+    """Unittests for the `differential` module."""
+
+    def test_supplier_backends_match_default(self):
+        """Test that each supplier that does not use the default backend has
+        identical output under its backend and the default backend.
+        """
+        for filepath, supplier in supplier_fixtures():
+            backend = SUPPLIER_PARSERS[supplier].get("backend")
+            if backend in (None, backends.DEFAULT_BACKEND):
+                continue
+            with self.subTest(filepath=filepath, backend=backend):
+                self.assertEqual(
+                    differential.differences(filepath, supplier, [backend]),
+                    {},
+                )
+
+    def test_differences(self):
+        """Test that differing output is reported along with the output of
+        the default backend.
+        """
+        filepath, supplier = next(supplier_fixtures())
+        with patch.dict(backends.BACKENDS, {"reversed": ReversedBackend()}):
+            diffs = differential.differences(filepath, supplier, ["reversed"])
+        self.assertEqual(set(diffs), {"reversed", backends.DEFAULT_BACKEND})
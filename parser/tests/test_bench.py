@@ -0,0 +1,57 @@
+"""Unittests for the `bench` module."""
+
+import unittest
+import os
+from .. import bench
+
+
+class TestBench(unittest.TestCase):
+    """Unittests for the `bench` module."""
+
+    def test_percentile(self):
+        """Test the `percentile` function."""
+        samples = list(range(1, 21))
+        self.assertEqual(bench.percentile(samples, 95), 19)
+        self.assertEqual(bench.percentile(samples, 100), 20)
+        self.assertEqual(bench.percentile([5], 95), 5)
+
+    def test_bench_invoice(self):
+        """Test that each stage of parsing is benchmarked."""
+        results = bench.bench_invoice(
+            os.path.join(
+                bench.FIXTURES_DIR,
+                "tiny_box_company",
+                "std_invoice.pdf",
+            ),
+            "Tiny Box Company",
+            repeat=1,
+        )
+        self.assertEqual(tuple(results), bench.STAGES)
+        for result in results.values():
+            self.assertEqual(set(result), {"mean", "p95", "peak_memory"})
+
+    def test_compare(self):
+        """Test that only stages slower than the baseline by more than the
+        threshold are reported.
+        """
+
+        def results(extraction: float, summary: float) -> dict:
+            return {
+                "invoices": {
+                    "a.pdf": {
+                        "stages": {
+                            "extraction": {"mean": extraction},
+                            "summary": {"mean": summary},
+                        }
+                    }
+                }
+            }
+
+        regressions = bench.compare(results(1.3, 1.1), results(1.0, 1.0), 20)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0][:2], ("a.pdf", "extraction"))
+        self.assertAlmostEqual(regressions[0][2], 30)
+        self.assertEqual(
+            bench.compare(results(1.0, 1.0), results(1.0, 1.0), 20),
+            [],
+        )
@@ -0,0 +1,150 @@
+"""Unittests for the `cache` module."""
+
+import unittest
+import io
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+from .. import cache, parse_for_supplier
+
+
+class TestFileHash(unittest.TestCase):
+    """Unittests for the `file_hash` function."""
+
+    def test_hash(self):
+        """Test that the hash of a file is the SHA-256 of its contents."""
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b"abc")
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(
+            cache.file_hash(f.name),
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad",
+        )
+
+    def test_hash_file_object(self):
+        """Test that a file object is hashed from its start."""
+        f = io.BytesIO(b"abc")
+        f.read()
+        self.assertEqual(
+            cache.file_hash(f),
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad",
+        )
+
+
+class TestExtractionCache(unittest.TestCase):
+    """Unittests for the `ExtractionCache` class."""
+
+    def setUp(self):
+        """Set up the unittest."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = cache.ExtractionCache(self.directory)
+
+    def test_key_depends_on_version(self):
+        """Test that the key changes with the version of the extractor."""
+        self.assertNotEqual(
+            self.cache.key("abc", "1"),
+            self.cache.key("abc", "2"),
+        )
+
+    def test_get_miss(self):
+        """Test that `get` returns `None` and counts a miss where there is no
+        entry.
+        """
+        self.assertIsNone(self.cache.get("abc"))
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_set_get(self):
+        """Test that an entry that has been set can be retrieved and counts
+        as a hit.
+        """
+        self.cache.set("abc", ["line 1", "line 2"])
+        self.assertEqual(self.cache.get("abc"), ["line 1", "line 2"])
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 0)
+
+    def test_persists(self):
+        """Test that entries are visible to other instances using the same
+        directory.
+        """
+        self.cache.set("abc", ["line 1"])
+        other = cache.ExtractionCache(self.directory)
+        self.assertEqual(other.get("abc"), ["line 1"])
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entries are evicted once the
+        cache exceeds its maximum size.
+        """
+        self.cache.set("aaa", ["a" * 100])
+        self.cache.set("bbb", ["b" * 100])
+        os.utime(self.cache._path("aaa"), (1, 1))
+        os.utime(self.cache._path("bbb"), (2, 2))
+        self.cache.get("aaa")
+
+        self.cache.max_size = 250
+        self.cache.set("ccc", ["c" * 100])
+
+        self.assertIsNotNone(self.cache.get("aaa"))
+        self.assertIsNone(self.cache.get("bbb"))
+        self.assertIsNotNone(self.cache.get("ccc"))
+        self.assertLessEqual(self.cache.stats()["size"], 250)
+
+    def test_clear(self):
+        """Test that `clear` removes every entry."""
+        self.cache.set("abc", ["line 1"])
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("abc"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_django_cache(self):
+        """Test that entries found in the Django cache are copied to disk."""
+        self.cache.django_cache_alias = "default"
+        self.cache.set("abc", ["line 1"])
+        os.remove(self.cache._path("abc"))
+
+        self.assertEqual(self.cache.get("abc"), ["line 1"])
+        self.assertTrue(os.path.exists(self.cache._path("abc")))
+
+
+class TestReadInvoiceCache(unittest.TestCase):
+    """Unittests for the use of the cache by `BaseSupplierParser`."""
+
+    def setUp(self):
+        """Set up the unittest."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = cache.ExtractionCache(directory)
+        patcher = patch.object(
+            cache,
+            "get_default_cache",
+            return_value=self.cache,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_read_is_cached(self):
+        """Test that reading the same file twice only extracts it once."""
+        filepath = "parser/tests/test_pdf.pdf"
+        parse_for_supplier.TinyBoxCompany(
+            filepath,
+            "Tiny Box Company",
+        ).invoice_data
+
+        with patch.object(
+            parse_for_supplier.BaseSupplierParser,
+            "_read_pages",
+            side_effect=AssertionError("The file was extracted again."),
+        ):
+            parser = parse_for_supplier.TinyBoxCompany(
+                filepath,
+                "Tiny Box Company",
+            )
+            self.assertEqual(
+                parser.invoice_data,
+                ["Page 1", "paragraph 1", "page 2", "paragraph 2"],
+            )
+
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
@@ -0,0 +1,45 @@
+"""Unittests for the `fingerprint` module."""
+
+import unittest
+from .. import fingerprint
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    """Unittests for the `FingerprintIndex` class."""
+
+    def setUp(self):
+        """Set up the unittest."""
+        self.index = fingerprint.FingerprintIndex()
+        self.index.add("Items Ordered", "Amazon")
+        self.index.add("SKU  Product Quantity", "Soak Rochford")
+
+    def test_len(self):
+        """Test the `__len__` method."""
+        self.assertEqual(len(self.index), 2)
+
+    def test_match_prefix(self):
+        """Test that a fingerprint matches the start of a line regardless of
+        the spacing between words.
+        """
+        self.assertEqual(
+            self.index.match(["Name", "Items  Ordered Price"]),
+            {"Amazon"},
+        )
+        self.assertEqual(
+            self.index.match(["SKU Product Quantity"]),
+            {"Soak Rochford"},
+        )
+
+    def test_no_match(self):
+        """Test that a fingerprint does not match the middle of a line."""
+        self.assertEqual(
+            self.index.match(["The Items Ordered", "Items"]),
+            set(),
+        )
+
+    def test_match_many(self):
+        """Test that every supplier matched is returned."""
+        self.assertEqual(
+            self.index.match(["Items Ordered", "SKU Product Quantity"]),
+            {"Amazon", "Soak Rochford"},
+        )
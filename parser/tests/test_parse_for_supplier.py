@@ -2,9 +2,12 @@
 
 import unittest
 from unittest.mock import patch
+import multiprocessing
 import os
+import pickle
+import tempfile
 from datetime import date
-from .. import parse_for_supplier
+from .. import backends, cache as extraction_cache, parse_for_supplier
 
 
 TEST_INVOICES_DIR = os.path.join(
@@ -143,12 +146,113 @@ class TestBaseSupplierParser(unittest.TestCase):
             ["Page 1", "paragraph 1", "page 2", "paragraph 2"],
         )
 
+    def test_read_invoice_has_enough_data(self):
+        """Test that the `read_invoice` method stops reading pages once
+        `has_enough_data` returns `True`.
+        """
+
+        class FirstPageSupplier(DummySupplier):
+            def has_enough_data(self, page_lines):
+                return True
+
+        parser = FirstPageSupplier(
+            False,
+            "parser/tests/test_pdf.pdf",
+            "Amazon",
+        )
+        self.assertEqual(parser.invoice_data, ["Page 1", "paragraph 1"])
+
+    def test_on_progress(self):
+        """Test that the parser reports each page as it is extracted and
+        that the invoice has been parsed.
+        """
+        reports = []
+        parser = DummySupplier(
+            False,
+            "parser/tests/test_pdf.pdf",
+            "Amazon",
+            on_progress=lambda stage, **details: reports.append(
+                (stage, details)
+            ),
+        )
+        parser.invoice_data = parser.read_invoice(use_cache=False)
+        parser.process_invoice()
+        self.assertEqual(
+            reports,
+            [
+                (parse_for_supplier.EXTRACTING, {"page": 1, "pages": 2}),
+                (parse_for_supplier.EXTRACTING, {"page": 2, "pages": 2}),
+                (parse_for_supplier.PARSED, {}),
+            ],
+        )
+
+    def test_on_progress_cache_hit(self):
+        """Test that nothing is extracted, nor reported as such, where the
+        lines are read from the extraction cache.
+        """
+        reports = []
+        parser = DummySupplier(
+            False,
+            "parser/tests/test_pdf.pdf",
+            "Amazon",
+            on_progress=lambda stage, **details: reports.append(stage),
+        )
+        with tempfile.TemporaryDirectory() as directory, patch.object(
+            extraction_cache,
+            "get_default_cache",
+            return_value=extraction_cache.ExtractionCache(directory),
+        ), patch.object(
+            backends.BorbBackend,
+            "iter_pages",
+            wraps=backends.BorbBackend().iter_pages,
+        ) as iter_pages:
+            parser.read_invoice()
+            reports.clear()
+            self.assertEqual(parser.read_invoice()[0], "Page 1")
+        iter_pages.assert_called_once()
+        self.assertEqual(reports, [])
+
+    def test_invoice_is_read_lazily(self):
+        """Test that the invoice is not read until its data is first accessed
+        and that it is only read once.
+        """
+        calls = []
+
+        def read_invoice():
+            calls.append(1)
+            return ["line 1", "line 2"]
+
+        parser = DummySupplier(False, "fp", "Amazon")
+        parser.read_invoice = read_invoice
+        str(parser)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(parser.invoice_data_str, "line 1\nline 2")
+        self.assertEqual(parser.invoice_data, ["line 1", "line 2"])
+        self.assertEqual(calls, [1])
+
+    def test_lines_injected(self):
+        """Test that lines passed to the parser are used instead of reading
+        the invoice.
+        """
+        parser = DummySupplier(False, "missing.pdf", "Amazon", lines=["a"])
+        self.assertEqual(parser.invoice_data, ["a"])
+        self.assertEqual(parser.invoice_data_str, "a")
+
+    def test_set_invoice_data(self):
+        """Test that setting `invoice_data` resets `invoice_data_str`."""
+        self.parser.invoice_data = ["a", "b"]
+        self.assertEqual(self.parser.invoice_data_str, "a\nb")
+        self.parser.invoice_data = ["c"]
+        self.assertEqual(self.parser.invoice_data_str, "c")
+
     def test_invalid_supplier(self):
         """Test the class raises a `ValueError` where the supplier is not
         supplied.
         """
+        parser = DummySupplier(False, "parser/tests/test_pdf.pdf", "Invalid")
         with self.assertRaises(ValueError):
-            DummySupplier(False, "parser/tests/test_pdf.pdf", "Invalid")
+            parser.invoice_data
 
     def test_metadata(self):
         """Test that the `_metadata` method returns a default dictionary when
@@ -160,6 +264,208 @@ class TestBaseSupplierParser(unittest.TestCase):
         )
 
 
+class TestDetectSupplier(unittest.TestCase):
+    """Unittests for detecting the supplier of an invoice."""
+
+    fixtures = [
+        ("soak_rochford", "std_invoice.pdf", "Soak Rochford"),
+        ("soak_rochford", "no_order_date.pdf", "Soak Rochford"),
+        ("tiny_box_company", "std_invoice.pdf", "Tiny Box Company"),
+        ("tiny_box_company", "bad_date.pdf", "Tiny Box Company"),
+    ]
+
+    def test_detect_supplier(self):
+        """Test that the supplier of each fixture is detected using either
+        backend.
+        """
+        for backend in ("borb", "pypdf"):
+            for directory, filename, supplier in self.fixtures:
+                with self.subTest(backend=backend, filename=filename), patch(
+                    "parser.parse_for_supplier.DETECTION_BACKEND",
+                    backend,
+                ):
+                    filepath = os.path.join(
+                        TEST_INVOICES_DIR,
+                        directory,
+                        filename,
+                    )
+                    self.assertEqual(
+                        parse_for_supplier.detect_supplier(filepath),
+                        supplier,
+                    )
+
+    def test_detect_supplier_unknown(self):
+        """Test that `None` is returned where no supplier matches."""
+        self.assertIsNone(
+            parse_for_supplier.detect_supplier("parser/tests/test_pdf.pdf")
+        )
+
+    def test_detect_supplier_ambiguous(self):
+        """Test that `None` is returned where more than one supplier
+        matches.
+        """
+        index = parse_for_supplier.FingerprintIndex()
+        index.add("Page 1", "Soak Rochford")
+        index.add("paragraph 1", "Tiny Box Company")
+        with patch.object(parse_for_supplier, "FINGERPRINT_INDEX", index):
+            self.assertIsNone(
+                parse_for_supplier.detect_supplier("parser/tests/test_pdf.pdf")
+            )
+
+    def test_parse_detect(self):
+        """Test that `parse` uses the detected supplier over the one given."""
+        filepath = os.path.join(
+            TEST_INVOICES_DIR,
+            "soak_rochford",
+            "std_invoice.pdf",
+        )
+        parser = parse_for_supplier.parse(
+            filepath,
+            "Tiny Box Company",
+            detect=True,
+        )
+        self.assertIsInstance(parser, parse_for_supplier.SoakRochford)
+
+    def test_parse_detect_fallback(self):
+        """Test that `parse` falls back to the supplier given where it cannot
+        be detected.
+        """
+        parser = parse_for_supplier.parse(
+            "parser/tests/test_pdf.pdf",
+            "Tiny Box Company",
+            detect=True,
+        )
+        self.assertIsInstance(parser, parse_for_supplier.TinyBoxCompany)
+
+    def test_parse_file_object(self):
+        """Test that `parse` accepts a file object in place of a path, even
+        one which has already been read from.
+        """
+        filepath = os.path.join(
+            TEST_INVOICES_DIR,
+            "soak_rochford",
+            "std_invoice.pdf",
+        )
+        expected = parse_for_supplier.parse(filepath, None)
+        expected.process_invoice()
+        with open(filepath, "rb") as f:
+            f.read()
+            parser = parse_for_supplier.parse(f, None)
+            parser.process_invoice()
+        self.assertIsInstance(parser, parse_for_supplier.SoakRochford)
+        self.assertEqual(parser.order_number, expected.order_number)
+        self.assertEqual(parser.items_breakdown, expected.items_breakdown)
+        self.assertIsNone(parser.result().filepath)
+
+    def test_parser_version(self):
+        """Test that the version of each supplier's parser is returned, and
+        recorded on its results.
+        """
+        self.assertEqual(
+            parse_for_supplier.parser_version("Soak Rochford"),
+            parse_for_supplier.SoakRochford.version,
+        )
+        self.assertIsNone(parse_for_supplier.parser_version("Amazon"))
+        parser = parse_for_supplier.parse(
+            "parser/tests/test_pdf.pdf",
+            "Tiny Box Company",
+        )
+        self.assertEqual(
+            parser.result().parser_version,
+            parse_for_supplier.TinyBoxCompany.version,
+        )
+
+    def test_parse_undetectable(self):
+        """Test that `parse` raises a `ValueError` where no supplier is given
+        and it cannot be detected.
+        """
+        with self.assertRaises(ValueError):
+            parse_for_supplier.parse("parser/tests/test_pdf.pdf", None)
+
+
+class TestParseMany(unittest.TestCase):
+    """Unittests for the `parse_many` function."""
+
+    invoices = [
+        (
+            os.path.join(
+                TEST_INVOICES_DIR,
+                "soak_rochford",
+                "std_invoice.pdf",
+            ),
+            "Soak Rochford",
+        ),
+        (
+            os.path.join(TEST_INVOICES_DIR, "tiny_box_company", "none.pdf"),
+            "Tiny Box Company",
+        ),
+        (
+            os.path.join(
+                TEST_INVOICES_DIR,
+                "tiny_box_company",
+                "std_invoice.pdf",
+            ),
+            "Tiny Box Company",
+        ),
+    ]
+
+    def test_ordered(self):
+        """Test that results are yielded in order and that a failure does not
+        abort the batch.
+        """
+        stats = parse_for_supplier.BatchStats()
+        results = list(
+            parse_for_supplier.parse_many(
+                self.invoices,
+                max_workers=2,
+                ordered=True,
+                stats=stats,
+            )
+        )
+
+        self.assertEqual(
+            [result.filepath for result in results],
+            [filepath for filepath, _ in self.invoices],
+        )
+        self.assertTrue(results[0].ok)
+        self.assertEqual(len(results[0].items_breakdown), 28)
+        self.assertIsInstance(results[1].error, FileNotFoundError)
+        self.assertEqual(results[2].order_number, "123456")
+        self.assertEqual(results[2].total, 56.39)
+
+        self.assertEqual(stats.parsed, 2)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.total, 3)
+        self.assertGreater(stats.files_per_second, 0)
+
+    def test_unordered(self):
+        """Test that every invoice has a result when results are yielded as
+        they complete.
+        """
+        results = parse_for_supplier.parse_many(self.invoices, max_workers=2)
+        self.assertCountEqual(
+            [result.filepath for result in results],
+            [filepath for filepath, _ in self.invoices],
+        )
+
+    def test_spawn(self):
+        """Test that the processes may be spawned rather than forked."""
+        results = parse_for_supplier.parse_many(
+            self.invoices[:1],
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.assertTrue(next(results).ok)
+
+    def test_result_is_picklable(self):
+        """Test that the result of a parser can be pickled."""
+        parser = TestTinyBoxCompany.parser_instance("std_invoice.pdf")
+        parser.process_invoice()
+        result = pickle.loads(pickle.dumps(parser.result()))
+        self.assertEqual(result, parser.result())
+        self.assertEqual(result.summary(), parser.summary())
+
+
 class TestSoakRochford(unittest.TestCase):
     """Tests for the `SoakRochford` class."""
 
@@ -196,6 +502,15 @@ class TestSoakRochford(unittest.TestCase):
         with self.assertRaises(StopIteration):
             self.parser._items_breakdown()
 
+    def test_summary(self):
+        """Test the `_summary` method."""
+        self.parser._summary()
+        self.assertEqual(self.parser.subtotal, "209.40")
+        self.assertIsNone(self.parser.delivery)
+        self.assertEqual(self.parser.promotion, "34.27")
+        self.assertEqual(self.parser.vat, "35.03")
+        self.assertEqual(self.parser.total, "210.16")
+
     def test_order_date(self):
         """Test the `_order_date` method. It is expected to return the order
         date.
@@ -14,3 +14,54 @@ class TestParser(unittest.TestCase):
             result,
             ["Page 1", "paragraph 1", "page 2", "paragraph 2"],
         )
+
+
+class TestIterPages(unittest.TestCase):
+    """Unittests for the `iter_pages` function."""
+
+    def test_yields_pages(self):
+        """Test that the text of each page is yielded separately."""
+        self.assertEqual(
+            list(pdf.iter_pages("parser/tests/test_pdf.pdf")),
+            ["Page 1\nparagraph 1", "page 2\nparagraph 2"],
+        )
+
+    def test_page_count(self):
+        """Test that each page carries the number of pages in the
+        document.
+        """
+        self.assertEqual(
+            [
+                page.page_count
+                for page in pdf.iter_pages("parser/tests/test_pdf.pdf")
+            ],
+            [2, 2],
+        )
+
+    def test_close_early(self):
+        """Test that the generator can be closed before the remaining pages
+        have been read.
+        """
+        pages = pdf.iter_pages("parser/tests/test_pdf.pdf")
+        self.assertEqual(next(pages), "Page 1\nparagraph 1")
+        pages.close()
+        with self.assertRaises(StopIteration):
+            next(pages)
+
+    def test_missing_file(self):
+        """Test that errors raised while extracting are raised to the
+        consumer.
+        """
+        with self.assertRaises(FileNotFoundError):
+            list(pdf.iter_pages("parser/tests/missing.pdf"))
+
+
+class TestIterLines(unittest.TestCase):
+    """Unittests for the `iter_lines` function."""
+
+    def test_yields_lines(self):
+        """Test that the lines of each page are yielded in order."""
+        self.assertEqual(
+            list(pdf.iter_lines("parser/tests/test_pdf.pdf")),
+            ["Page 1", "paragraph 1", "page 2", "paragraph 2"],
+        )
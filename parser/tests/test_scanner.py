@@ -0,0 +1,46 @@
+"""Unittests for the `scanner` module."""
+
+import unittest
+from .. import scanner
+
+
+class TestSummaryScanner(unittest.TestCase):
+    """Unittests for the `SummaryScanner` class."""
+
+    def setUp(self):
+        """Set up the unittest."""
+        self.scanner = scanner.SummaryScanner(
+            {
+                "subtotal": r"Subtotal £(\d{1,}\.\d{2})",
+                "total": r"Total £(\d{1,}\.\d{2})",
+                "vat": r"VAT £(\d{1,}\.\d{2})",
+            }
+        )
+
+    def test_scan(self):
+        """Test that the first match of each field is found and that fields
+        which cannot be found are omitted.
+        """
+        self.assertEqual(
+            self.scanner.scan(
+                "Subtotal £10.00\nTotal £12.00\nTotal £99.99\nVAT none"
+            ),
+            {"subtotal": "10.00", "total": "12.00"},
+        )
+
+    def test_cast(self):
+        """Test that values are converted using `cast`."""
+        float_scanner = scanner.SummaryScanner(
+            {"total": r"Total £(\d{1,}\.\d{2})"},
+            cast=float,
+        )
+        self.assertEqual(float_scanner.scan("Total £1.50"), {"total": 1.5})
+
+    def test_pattern_without_group(self):
+        """Test that a `ValueError` is raised where a pattern does not have
+        exactly one capturing group.
+        """
+        with self.assertRaises(ValueError):
+            scanner.SummaryScanner({"total": r"Total £\d{1,}\.\d{2}"})
+        with self.assertRaises(ValueError):
+            scanner.SummaryScanner({"total": r"(Total £(\d{1,}\.\d{2}))"})
@@ -0,0 +1,353 @@
+"""An in-process cache used to resolve the products named on invoices.
+
+The same few hundred products recur on every invoice from a supplier, so
+rather than looking each one up, all of a supplier's products are loaded the
+first time one of them is needed. Entries map a supplier and a normalised
+product name to the product's id and default category.
+
+Whenever a product is saved or deleted, the cache of its supplier is dropped
+in this process and a notification is sent on a Postgres `LISTEN/NOTIFY`
+channel so that every other process using the cache drops it too. As the
+cache holds the default category of each product, the whole cache is dropped
+in the same way whenever a category is saved or deleted. Changes made
+without sending signals, e.g: `QuerySet.update`, must be followed by a call
+to `invalidate_supplier` or `invalidate_all`.
+"""
+
+import typing as _t
+import logging
+import select
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_CHANNEL = "product_cache"
+# The notification sent to drop the cache of every supplier.
+ALL_SUPPLIERS = "*"
+# How long the listener waits for a notification before checking that it
+# should still be running, and how long it waits before reconnecting after
+# losing its connection.
+LISTEN_TIMEOUT = 5
+RECONNECT_DELAY = 5
+
+
+class ProductRef(_t.NamedTuple):
+    """What the cache holds for a product."""
+
+    id: int
+    default_category_id: _t.Optional[int]
+
+
+def normalise(name: str) -> str:
+    """Returns the key a product name is cached under. Names which normalise
+    to the same key share a slug, and no two of a supplier's products may
+    share a slug.
+
+    :param name: The name of the product.
+    :type name: str
+    :return: The normalised name.
+    :rtype: str
+    """
+    return slugify(name)
+
+
+class ProductCache:
+    """Maps a supplier and a normalised product name to the product.
+
+    The cache holds up to `max_size` products. Once full, the suppliers used
+    least recently are evicted, a whole supplier at a time.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        """Initialises a new instance of the ProductCache class.
+
+        :param max_size: The maximum number of products to hold. A size of 0
+            disables the cache.
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._suppliers: _t.Dict[int, _t.Dict[str, ProductRef]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, supplier_id: int) -> bool:
+        return supplier_id in self._suppliers
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache holds anything."""
+        return self.max_size > 0
+
+    def get_many(
+        self,
+        supplier_id: int,
+        names: _t.Iterable[str],
+    ) -> _t.Dict[str, ProductRef]:
+        """Returns the product of each name which the supplier has. Loads
+        every product of the supplier if they are not already cached.
+
+        :param supplier_id: The id of the supplier.
+        :type supplier_id: int
+        :param names: The names of the products.
+        :type names: Iterable[str]
+        :return: A mapping of each name with a product to the product.
+        :rtype: Dict[str, ProductRef]
+        """
+        products = self._supplier(supplier_id)
+        found = {}
+        misses = 0
+        for name in names:
+            product = products.get(normalise(name))
+            if product is None:
+                misses += 1
+            else:
+                found[name] = product
+        with self._lock:
+            self.hits += len(found)
+            self.misses += misses
+        return found
+
+    def add(self, supplier_id: int, products: _t.Iterable[_t.Any]):
+        """Adds products which were created without sending signals, e.g: by
+        `bulk_create`, to the supplier's cache if it is loaded.
+
+        :param supplier_id: The id of the supplier.
+        :type supplier_id: int
+        :param products: The `Product` instances.
+        :type products: Iterable[Product]
+        """
+        with self._lock:
+            cached = self._suppliers.get(supplier_id)
+            if cached is None:
+                return
+            size = len(cached)
+            for product in products:
+                self._add_product(cached, product)
+            self._size += len(cached) - size
+
+    def invalidate(self, supplier_id: _t.Optional[int] = None):
+        """Drops the cache of a supplier, or of every supplier.
+
+        :param supplier_id: The id of the supplier, defaults to every
+            supplier.
+        :type supplier_id: int, optional
+        """
+        with self._lock:
+            if supplier_id is None:
+                self._suppliers.clear()
+                self._size = 0
+                return
+            products = self._suppliers.pop(supplier_id, None)
+            if products is not None:
+                self._size -= len(products)
+
+    def _supplier(self, supplier_id: int) -> _t.Dict[str, ProductRef]:
+        """Returns the cache of a supplier, loading it if necessary."""
+        with self._lock:
+            products = self._suppliers.get(supplier_id)
+            if products is not None:
+                self._suppliers.move_to_end(supplier_id)
+                return products
+
+        from .models import Product
+
+        if self.enabled:
+            ensure_listening()
+        products = {}
+        for product in Product.objects.filter(supplier_id=supplier_id).only(
+            "id", "name", "slug", "default_category_id"
+        ):
+            self._add_product(products, product)
+        if not self.enabled:
+            return products
+
+        with self._lock:
+            previous = self._suppliers.pop(supplier_id, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._suppliers[supplier_id] = products
+            self._size += len(products)
+            while self._size > self.max_size and len(self._suppliers) > 1:
+                _, evicted = self._suppliers.popitem(last=False)
+                self._size -= len(evicted)
+        return products
+
+    @staticmethod
+    def _add_product(products: _t.Dict[str, ProductRef], product: _t.Any):
+        """Adds a product under its slug and its normalised name, which
+        differ where the slug was edited.
+        """
+        ref = ProductRef(product.id, product.default_category_id)
+        products.setdefault(normalise(product.name), ref)
+        products[product.slug] = ref
+
+
+_product_cache: _t.Optional[ProductCache] = None
+_product_cache_lock = threading.Lock()
+
+
+def get_product_cache() -> ProductCache:
+    """Returns the cache shared by this process, which is created with the
+    `PRODUCT_CACHE_MAX_SIZE` setting the first time it is needed, and again
+    whenever the setting changes, e.g: in tests.
+
+    :return: The cache.
+    :rtype: ProductCache
+    """
+    global _product_cache
+    with _product_cache_lock:
+        if _product_cache is None:
+            _product_cache = ProductCache(
+                getattr(settings, "PRODUCT_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE)
+            )
+        return _product_cache
+
+
+@receiver(setting_changed)
+def _on_setting_changed(setting: str, **kwargs):
+    """Drops the cache when its size is changed."""
+    global _product_cache
+    if setting == "PRODUCT_CACHE_MAX_SIZE":
+        with _product_cache_lock:
+            _product_cache = None
+
+
+def channel() -> str:
+    """Returns the name of the `LISTEN/NOTIFY` channel."""
+    return getattr(settings, "PRODUCT_CACHE_CHANNEL", DEFAULT_CHANNEL)
+
+
+def _invalidate(supplier_id: _t.Optional[int]):
+    """Drops the cache of a supplier, or of every supplier, in every
+    process.
+    """
+    get_product_cache().invalidate(supplier_id)
+    # Another thread may load the cache again before the change is
+    # committed, in which case it loads the old rows.
+    transaction.on_commit(lambda: get_product_cache().invalidate(supplier_id))
+    if connection.vendor == "postgresql":
+        # Notifications are delivered when the transaction commits.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                [
+                    channel(),
+                    ALL_SUPPLIERS if supplier_id is None else str(supplier_id),
+                ],
+            )
+
+
+def invalidate_supplier(supplier_id: int):
+    """Drops the cache of a supplier in every process. Other processes are
+    only notified once the current transaction, if any, commits.
+
+    :param supplier_id: The id of the supplier.
+    :type supplier_id: int
+    """
+    _invalidate(supplier_id)
+
+
+def invalidate_all():
+    """Drops the cache of every supplier in every process. Other processes
+    are only notified once the current transaction, if any, commits.
+    """
+    _invalidate(None)
+
+
+class Listener(threading.Thread):
+    """Listens for notifications from other processes on a dedicated
+    connection, dropping the cache of each supplier notified of, or of every
+    supplier.
+    """
+
+    def __init__(self, cache: _t.Optional[ProductCache] = None):
+        """Initialises a new instance of the Listener class.
+
+        :param cache: The cache to invalidate, defaults to that of
+            `get_product_cache`, whichever it is when notified.
+        :type cache: ProductCache, optional
+        """
+        super().__init__(name="product-cache-listener", daemon=True)
+        self._cache = cache
+        self.stopped = threading.Event()
+
+    @property
+    def cache(self) -> ProductCache:
+        """The cache to invalidate."""
+        return self._cache if self._cache is not None else get_product_cache()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Lost the product cache connection.")
+                # Notifications sent whilst disconnected have been missed.
+                self.cache.invalidate()
+                self.stopped.wait(RECONNECT_DELAY)
+
+    def listen(self):
+        """Listens until stopped or the connection is lost."""
+        conn = connection.get_new_connection(
+            connection.get_connection_params()
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{channel()}"')
+            # Anything cached before listening may have missed a change.
+            self.cache.invalidate()
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([conn], [], [], LISTEN_TIMEOUT)
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def handle(self, payload: str):
+        """Drops the cache of the supplier in a notification.
+
+        :param payload: The id of the supplier, or `ALL_SUPPLIERS`.
+        :type payload: str
+        """
+        if payload == ALL_SUPPLIERS:
+            self.cache.invalidate()
+            return
+        try:
+            supplier_id = int(payload)
+        except ValueError:
+            logger.warning("Invalid product cache notification %r.", payload)
+            return
+        self.cache.invalidate(supplier_id)
+
+
+_listener: _t.Optional[Listener] = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listening():
+    """Starts listening for notifications from other processes, unless
+    already listening or the database is not Postgres.
+    """
+    global _listener
+    if connection.vendor != "postgresql":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = Listener()
+            _listener.start()
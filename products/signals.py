@@ -0,0 +1,34 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from suppliers.models import Supplier
+from .cache import invalidate_all, invalidate_supplier
+from .models import Product, ProductCategory
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def on_product_change(sender, instance: Product, **kwargs):
+    """When a product is changed, drop the cached products of its supplier
+    in every process.
+    """
+    invalidate_supplier(instance.supplier_id)
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def on_supplier_change(sender, instance: Supplier, **kwargs):
+    """When a supplier is created or deleted, drop anything cached under its
+    id, which may have belonged to a supplier whose creation was rolled back.
+    """
+    if kwargs.get("created", True):
+        invalidate_supplier(instance.id)
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def on_category_change(sender, instance: ProductCategory, **kwargs):
+    """When a category is changed, drop the cached products of every
+    supplier in every process, as they hold the products' default
+    categories, which are cleared without signals when one is deleted.
+    """
+    invalidate_all()
@@ -0,0 +1,259 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from model_bakery import baker
+from invoices import models as invoice_models
+from suppliers import models as supplier_models
+from .. import cache, models as product_models
+
+
+class TestProductCache(TestCase):
+    """Test the `ProductCache` class."""
+
+    def setUp(self):
+        """Set up the test."""
+        self.cache = cache.ProductCache()
+        self.supplier = baker.make(supplier_models.Supplier)
+        self.category = baker.make(product_models.ProductCategory)
+        self.product = baker.make(
+            product_models.Product,
+            name="Test Product",
+            supplier=self.supplier,
+            default_category=self.category,
+        )
+
+    def test_get_many(self):
+        """Test that products are found by their normalised name and that
+        the supplier's products are only loaded once.
+        """
+        with self.assertNumQueries(1):
+            self.cache.get_many(self.supplier.id, ["test product"])
+        with self.assertNumQueries(0):
+            products = self.cache.get_many(
+                self.supplier.id,
+                ["Test Product", "TEST PRODUCT!", "Other Product"],
+            )
+        ref = cache.ProductRef(self.product.id, self.category.id)
+        self.assertEqual(
+            products,
+            {"Test Product": ref, "TEST PRODUCT!": ref},
+        )
+        self.assertEqual(self.cache.hits, 3)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_many_edited_slug(self):
+        """Test that a product whose slug was edited is found by its slug and
+        by its name.
+        """
+        product = baker.make(
+            product_models.Product,
+            name="Widget",
+            slug="blue-widget",
+            supplier=self.supplier,
+        )
+        products = self.cache.get_many(
+            self.supplier.id,
+            ["Widget", "Blue Widget"],
+        )
+        self.assertEqual(products["Widget"].id, product.id)
+        self.assertEqual(products["Blue Widget"].id, product.id)
+
+    def test_add(self):
+        """Test that products are added to a loaded supplier."""
+        self.cache.get_many(self.supplier.id, [])
+        product = product_models.Product(
+            id=self.product.id + 1,
+            name="New Product",
+            slug="new-product",
+            supplier=self.supplier,
+        )
+        self.cache.add(self.supplier.id, [product])
+        self.assertEqual(
+            self.cache.get_many(self.supplier.id, ["New Product"]),
+            {"New Product": cache.ProductRef(product.id, None)},
+        )
+        self.assertEqual(len(self.cache), 3)
+
+    def test_add_not_loaded(self):
+        """Test that nothing is added for a supplier which is not loaded."""
+        self.cache.add(self.supplier.id, [self.product])
+        self.assertNotIn(self.supplier.id, self.cache)
+
+    def test_invalidate(self):
+        """Test that a supplier's products are loaded again once the supplier
+        is invalidated.
+        """
+        other_supplier = baker.make(supplier_models.Supplier)
+        self.cache.get_many(self.supplier.id, [])
+        self.cache.get_many(other_supplier.id, [])
+
+        self.cache.invalidate(self.supplier.id)
+        self.assertNotIn(self.supplier.id, self.cache)
+        self.assertIn(other_supplier.id, self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+        self.cache.get_many(self.supplier.id, [])
+        self.cache.invalidate()
+        self.assertNotIn(self.supplier.id, self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):
+        """Test that the least recently used suppliers are evicted once the
+        cache is full.
+        """
+        suppliers = baker.make(supplier_models.Supplier, _quantity=3)
+        for supplier in suppliers:
+            baker.make(product_models.Product, supplier=supplier)
+        product_cache = cache.ProductCache(max_size=4)
+
+        product_cache.get_many(suppliers[0].id, [])
+        product_cache.get_many(suppliers[1].id, [])
+        product_cache.get_many(suppliers[0].id, [])
+        product_cache.get_many(suppliers[2].id, [])
+
+        self.assertIn(suppliers[0].id, product_cache)
+        self.assertNotIn(suppliers[1].id, product_cache)
+        self.assertIn(suppliers[2].id, product_cache)
+        self.assertLessEqual(len(product_cache), 4)
+
+    def test_disabled(self):
+        """Test that nothing is cached where the size is 0."""
+        product_cache = cache.ProductCache(max_size=0)
+        product_cache.get_many(self.supplier.id, ["Test Product"])
+        self.assertNotIn(self.supplier.id, product_cache)
+        with self.assertNumQueries(1):
+            product_cache.get_many(self.supplier.id, ["Test Product"])
+
+
+class TestGetProductCache(TestCase):
+    """Test the `get_product_cache` function."""
+
+    def test_shared(self):
+        """Test that the same cache is returned each time."""
+        self.assertIs(cache.get_product_cache(), cache.get_product_cache())
+
+    def test_override_settings(self):
+        """Test that the cache is built again when its size is changed."""
+        with override_settings(PRODUCT_CACHE_MAX_SIZE=4):
+            self.assertEqual(cache.get_product_cache().max_size, 4)
+        self.assertNotEqual(cache.get_product_cache().max_size, 4)
+
+
+class TestInvalidation(TestCase):
+    """Test that the cache is invalidated when products change."""
+
+    def setUp(self):
+        """Set up the test."""
+        self.product = baker.make(product_models.Product)
+        cache.get_product_cache().get_many(self.product.supplier_id, [])
+
+    def tearDown(self):
+        """Tear down the test."""
+        cache.get_product_cache().invalidate()
+
+    def test_save(self):
+        """Test that saving a product invalidates its supplier."""
+        category = baker.make(product_models.ProductCategory)
+        cache.get_product_cache().get_many(self.product.supplier_id, [])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.product.default_category = category
+            self.product.save()
+            self.assertNotIn(
+                self.product.supplier_id, cache.get_product_cache()
+            )
+            # Loaded again before the change is committed.
+            cache.get_product_cache().get_many(self.product.supplier_id, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotIn(self.product.supplier_id, cache.get_product_cache())
+
+    def test_delete(self):
+        """Test that deleting a product invalidates its supplier."""
+        self.product.delete()
+        self.assertNotIn(self.product.supplier_id, cache.get_product_cache())
+
+    def test_new_supplier(self):
+        """Test that creating a supplier drops anything cached under its id."""
+        with patch.object(
+            cache.get_product_cache(), "invalidate"
+        ) as invalidate:
+            supplier = baker.make(supplier_models.Supplier)
+        invalidate.assert_called_with(supplier.id)
+
+    def test_category_delete(self):
+        """Test that deleting a category invalidates every supplier, so that
+        an invoice ingested afterwards is not given the deleted category.
+        """
+        category = baker.make(product_models.ProductCategory)
+        product = baker.make(product_models.Product, default_category=category)
+        invoice = baker.make(
+            invoice_models.Invoice,
+            supplier=product.supplier,
+        )
+        cache.get_product_cache().get_many(product.supplier_id, [])
+
+        category.delete()
+        self.assertEqual(len(cache.get_product_cache()), 0)
+        (item,) = invoice.add_from_items_breakdown(
+            {product.name: {"quantity": 1, "price_ex_vat": 1}}
+        )
+        self.assertEqual(item.product_id, product.id)
+        self.assertIsNone(item.category_id)
+
+    def test_notify_postgres(self):
+        """Test that other processes are notified through Postgres."""
+        with patch.object(
+            cache.connection, "vendor", "postgresql"
+        ), patch.object(cache.connection, "cursor") as cursor:
+            cache.invalidate_supplier(self.product.supplier_id)
+        cursor.return_value.__enter__.return_value.execute.assert_called_with(
+            "SELECT pg_notify(%s, %s)",
+            [cache.DEFAULT_CHANNEL, str(self.product.supplier_id)],
+        )
+
+    def test_notify_all_postgres(self):
+        """Test that other processes are notified to invalidate every
+        supplier through Postgres.
+        """
+        with patch.object(
+            cache.connection, "vendor", "postgresql"
+        ), patch.object(cache.connection, "cursor") as cursor:
+            cache.invalidate_all()
+        cursor.return_value.__enter__.return_value.execute.assert_called_with(
+            "SELECT pg_notify(%s, %s)",
+            [cache.DEFAULT_CHANNEL, cache.ALL_SUPPLIERS],
+        )
+
+
+class TestListener(TestCase):
+    """Test the `Listener` class."""
+
+    def test_handle(self):
+        """Test that a notification invalidates the supplier in it."""
+        product_cache = cache.ProductCache()
+        listener = cache.Listener(product_cache)
+        with patch.object(product_cache, "invalidate") as invalidate:
+            listener.handle("12")
+            invalidate.assert_called_once_with(12)
+
+    def test_handle_all(self):
+        """Test that a notification may invalidate every supplier."""
+        product_cache = cache.ProductCache()
+        listener = cache.Listener(product_cache)
+        with patch.object(product_cache, "invalidate") as invalidate:
+            listener.handle(cache.ALL_SUPPLIERS)
+            invalidate.assert_called_once_with()
+
+    def test_handle_invalid(self):
+        """Test that an invalid notification is ignored."""
+        product_cache = cache.ProductCache()
+        listener = cache.Listener(product_cache)
+        with patch.object(
+            product_cache, "invalidate"
+        ) as invalidate, self.assertLogs(cache.logger, "WARNING"):
+            listener.handle("not a supplier")
+        invalidate.assert_not_called()
+
+    def test_ensure_listening_not_postgres(self):
+        """Test that nothing listens where the database is not Postgres."""
+        with patch.object(cache, "Listener") as listener:
+            cache.ensure_listening()
+        listener.assert_not_called()